@@ -0,0 +1,243 @@
+"""
+Per-worker memory and throughput of backend-ml with N uvicorn workers,
+each loading its own model vs. one shared inference server.
+
+    python benchmarks/bench_multiworker.py                        # 1,2,4,8 workers, both modes
+    python benchmarks/bench_multiworker.py --workers 4 --modes shared --duration 30
+
+Modes:
+
+    per-worker  uvicorn main:app --workers N (every worker loads the model)
+    shared      code_a_thon/inference_server.py --http-workers N (one model,
+                workers send tensors through shared memory)
+
+For each run it drives POST /custom-model/predict with --concurrency
+requests in flight (images from datasets/valid) and reports throughput,
+latency, and RSS / PSS per process (PSS splits shared pages, such as
+the rings, fairly between the processes mapping them). Prints one JSON
+object. Needs the model file (and TensorFlow for the keras backend).
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CODE_DIR = os.path.join(ROOT, "code_a_thon")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))] if values else None
+
+
+# --- PROCESS MEMORY ---
+def _children():
+    tree = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            tree.setdefault(ppid, []).append(int(entry))
+    return tree
+
+
+def descendants(pid, tree):
+    out, stack = [pid], [pid]
+    while stack:
+        for child in tree.get(stack.pop(), []):
+            out.append(child)
+            stack.append(child)
+    return out
+
+
+def memory(pid):
+    """{rss_mb, peak_rss_mb, pss_mb} from /proc."""
+    info = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "VmHWM"):
+                info[key] = int(value.split()[0]) / 1024
+    pss = None
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    pss = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return {"rss_mb": round(info.get("VmRSS", 0), 1), "peak_rss_mb": round(info.get("VmHWM", 0), 1),
+            "pss_mb": round(pss, 1) if pss is not None else None}
+
+
+def _cmdline(pid):
+    with open(f"/proc/{pid}/cmdline", "rb") as f:
+        return f.read().replace(b"\0", b" ").decode(errors="replace")
+
+
+def role(pid, tree):
+    cmd = _cmdline(pid)
+    if "resource_tracker" in cmd:
+        return "helper"  # multiprocessing's shared-memory bookkeeping
+    if "inference_server.py" in cmd:
+        return "inference"
+    if "multiprocessing" in cmd:
+        return "http"  # uvicorn's worker processes
+    # uvicorn with --workers 1 serves from its own process
+    workers = [c for c in tree.get(pid, []) if "resource_tracker" not in _cmdline(c)]
+    return "supervisor" if workers else "http"
+
+
+def process_report(launcher):
+    procs, tree = [], _children()
+    for pid in descendants(launcher, tree):
+        try:
+            procs.append({"pid": pid, "role": role(pid, tree), **memory(pid)})
+        except OSError:
+            continue
+    http = [p for p in procs if p["role"] == "http"]
+    return {
+        "processes": procs,
+        "total_rss_mb": round(sum(p["rss_mb"] for p in procs), 1),
+        "total_pss_mb": round(sum(p["pss_mb"] or 0 for p in procs), 1),
+        "mean_http_worker_rss_mb": round(sum(p["rss_mb"] for p in http) / len(http), 1) if http else None,
+        "mean_http_worker_pss_mb": round(sum(p["pss_mb"] or 0 for p in http) / len(http), 1) if http else None,
+    }
+
+
+# --- LOAD ---
+async def drive(url, images, concurrency, duration):
+    latencies, errors = [], 0
+    stop = time.perf_counter() + duration
+
+    async def user(client, offset):
+        nonlocal errors
+        i = offset
+        while time.perf_counter() < stop:
+            data = images[i % len(images)]
+            i += concurrency
+            start = time.perf_counter()
+            try:
+                r = await client.post(f"{url}/custom-model/predict", files={"file": ("fish.jpg", data, "image/jpeg")})
+                ok = r.status_code == 200 and r.json().get("status") == "success"
+            except (httpx.HTTPError, ValueError):
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            errors += not ok
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(timeout=60, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(user(client, i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1) if latencies else None,
+    }
+
+
+def wait_ready(url, proc, image, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with {proc.returncode}")
+        try:
+            r = httpx.post(f"{url}/custom-model/predict", files={"file": ("fish.jpg", image, "image/jpeg")}, timeout=10)
+            if r.status_code == 200 and r.json().get("status") == "success":
+                return
+        except (httpx.HTTPError, ValueError):
+            pass
+        time.sleep(1)
+    raise RuntimeError("server did not become ready")
+
+
+def run(mode, workers, images, args):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, GALLERY_ENABLED="false", CUSTOM_MODEL_CACHE_SIZE="0")
+    if mode == "shared":
+        sock = os.path.join(tempfile.mkdtemp(prefix="fish-bench-"), "inference.sock")
+        cmd = [sys.executable, os.path.join(CODE_DIR, "inference_server.py"), "--socket", sock,
+               "--http-workers", str(workers), "--host", "127.0.0.1", "--port", str(port)]
+        if args.server_threads:
+            cmd += ["--threads", str(args.server_threads)]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(workers)]
+    log = open(os.path.join(tempfile.gettempdir(), f"bench-multiworker-{mode}-{workers}.log"), "w")
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    print(f"🔄 {mode} x{workers} (log {log.name})", file=sys.stderr)
+    try:
+        wait_ready(url, proc, images[0], args.startup_timeout)
+        # Every worker has to have loaded/connected before memory means anything
+        asyncio.run(drive(url, images, args.concurrency, args.warmup))
+        load = asyncio.run(drive(url, images, args.concurrency, args.duration))
+        return {"mode": mode, "http_workers": workers, **load, **process_report(proc.pid)}
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        log.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4,8", help="HTTP worker counts to try")
+    parser.add_argument("--modes", default="per-worker,shared")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--warmup", type=float, default=5.0)
+    parser.add_argument("--server-threads", type=int, default=0, help="--threads for the inference server")
+    parser.add_argument("--startup-timeout", type=float, default=180.0)
+    parser.add_argument("--limit", type=int, default=200, help="Distinct images to send")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(CODE_DIR, "datasets", "valid", "*", "*.jpg")))[:args.limit]
+    if not paths:
+        raise SystemExit("❌ No images under code_a_thon/datasets/valid")
+    images = [open(p, "rb").read() for p in paths]
+
+    results = []
+    for mode in args.modes.split(","):
+        for workers in (int(w) for w in args.workers.split(",")):
+            try:
+                results.append(run(mode, workers, images, args))
+            except RuntimeError as e:
+                print(f"❌ {mode} x{workers}: {e}", file=sys.stderr)
+                results.append({"mode": mode, "http_workers": workers, "error": str(e)})
+
+    summary = [
+        {k: r.get(k) for k in ("mode", "http_workers", "throughput_rps", "p95_ms", "total_rss_mb", "total_pss_mb",
+                               "mean_http_worker_rss_mb", "mean_http_worker_pss_mb", "error") if k in r}
+        for r in results
+    ]
+    print(json.dumps({"concurrency": args.concurrency, "duration": args.duration,
+                      "summary": summary, "runs": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
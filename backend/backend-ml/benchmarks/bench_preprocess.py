@@ -0,0 +1,117 @@
+"""
+Compare the old per-request preprocessing with code_a_thon/preprocess.py.
+
+    python benchmarks/bench_preprocess.py                    # images in datasets/
+    python benchmarks/bench_preprocess.py --phone-size 4032  # upscaled copies, like phone photos
+
+Each path runs in its own subprocess so peak RSS is measured separately.
+Prints one JSON object per path.
+"""
+import argparse
+import glob
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CODE_DIR = os.path.join(ROOT, "code_a_thon")
+sys.path.append(CODE_DIR)
+
+BATCH_SIZE = 16
+
+
+def legacy_batch(paths):
+    # The path test_single_image.py used before preprocess.py
+    arrays = []
+    for path in paths:
+        img = Image.open(path).convert("RGB")
+        img = img.resize((224, 224))
+        arrays.append(np.expand_dims(np.array(img), axis=0))
+    return np.concatenate(arrays).astype(np.float32)
+
+
+def run(mode, paths, repeat):
+    import preprocess
+
+    buffer = preprocess.InputBuffer(BATCH_SIZE)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for i in range(0, len(paths), BATCH_SIZE):
+            chunk = paths[i:i + BATCH_SIZE]
+            if mode == "legacy":
+                legacy_batch(chunk)
+            else:
+                batch = buffer.batch(len(chunk))
+                for slot, path in zip(batch, chunk):
+                    preprocess.decode_into(path, slot)
+    elapsed = time.perf_counter() - start
+
+    images = len(paths) * repeat
+    return {
+        "mode": mode,
+        "images": images,
+        "seconds": round(elapsed, 3),
+        "images_per_sec": round(images / elapsed, 1) if elapsed else None,
+        # ru_maxrss is KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def make_phone_copies(paths, edge, out_dir):
+    copies = []
+    for i, path in enumerate(paths):
+        img = Image.open(path).convert("RGB")
+        w, h = img.size
+        scale = edge / max(w, h)
+        dst = os.path.join(out_dir, f"{i}.jpg")
+        img.resize((int(w * scale), int(h * scale))).save(dst, quality=90)
+        copies.append(dst)
+    return copies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--datasets", default=os.path.join(CODE_DIR, "datasets"))
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--phone-size", type=int, default=0, help="Re-encode samples with this long edge first")
+    parser.add_argument("--mode", choices=["legacy", "reduced"], help=argparse.SUPPRESS)
+    parser.add_argument("--paths-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Child process: run one mode and report
+    if args.mode:
+        with open(args.paths_file) as f:
+            paths = json.load(f)
+        print(json.dumps(run(args.mode, paths, args.repeat)))
+        return
+
+    paths = sorted(glob.glob(os.path.join(args.datasets, "*", "*", "*.jpg")))[:args.limit]
+    if not paths:
+        sys.exit(f"No images found under {args.datasets}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.phone_size:
+            paths = make_phone_copies(paths, args.phone_size, tmp)
+
+        paths_file = os.path.join(tmp, "paths.json")
+        with open(paths_file, "w") as f:
+            json.dump(paths, f)
+
+        for mode in ("legacy", "reduced"):
+            out = subprocess.run(
+                [sys.executable, __file__, "--mode", mode, "--paths-file", paths_file, "--repeat", str(args.repeat)],
+                check=True, capture_output=True, text=True,
+            )
+            print(out.stdout.strip())
+
+
+if __name__ == "__main__":
+    main()
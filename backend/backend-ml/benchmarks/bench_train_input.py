@@ -0,0 +1,85 @@
+"""
+Training input throughput: ImageDataGenerator.flow_from_directory (what
+train.py used) vs the tf.data pipeline in code_a_thon/train_input.py.
+
+    python benchmarks/bench_train_input.py [--epochs 3] [--batch-size 32]
+
+No model is involved; each path just produces augmented training
+batches for --epochs passes over datasets/train, so the numbers are the
+ceiling the input side puts on CPU training speed. Prints one JSON object.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CODE_DIR = os.path.join(ROOT, "code_a_thon")
+sys.path.append(CODE_DIR)
+
+import tensorflow as tf  # noqa: E402
+
+from dataset_index import DATASETS_DIR, class_indices_from_dir  # noqa: E402
+from preprocess import IMG_SIZE  # noqa: E402
+from train_input import make_dataset  # noqa: E402
+
+
+def legacy_rates(batch_size, epochs):
+    from tensorflow.keras.preprocessing.image import ImageDataGenerator
+
+    gen = ImageDataGenerator(
+        rotation_range=25, width_shift_range=0.1, height_shift_range=0.1, zoom_range=0.2, horizontal_flip=True
+    ).flow_from_directory(
+        os.path.join(DATASETS_DIR, "train"), target_size=(IMG_SIZE, IMG_SIZE),
+        batch_size=batch_size, class_mode="categorical"
+    )
+    rates = []
+    for _ in range(epochs):
+        start = time.perf_counter()
+        for i in range(len(gen)):
+            gen[i]
+        gen.on_epoch_end()
+        rates.append(gen.samples / (time.perf_counter() - start))
+    return rates
+
+
+def pipeline_rates(batch_size, epochs):
+    ds, num_images = make_dataset("train", class_indices_from_dir("train"), batch_size, training=True)
+    rates = []
+    for _ in range(epochs):
+        start = time.perf_counter()
+        for _ in ds:
+            pass
+        rates.append(num_images / (time.perf_counter() - start))
+    return rates
+
+
+def describe(rates):
+    return {
+        "images_per_sec": [round(r, 1) for r in rates],
+        "first_epoch": round(rates[0], 1),
+        "later_epochs_mean": round(sum(rates[1:]) / len(rates[1:]), 1) if len(rates) > 1 else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    legacy = describe(legacy_rates(args.batch_size, args.epochs))
+    pipeline = describe(pipeline_rates(args.batch_size, args.epochs))
+    steady = pipeline["later_epochs_mean"] or pipeline["first_epoch"]
+    print(json.dumps({
+        "tensorflow": tf.__version__,
+        "cpu_count": os.cpu_count(),
+        "flow_from_directory": legacy,
+        "tf_data": pipeline,
+        "speedup": round(steady / (legacy["later_epochs_mean"] or legacy["first_epoch"]), 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Inference backends for the fish classifier.
+
+The service only needs `predict(batch) -> probabilities`, so the heavy
+runtime is picked at startup with FISH_MODEL_BACKEND:
+
+    keras   - model/fish_classifier.h5 through TensorFlow (default)
+    tflite  - model/fish_classifier.tflite through tflite_runtime
+              (falls back to tf.lite if tflite_runtime is not installed)
+    onnx    - model/fish_classifier.onnx through onnxruntime
+
+Only the keras backend imports TensorFlow. The .tflite / .onnx files are
+written by export_model.py after train.py.
+"""
+import hashlib
+import os
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_DIR = os.path.join(BASE_DIR, "model")
+
+MODEL_PATHS = {
+    "keras": os.path.join(MODEL_DIR, "fish_classifier.h5"),
+    "tflite": os.path.join(MODEL_DIR, "fish_classifier.tflite"),
+    "onnx": os.path.join(MODEL_DIR, "fish_classifier.onnx"),
+}
+
+DEFAULT_BACKEND = os.getenv("FISH_MODEL_BACKEND", "keras").lower()
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()[:16]
+
+
+class KerasBackend:
+    name = "keras"
+
+    def __init__(self, model_path):
+        import tensorflow as tf
+
+        self.model_path = model_path
+        self.model = tf.keras.models.load_model(model_path)
+
+    def predict(self, batch):
+        return np.asarray(self.model.predict(batch, verbose=0))
+
+
+class TFLiteBackend:
+    name = "tflite"
+
+    def __init__(self, model_path, num_threads=None):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+
+        self.model_path = model_path
+        self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self._batch_size = int(self.input["shape"][0])
+
+    def _resize(self, batch_size):
+        # The exported graph has a fixed batch dim; resize it to fit the batch
+        if batch_size != self._batch_size:
+            shape = [batch_size] + list(self.input["shape"][1:])
+            self.interpreter.resize_tensor_input(self.input["index"], shape)
+            self.interpreter.allocate_tensors()
+            self.input = self.interpreter.get_input_details()[0]
+            self.output = self.interpreter.get_output_details()[0]
+            self._batch_size = batch_size
+
+    def predict(self, batch):
+        self._resize(len(batch))
+
+        dtype = self.input["dtype"]
+        scale, zero_point = self.input.get("quantization", (0.0, 0))
+        if np.issubdtype(dtype, np.integer) and scale:
+            info = np.iinfo(dtype)
+            data = np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(dtype)
+        else:
+            data = batch.astype(dtype, copy=False)
+
+        self.interpreter.set_tensor(self.input["index"], data)
+        self.interpreter.invoke()
+        out = self.interpreter.get_tensor(self.output["index"])
+
+        scale, zero_point = self.output.get("quantization", (0.0, 0))
+        if np.issubdtype(out.dtype, np.integer) and scale:
+            out = (out.astype(np.float32) - zero_point) * scale
+        return out
+
+
+class OnnxBackend:
+    name = "onnx"
+
+    def __init__(self, model_path):
+        import onnxruntime as ort
+
+        self.model_path = model_path
+        self.session = ort.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, batch):
+        return self.session.run(None, {self.input_name: batch.astype(np.float32, copy=False)})[0]
+
+
+BACKENDS = {
+    "keras": KerasBackend,
+    "tflite": TFLiteBackend,
+    "onnx": OnnxBackend,
+}
+
+
+def load_backend(name=None, model_path=None):
+    """Builds the backend named by `name` (or FISH_MODEL_BACKEND)."""
+    name = (name or DEFAULT_BACKEND).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown model backend '{name}', expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name](model_path or MODEL_PATHS[name])
@@ -0,0 +1,115 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+import shared  # noqa: F401
+from preprocess import InputBuffer
+from fishapp.metrics import BATCH_SIZE, STAGE_SECONDS
+
+# --- CONFIG ---
+# Both knobs can be tuned per deployment without touching code.
+MAX_BATCH_SIZE = int(os.getenv("CUSTOM_MODEL_MAX_BATCH", "16"))
+MAX_WAIT_MS = float(os.getenv("CUSTOM_MODEL_MAX_WAIT_MS", "10"))
+
+_STOP = object()
+
+
+class BatchingEngine:
+    """
+    Collects single-image requests from many callers into one queue and runs
+    them through the model in batches on a dedicated worker thread.
+
+    The first request in an empty queue waits at most `max_wait_ms` for
+    company; a batch is sent as soon as it reaches `max_batch_size`.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        # predict_fn takes a stacked (N, H, W, C) array and returns N results
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        # Reused for every batch; only the worker thread touches it
+        self._buffer = InputBuffer(self.max_batch_size)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    # --- LIFECYCLE ---
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="custom-model-batcher", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self, timeout=5.0):
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    # --- CALLER SIDE ---
+    def submit(self, image_array):
+        """Queues one (H, W, C) array and returns a Future for its result."""
+        self.start()
+        future = Future()
+        self._queue.put((image_array, future, time.perf_counter()))
+        return future
+
+    async def predict(self, image_array):
+        """Awaitable version of submit() for use inside async routes."""
+        return await asyncio.wrap_future(self.submit(image_array))
+
+    # --- WORKER SIDE ---
+    def _collect(self, first):
+        items = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # Finish this batch first, then let the loop see the stop marker
+                self._queue.put(_STOP)
+                break
+            items.append(item)
+        return items
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+
+            items = self._collect(first)
+            # Callers that gave up (cancelled) don't need a slot in the batch
+            items = [(arr, fut, queued) for arr, fut, queued in items if fut.set_running_or_notify_cancel()]
+            if not items:
+                continue
+
+            # Time each request spent queued waiting for its batch
+            now = time.perf_counter()
+            for _, _, queued in items:
+                STAGE_SECONDS.labels("batch_wait").observe(now - queued)
+            BATCH_SIZE.labels("custom_model").observe(len(items))
+
+            try:
+                batch = np.stack([arr for arr, _, _ in items], out=self._buffer.batch(len(items)))
+                results = self.predict_fn(batch)
+            except Exception as e:
+                for _, fut, _ in items:
+                    fut.set_exception(e)
+                continue
+
+            for (_, fut, _), result in zip(items, results):
+                fut.set_result(result)
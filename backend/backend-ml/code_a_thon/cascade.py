@@ -0,0 +1,229 @@
+"""
+Confidence gate for the custom classifier: callers use its answer when
+it is trustworthy and escalate to a remote model (Gemini / Roboflow)
+only when it isn't.
+
+    model/thresholds.json   per-class minimum confidence, written by calibrate
+
+    python cascade.py calibrate --target-accuracy 0.95
+    python cascade.py evaluate
+
+Calibration runs the model over datasets/valid and, for each predicted
+class, picks the lowest confidence at which that class's predictions are
+still right at least --target-accuracy of the time. A lower threshold
+means fewer remote calls; the target caps how often a local answer is
+wrong. Classes with fewer than --min-support validation predictions
+share one threshold fitted on all predictions together, and a class that
+never reaches the target gets none (always escalated).
+
+A predicted class the thresholds were not fitted on is never confident.
+The file records the model version it was fitted for and is ignored
+after a retrain or a backend switch, until recalibrated.
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from dataset_index import list_labelled_images, load_class_indices
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+THRESHOLDS_PATH = os.getenv("CASCADE_THRESHOLDS_PATH", os.path.join(BASE_DIR, "model", "thresholds.json"))
+
+TARGET_ACCURACY = 0.95
+MIN_SUPPORT = 10
+
+
+class Thresholds:
+    def __init__(self, per_class=None, default=None, meta=None):
+        self.per_class = per_class or {}  # class -> min confidence (0..1), None = always escalate
+        self.default = default  # for fitted-on classes with too few validation predictions
+        self.meta = meta or {}
+        self.labels = set(self.meta.get("labels", self.per_class))
+        self.checked = 0
+        self.confident = 0
+
+    @classmethod
+    def load(cls, path=THRESHOLDS_PATH, version=None):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            print(f"⚠️ No cascade thresholds at {path}; predictions are never marked confident "
+                  f"(run: python cascade.py calibrate)")
+            return cls()
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not read cascade thresholds: {e}")
+            return cls()
+        if version and data.get("model_version") != version:
+            print("⚠️ Cascade thresholds were fitted for another model version, ignoring them until recalibrated")
+            return cls()
+        print(f"✅ Cascade thresholds loaded ({len(data.get('per_class', {}))} classes, "
+              f"target accuracy {data.get('target_accuracy')})")
+        return cls(data.get("per_class"), data.get("default"), data)
+
+    def threshold_for(self, label):
+        if label in self.per_class:
+            return self.per_class[label]
+        return self.default if label in self.labels else None
+
+    def accepts(self, label, confidence):
+        threshold = self.threshold_for(label)
+        return threshold is not None and confidence >= threshold
+
+    def annotate(self, result):
+        """Adds confident/threshold (same % scale as confidence_score) to one prediction."""
+        if result.get("status") != "success":
+            return result
+        label = result.get("predicted_fish")
+        threshold = self.threshold_for(label)
+        confident = self.accepts(label, result["confidence_score"] / 100)
+        self.checked += 1
+        self.confident += confident
+        return {
+            **result,
+            "confident": confident,
+            "threshold": round(threshold * 100, 2) if threshold is not None else None,
+        }
+
+    def stats(self):
+        return {
+            "calibrated": bool(self.meta),
+            "classes": len(self.per_class),
+            "checked": self.checked,
+            "confident": self.confident,
+            "confident_rate": round(self.confident / self.checked, 4) if self.checked else 0.0,
+        }
+
+
+# --- CALIBRATION ---
+def fit_threshold(confidences, correct, target):
+    """
+    Lowest confidence t such that predictions with confidence >= t are
+    right at least `target` of the time, or None if no t gets there.
+    """
+    if len(confidences) == 0:
+        return None
+    order = np.argsort(-confidences, kind="stable")
+    conf = confidences[order]
+    accuracy = np.cumsum(correct[order]) / np.arange(1, len(conf) + 1)
+    # Only cut between distinct confidences: tied predictions are accepted together
+    cut = np.r_[conf[1:] < conf[:-1], True]
+    ok = np.flatnonzero(cut & (accuracy >= target))
+    return float(conf[ok[-1]]) if len(ok) else None
+
+
+def calibrate(true_labels, predicted, confidences, target=TARGET_ACCURACY, min_support=MIN_SUPPORT):
+    """(per_class, default) thresholds for the given validation predictions."""
+    true_labels = np.asarray(true_labels)
+    predicted = np.asarray(predicted)
+    confidences = np.asarray(confidences, dtype=np.float64)
+    correct = predicted == true_labels
+
+    default = fit_threshold(confidences, correct, target)
+    per_class = {}
+    for label in sorted(set(predicted.tolist())):
+        mask = predicted == label
+        if mask.sum() >= min_support:
+            per_class[label] = fit_threshold(confidences[mask], correct[mask], target)
+    return per_class, default
+
+
+def evaluate(thresholds, true_labels, predicted, confidences):
+    """How often the local answer would be used, and how often it would be right."""
+    correct = np.asarray(predicted) == np.asarray(true_labels)
+    accepted = np.array([thresholds.accepts(p, c) for p, c in zip(predicted, confidences)], dtype=bool)
+
+    def rates(mask):
+        local = accepted[mask]
+        return {
+            "images": int(mask.sum()),
+            "local_rate": round(float(local.mean()), 4) if mask.any() else 0.0,
+            "local_accuracy": round(float(correct[mask][local].mean()), 4) if local.any() else None,
+            "model_accuracy": round(float(correct[mask].mean()), 4) if mask.any() else None,
+        }
+
+    predicted = np.asarray(predicted)
+    summary = rates(np.ones(len(correct), dtype=bool))
+    summary["remote_call_rate"] = round(1 - summary["local_rate"], 4)
+    summary["per_class"] = {
+        label: {"threshold": thresholds.threshold_for(label), **rates(predicted == label)}
+        for label in sorted(set(predicted.tolist()))
+    }
+    return summary
+
+
+def collect_predictions(split="valid", chunk_size=32):
+    """Runs the served model over a split -> (true labels, predicted labels, confidences)."""
+    import test_single_image
+
+    if test_single_image.model is None:
+        raise SystemExit("❌ Model not loaded, nothing to calibrate")
+
+    class_indices = load_class_indices()
+    names = {v: k for k, v in class_indices.items()}
+    items = list_labelled_images(split, class_indices)
+    print(f"🔄 Predicting {len(items)} '{split}' images with {test_single_image.MODEL_VERSION}")
+
+    true_labels, predicted, confidences = [], [], []
+    start = time.perf_counter()
+    results = test_single_image.iter_predictions([path for path, _ in items], chunk_size)
+    for (path, label), result in zip(items, results):
+        if result.get("status") != "success":
+            print(f"⚠️ Skipping {path}: {result.get('message')}")
+            continue
+        true_labels.append(names[label])
+        predicted.append(result["predicted_fish"])
+        confidences.append(result["confidence_score"] / 100)
+    print(f"✅ {len(predicted)} predictions in {time.perf_counter() - start:.1f}s")
+    return true_labels, predicted, confidences, test_single_image.MODEL_VERSION, sorted(class_indices)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    fit = sub.add_parser("calibrate", help="Fit per-class thresholds on a validation split and save them")
+    fit.add_argument("--target-accuracy", type=float, default=TARGET_ACCURACY,
+                     help=f"Minimum accuracy of locally answered images (default {TARGET_ACCURACY})")
+    fit.add_argument("--min-support", type=int, default=MIN_SUPPORT,
+                     help=f"Fewer validation predictions than this -> shared threshold (default {MIN_SUPPORT})")
+    fit.add_argument("--dry-run", action="store_true", help="Print the result without saving it")
+    check = sub.add_parser("evaluate", help="Local/remote split of the saved thresholds on a split")
+    for p in (fit, check):
+        p.add_argument("--split", default="valid", help="Dataset split (default valid)")
+        p.add_argument("--path", default=THRESHOLDS_PATH, help="Thresholds file")
+    args = parser.parse_args()
+
+    true_labels, predicted, confidences, version, labels = collect_predictions(args.split)
+
+    if args.command == "evaluate":
+        thresholds = Thresholds.load(args.path, version=version)
+        print(json.dumps(evaluate(thresholds, true_labels, predicted, confidences), indent=2))
+        return
+
+    per_class, default = calibrate(true_labels, predicted, confidences, args.target_accuracy, args.min_support)
+    data = {
+        "model_version": version,
+        "split": args.split,
+        "target_accuracy": args.target_accuracy,
+        "min_support": args.min_support,
+        "created_at": time.time(),
+        "labels": labels,
+        "default": default,
+        "per_class": per_class,
+    }
+    data["validation"] = evaluate(Thresholds(per_class, default, data), true_labels, predicted, confidences)
+    print(json.dumps(data, indent=2))
+
+    if not args.dry_run:
+        tmp = args.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp, args.path)
+        print(f"✅ Thresholds saved to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
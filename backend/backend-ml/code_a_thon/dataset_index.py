@@ -0,0 +1,48 @@
+import json
+import os
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATASETS_DIR = os.path.join(BASE_DIR, "datasets")
+INDICES_PATH = os.path.join(BASE_DIR, "model", "class_indices.json")
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def load_class_indices(path=INDICES_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _split_dir(split):
+    return split if os.path.isabs(split) else os.path.join(DATASETS_DIR, split)
+
+
+def class_indices_from_dir(split="train"):
+    """
+    {class_name: index} for the class folders of a split, numbered in
+    sorted order exactly like flow_from_directory's class_indices.
+    """
+    split_dir = _split_dir(split)
+    names = sorted(name for name in os.listdir(split_dir) if os.path.isdir(os.path.join(split_dir, name)))
+    return {name: i for i, name in enumerate(names)}
+
+
+def list_labelled_images(split, class_indices=None):
+    """
+    Returns [(image_path, class_index), ...] for one dataset split.
+    Like flow_from_directory, only class folders count; loose files and
+    the XML annotations next to them are ignored.
+    """
+    if class_indices is None:
+        class_indices = load_class_indices()
+
+    split_dir = _split_dir(split)
+    items = []
+    for class_name in sorted(os.listdir(split_dir)):
+        class_dir = os.path.join(split_dir, class_name)
+        if not os.path.isdir(class_dir) or class_name not in class_indices:
+            continue
+        for file in sorted(os.listdir(class_dir)):
+            if file.lower().endswith(IMAGE_EXTENSIONS):
+                items.append((os.path.join(class_dir, file), class_indices[class_name]))
+    return items
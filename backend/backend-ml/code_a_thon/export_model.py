@@ -0,0 +1,132 @@
+"""
+Export the trained classifier to lightweight runtimes.
+
+Run after train.py, from this folder:
+
+    python export_model.py                       # float32 TFLite
+    python export_model.py --quantize float16    # half-size weights
+    python export_model.py --quantize int8       # int8 weights/activations
+    python export_model.py --onnx                # also write ONNX (needs tf2onnx)
+
+Every export is checked against the .h5 model on datasets/valid; the
+script exits non-zero if accuracy drops by more than --max-accuracy-drop.
+"""
+import argparse
+import random
+import sys
+
+import numpy as np
+import tensorflow as tf
+
+from backends import MODEL_PATHS, TFLiteBackend, OnnxBackend
+from dataset_index import list_labelled_images
+from preprocess import IMG_SIZE, InputBuffer, decode, decode_into
+
+
+def load_image(path):
+    # Same preprocessing as the service, so parity reflects what users get
+    return decode(path).astype(np.float32)
+
+
+# -------------------------
+# Export
+# -------------------------
+def representative_dataset(num_samples=100):
+    """Calibration images for int8 quantization, sampled from the train split."""
+    items = list_labelled_images("train")
+    random.Random(0).shuffle(items)
+    for path, _ in items[:num_samples]:
+        yield [np.expand_dims(load_image(path), axis=0)]
+
+
+def export_tflite(model, quantize="none", out_path=MODEL_PATHS["tflite"]):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+
+    if quantize == "float16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantize == "int8":
+        # Inputs/outputs stay float32 so callers don't need to know about scales
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+    with open(out_path, "wb") as f:
+        f.write(converter.convert())
+    print(f"✅ TFLite model written to {out_path} (quantize={quantize})")
+    return out_path
+
+
+def export_onnx(model, out_path=MODEL_PATHS["onnx"], opset=13):
+    import tf2onnx
+
+    spec = (tf.TensorSpec((None, IMG_SIZE, IMG_SIZE, 3), tf.float32, name="input"),)
+    tf2onnx.convert.from_keras(model, input_signature=spec, opset=opset, output_path=out_path)
+    print(f"✅ ONNX model written to {out_path}")
+    return out_path
+
+
+# -------------------------
+# Accuracy parity
+# -------------------------
+def evaluate(predict_fn, items, batch_size=32):
+    """Returns (accuracy, predicted_indices) over [(path, label), ...]."""
+    predicted = []
+    buffer = InputBuffer(batch_size)
+    for start in range(0, len(items), batch_size):
+        chunk = items[start:start + batch_size]
+        batch = buffer.batch(len(chunk))
+        for slot, (path, _) in zip(batch, chunk):
+            decode_into(path, slot)
+        predicted.extend(np.argmax(predict_fn(batch), axis=1).tolist())
+
+    labels = [label for _, label in items]
+    accuracy = float(np.mean(np.array(predicted) == np.array(labels))) if items else 0.0
+    return accuracy, predicted
+
+
+def parity_check(model, exported, split="valid"):
+    items = list_labelled_images(split)
+    print(f"🔄 Parity check on {len(items)} images from datasets/{split}")
+
+    ref_acc, ref_pred = evaluate(lambda b: model.predict(b, verbose=0), items)
+    print(f"   keras (.h5): accuracy {ref_acc:.4f}")
+
+    report = {}
+    for name, backend in exported.items():
+        acc, pred = evaluate(backend.predict, items)
+        agreement = float(np.mean(np.array(pred) == np.array(ref_pred))) if items else 0.0
+        report[name] = {"accuracy": acc, "drop": ref_acc - acc, "agreement": agreement}
+        print(f"   {name}: accuracy {acc:.4f} (drop {ref_acc - acc:+.4f}), agrees with .h5 on {agreement:.2%}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export fish_classifier.h5 to TFLite/ONNX")
+    parser.add_argument("--quantize", choices=["none", "float16", "int8"], default="none")
+    parser.add_argument("--onnx", action="store_true", help="Also export an ONNX model")
+    parser.add_argument("--skip-parity", action="store_true", help="Skip the accuracy check")
+    parser.add_argument("--max-accuracy-drop", type=float, default=0.01)
+    args = parser.parse_args()
+
+    model = tf.keras.models.load_model(MODEL_PATHS["keras"])
+
+    exported = {"tflite": TFLiteBackend(export_tflite(model, args.quantize))}
+    if args.onnx:
+        exported["onnx"] = OnnxBackend(export_onnx(model))
+
+    if args.skip_parity:
+        return 0
+
+    report = parity_check(model, exported)
+    failed = [name for name, r in report.items() if r["drop"] > args.max_accuracy_drop]
+    if failed:
+        print(f"❌ Accuracy drop above {args.max_accuracy_drop} for: {', '.join(failed)}")
+        return 1
+
+    print("✅ Export complete, accuracy parity OK.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""
+Pooled backbone embeddings, computed once, for head-only training.
+
+Phase 1 of train.py keeps EfficientNetB0 frozen, so every epoch pushed
+every image through the same forward pass just to get the same 1280
+numbers out of GlobalAveragePooling2D. With --feature-cache those are
+computed once per split and kept under features/<split>/:
+
+    embeddings.npy  float32 (N, 1280), opened memory-mapped
+    labels.npy      int32 (N,)
+    meta.json       fingerprint of the images, classes and backbone
+
+The Dense/Dropout head then trains on them in seconds. The cache is
+rebuilt when the fingerprint changes (images added, removed or edited,
+classes renamed, different image size).
+
+Embeddings are of un-augmented images; augmentation comes back in the
+fine-tuning phase, which runs on real images as before.
+"""
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from dataset_index import list_labelled_images
+from preprocess import IMG_SIZE
+from train_input import make_dataset
+
+FEATURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "features")
+
+
+class FeatureSet:
+    def __init__(self, embeddings, labels, meta):
+        self.embeddings = embeddings  # memory-mapped
+        self.labels = labels
+        self.meta = meta
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _rows(self, idx):
+        # Ascending order reads the memmap sequentially; order inside a batch doesn't matter
+        idx = np.sort(idx)
+        return np.asarray(self.embeddings[idx], np.float32), self.labels[idx].astype(np.int32)
+
+    def dataset(self, num_classes, batch_size, training=False):
+        """
+        Batches gathered from the memmap on demand. from_tensor_slices would
+        copy every embedding into the graph as a constant; here only row
+        indices are shuffled and only the batches in flight are in memory.
+        """
+        dim = self.embeddings.shape[1]
+        ds = tf.data.Dataset.range(len(self))
+        if training:
+            ds = ds.shuffle(len(self), reshuffle_each_iteration=True)
+
+        def gather(idx):
+            x, y = tf.numpy_function(self._rows, [idx], (tf.float32, tf.int32))
+            x.set_shape((None, dim))
+            y.set_shape((None,))
+            return x, tf.one_hot(y, num_classes)
+
+        return ds.batch(batch_size).map(gather, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+
+
+def _split_name(split):
+    return os.path.basename(split.rstrip(os.sep))
+
+
+def fingerprint(split, class_indices, backbone):
+    h = hashlib.sha256()
+    h.update(json.dumps({"classes": class_indices, "img_size": IMG_SIZE, "backbone": backbone}, sort_keys=True).encode())
+    for path, label in list_labelled_images(split, class_indices):
+        st = os.stat(path)
+        name = f"{os.path.basename(os.path.dirname(path))}/{os.path.basename(path)}"
+        h.update(f"{name}:{st.st_size}:{st.st_mtime_ns}:{label}\n".encode())
+    return h.hexdigest()
+
+
+def load_features(split, class_indices, backbone, root=FEATURES_DIR):
+    """The cached FeatureSet for a split, or None if missing or stale."""
+    out_dir = os.path.join(root, _split_name(split))
+    try:
+        with open(os.path.join(out_dir, "meta.json")) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("fingerprint") != fingerprint(split, class_indices, backbone):
+        print(f"⚠️ Feature cache for '{split}' is out of date, rebuilding")
+        return None
+    embeddings = np.load(os.path.join(out_dir, "embeddings.npy"), mmap_mode="r")
+    labels = np.load(os.path.join(out_dir, "labels.npy"))
+    if len(embeddings) != meta["count"] or len(labels) != meta["count"]:
+        return None
+    return FeatureSet(embeddings, labels, meta)
+
+
+def extract_features(extractor, split, class_indices, backbone, batch_size=64, root=FEATURES_DIR):
+    """Runs `extractor` (images -> pooled embedding) over a split once and stores the result."""
+    ds, count = make_dataset(split, class_indices, batch_size, cache=False)
+    out_dir = os.path.join(root, _split_name(split))
+    os.makedirs(out_dir, exist_ok=True)
+    meta_path = os.path.join(out_dir, "meta.json")
+    # meta.json is written last, so a half-written cache never looks valid
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    dim = extractor.output_shape[-1]
+    embeddings_path = os.path.join(out_dir, "embeddings.npy")
+    embeddings = np.lib.format.open_memmap(embeddings_path, mode="w+", dtype=np.float32, shape=(count, dim))
+    labels = np.empty(count, dtype=np.int32)
+
+    start = time.perf_counter()
+    pos = 0
+    for images, one_hot in ds:
+        features = extractor(images, training=False).numpy()
+        embeddings[pos:pos + len(features)] = features
+        labels[pos:pos + len(features)] = np.argmax(one_hot.numpy(), axis=1)
+        pos += len(features)
+    embeddings.flush()
+    del embeddings
+    np.save(os.path.join(out_dir, "labels.npy"), labels)
+    elapsed = time.perf_counter() - start
+
+    meta = {
+        "fingerprint": fingerprint(split, class_indices, backbone),
+        "count": count,
+        "dim": dim,
+        "backbone": backbone,
+        "img_size": IMG_SIZE,
+        "created_at": time.time(),
+    }
+    with open(meta_path, "w") as f:
+        json.dump(meta, f)
+    print(f"✅ Extracted {count} '{split}' embeddings in {elapsed:.1f}s ({count / elapsed:.1f} images/sec)")
+    return load_features(split, class_indices, backbone, root)
+
+
+def cached_features(extractor, split, class_indices, backbone, batch_size=64, root=FEATURES_DIR):
+    features = load_features(split, class_indices, backbone, root)
+    if features is not None:
+        print(f"✅ Using cached '{split}' embeddings ({len(features)} images)")
+        return features
+    return extract_features(extractor, split, class_indices, backbone, batch_size, root)
@@ -0,0 +1,349 @@
+"""
+Nearest-neighbour species identification over a gallery of embeddings.
+
+The classifier's softmax only knows the species it was trained on. Here
+the backbone (the classifier cut at its pooling layer) turns an image
+into a 1280-d embedding, and a query is answered by the most similar
+labelled gallery images (cosine similarity). Adding a species is just
+adding photos of it, no retraining:
+
+    gallery/<Species>/*.jpg   drop-in images, picked up by sync()
+    model/gallery/            the index (embeddings.npy, labels.json, meta.json)
+
+    python gallery.py build            # embed gallery/ (and datasets/train)
+    python gallery.py query fish.jpg   # top matches for one photo
+
+Search is one NumPy matrix product. With hnswlib installed and
+GALLERY_ANN=true, an HNSW index takes over once the gallery holds more
+than GALLERY_ANN_MIN_SIZE images.
+
+Embeddings depend on the classifier weights, so the index records the
+model's digest and is rebuilt from the images after a retrain.
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from io import BytesIO
+
+import numpy as np
+
+import preprocess
+from backends import MODEL_PATHS, file_digest
+from dataset_index import DATASETS_DIR, IMAGE_EXTENSIONS
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+GALLERY_DIR = os.getenv("GALLERY_DIR", os.path.join(BASE_DIR, "gallery"))
+INDEX_DIR = os.getenv("GALLERY_INDEX_DIR", os.path.join(BASE_DIR, "model", "gallery"))
+INCLUDE_TRAIN = os.getenv("GALLERY_INCLUDE_TRAIN", "true").lower() in ("1", "true", "yes")
+
+TOP_K = int(os.getenv("GALLERY_K", "5"))
+MIN_SIMILARITY = float(os.getenv("GALLERY_MIN_SIMILARITY", "0.80"))
+MIN_MARGIN = float(os.getenv("GALLERY_MIN_MARGIN", "0.05"))  # best species vs runner-up
+ANN_ENABLED = os.getenv("GALLERY_ANN", "false").lower() in ("1", "true", "yes")
+ANN_MIN_SIZE = int(os.getenv("GALLERY_ANN_MIN_SIZE", "20000"))
+EMBED_BATCH = 32
+
+
+def normalize(vectors):
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class Gallery:
+    def __init__(self, version=None, ann=ANN_ENABLED, ann_min_size=ANN_MIN_SIZE):
+        self.version = version
+        self.embeddings = None  # (N, D) float32, L2-normalised
+        self.labels = []
+        self.sources = []
+        self._known = set()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._ann_wanted = ann
+        self._ann_min_size = ann_min_size
+        self._ann = None
+
+    def __len__(self):
+        return len(self.labels)
+
+    def has(self, source):
+        return source in self._known
+
+    # --- INDEX ---
+    def add(self, species, vectors, sources):
+        """Adds embeddings for one species; sources already present are skipped."""
+        vectors = normalize(vectors)
+        with self._lock:
+            keep = [i for i, source in enumerate(sources) if source not in self._known]
+            if not keep:
+                return 0
+            new = vectors[keep]
+            first_id = len(self.labels)
+            # Lists grow before the array is swapped, so readers never see a row without a label
+            self.labels.extend([species] * len(keep))
+            self.sources.extend(sources[i] for i in keep)
+            self._known.update(sources[i] for i in keep)
+            self.embeddings = new if self.embeddings is None else np.concatenate([self.embeddings, new])
+            if self._ann is not None:
+                self._ann.resize_index(len(self.labels))
+                self._ann.add_items(new, np.arange(first_id, first_id + len(keep)))
+            else:
+                self._maybe_build_ann()
+            return len(keep)
+
+    def _maybe_build_ann(self):
+        if not self._ann_wanted or len(self.labels) < self._ann_min_size:
+            return
+        try:
+            import hnswlib
+        except ImportError:
+            print("⚠️ GALLERY_ANN is set but hnswlib is not installed; using brute-force search")
+            self._ann_wanted = False
+            return
+        index = hnswlib.Index(space="cosine", dim=self.embeddings.shape[1])
+        index.init_index(max_elements=len(self.labels), ef_construction=200, M=16)
+        index.add_items(self.embeddings, np.arange(len(self.labels)))
+        index.set_ef(64)
+        self._ann = index
+        print(f"✅ Built HNSW gallery index over {len(self.labels)} images")
+
+    def search(self, queries, k=TOP_K):
+        """For each query: [(row, similarity), ...], most similar first."""
+        embeddings, ann = self.embeddings, self._ann
+        if embeddings is None:
+            return [[] for _ in range(len(np.atleast_2d(queries)))]
+        queries = normalize(queries)
+        k = min(k, len(embeddings))
+
+        if ann is not None:
+            rows, distances = ann.knn_query(queries, k=k)
+            return [[(int(r), float(1 - d)) for r, d in zip(row, dist)] for row, dist in zip(rows, distances)]
+
+        sims = queries @ embeddings.T
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        results = []
+        for q, rows in enumerate(top):
+            rows = rows[np.argsort(-sims[q, rows])]
+            results.append([(int(r), float(sims[q, r])) for r in rows])
+        return results
+
+    def identify(self, vector, k=TOP_K, min_similarity=MIN_SIMILARITY, min_margin=MIN_MARGIN):
+        """Best species for one embedding, scored by its most similar gallery image."""
+        neighbours = self.search(vector, k)[0]
+        if not neighbours:
+            return {"status": "error", "message": "Gallery is empty"}
+
+        best = {}
+        for row, similarity in neighbours:
+            species = self.labels[row]
+            best[species] = max(best.get(species, -1.0), similarity)
+        ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)
+        species, similarity = ranked[0]
+        margin = similarity - ranked[1][1] if len(ranked) > 1 else similarity
+
+        return {
+            "status": "success",
+            "species": species,
+            "similarity": round(similarity, 4),
+            "margin": round(margin, 4),
+            "confident": similarity >= min_similarity and margin >= min_margin,
+            "neighbours": [
+                {"species": self.labels[row], "similarity": round(sim, 4), "source": self.sources[row]}
+                for row, sim in neighbours
+            ],
+        }
+
+    def species_counts(self):
+        counts = {}
+        for label in self.labels:
+            counts[label] = counts.get(label, 0) + 1
+        return counts
+
+    def stats(self):
+        return {
+            "images": len(self),
+            "species_count": len(set(self.labels)),
+            "ann": self._ann is not None,
+            "dim": 0 if self.embeddings is None else int(self.embeddings.shape[1]),
+        }
+
+    # --- PERSISTENCE ---
+    def save(self, index_dir=INDEX_DIR):
+        with self._lock:
+            embeddings, labels, sources = self.embeddings, list(self.labels), list(self.sources)
+        if embeddings is None:
+            return
+        with self._save_lock:
+            self._write(index_dir, embeddings, labels, sources)
+
+    def _write(self, index_dir, embeddings, labels, sources):
+        os.makedirs(index_dir, exist_ok=True)
+        tmp = os.path.join(index_dir, "embeddings.tmp.npy")
+        np.save(tmp, embeddings)
+        os.replace(tmp, os.path.join(index_dir, "embeddings.npy"))
+        with open(os.path.join(index_dir, "labels.json.tmp"), "w") as f:
+            json.dump({"labels": labels, "sources": sources}, f)
+        os.replace(os.path.join(index_dir, "labels.json.tmp"), os.path.join(index_dir, "labels.json"))
+        with open(os.path.join(index_dir, "meta.json"), "w") as f:
+            json.dump({"version": self.version, "count": len(labels), "dim": int(embeddings.shape[1]),
+                       "saved_at": time.time()}, f)
+
+    @classmethod
+    def load(cls, index_dir=INDEX_DIR, version=None):
+        """The saved gallery, or an empty one if missing or built with other weights."""
+        gallery = cls(version=version)
+        try:
+            with open(os.path.join(index_dir, "meta.json")) as f:
+                meta = json.load(f)
+            with open(os.path.join(index_dir, "labels.json")) as f:
+                names = json.load(f)
+            embeddings = np.load(os.path.join(index_dir, "embeddings.npy"), mmap_mode="r")
+        except (OSError, ValueError):
+            return gallery
+        if version is not None and meta.get("version") != version:
+            print("⚠️ Gallery index was built with different model weights, rebuilding")
+            return gallery
+        if len(embeddings) != len(names["labels"]):
+            return gallery
+        gallery.embeddings = embeddings
+        gallery.labels = names["labels"]
+        gallery.sources = names["sources"]
+        gallery._known = set(gallery.sources)
+        gallery._maybe_build_ann()
+        return gallery
+
+
+# --- EMBEDDING ---
+def keras_embedder(keras_model):
+    """embed(batch) -> (N, D) pooled backbone features of a trained classifier."""
+    import tensorflow as tf
+
+    pool = next(layer for layer in reversed(keras_model.layers) if type(layer).__name__ == "GlobalAveragePooling2D")
+    backbone = tf.keras.Model(inputs=keras_model.input, outputs=pool.output)
+
+    def embed(batch):
+        return np.asarray(backbone.predict_on_batch(batch))
+    return embed
+
+
+def load_embedder(backend=None, model_path=MODEL_PATHS["keras"]):
+    """Reuses a loaded keras backend's model, otherwise loads the .h5 (TFLite/ONNX have no embedding output)."""
+    if getattr(backend, "embed", None) is not None:
+        return backend.embed  # inference_server.RemoteModel: embeddings come from the shared model
+    if backend is not None and getattr(backend, "name", None) == "keras":
+        return keras_embedder(backend.model)
+    import tensorflow as tf
+    return keras_embedder(tf.keras.models.load_model(model_path))
+
+
+def embed_images(embed, sources):
+    """Decodes paths/file objects and embeds them EMBED_BATCH at a time."""
+    out = []
+    for start in range(0, len(sources), EMBED_BATCH):
+        chunk = sources[start:start + EMBED_BATCH]
+        batch = preprocess.thread_buffer(len(chunk))
+        for i, source in enumerate(chunk):
+            preprocess.decode_into(source, batch[i])
+        out.append(embed(batch[:len(chunk)]))
+    return np.concatenate(out) if out else np.empty((0, 0), np.float32)
+
+
+def labelled_files(root):
+    """{species: [path, ...]} for root/<species>/<image>."""
+    found = {}
+    if not os.path.isdir(root):
+        return found
+    for species in sorted(os.listdir(root)):
+        species_dir = os.path.join(root, species)
+        if not os.path.isdir(species_dir):
+            continue
+        files = [os.path.join(species_dir, f) for f in sorted(os.listdir(species_dir))
+                 if f.lower().endswith(IMAGE_EXTENSIONS)]
+        if files:
+            found[species] = files
+    return found
+
+
+def source_key(path):
+    # "<species>/<file>" plus the source tree, so re-syncs skip files already embedded
+    tree = "train" if os.path.abspath(path).startswith(os.path.abspath(DATASETS_DIR)) else "gallery"
+    return f"{tree}:{os.path.basename(os.path.dirname(path))}/{os.path.basename(path)}"
+
+
+def sync(gallery, embed, roots=None):
+    """Embeds every labelled image under `roots` that the gallery doesn't have yet."""
+    if roots is None:
+        roots = [GALLERY_DIR] + ([os.path.join(DATASETS_DIR, "train")] if INCLUDE_TRAIN else [])
+    added = 0
+    for root in roots:
+        for species, paths in labelled_files(root).items():
+            new = [p for p in paths if not gallery.has(source_key(p))]
+            if not new:
+                continue
+            vectors = embed_images(embed, new)
+            added += gallery.add(species, vectors, [source_key(p) for p in new])
+    return added
+
+
+def add_species_images(gallery, embed, species, images, gallery_dir=GALLERY_DIR):
+    """
+    Stores uploaded images under gallery/<species>/ (so a rebuild keeps them)
+    and adds their embeddings. `images` is a list of (name, bytes).
+    """
+    species_dir = os.path.join(gallery_dir, species)
+    os.makedirs(species_dir, exist_ok=True)
+    paths = []
+    for name, data in images:
+        ext = os.path.splitext(name or "")[1].lower()
+        path = os.path.join(species_dir, hashlib.sha256(data).hexdigest()[:16] + (ext if ext in IMAGE_EXTENSIONS else ".jpg"))
+        with open(path, "wb") as f:
+            f.write(data)
+        paths.append(path)
+    vectors = embed_images(embed, [BytesIO(data) for _, data in images])
+    return gallery.add(species, vectors, [source_key(p) for p in paths])
+
+
+def model_version(model_path=MODEL_PATHS["keras"]):
+    return file_digest(model_path)
+
+
+def open_gallery(backend=None, index_dir=INDEX_DIR):
+    """(gallery, embed) ready to serve: the saved index topped up with any new drop-in images."""
+    embed = load_embedder(backend)
+    gallery = Gallery.load(index_dir, version=model_version())
+    added = sync(gallery, embed)
+    if added:
+        gallery.save(index_dir)
+    print(f"✅ Gallery ready: {len(gallery)} images of {len(set(gallery.labels))} species ({added} newly embedded)")
+    return gallery, embed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Embed all gallery images and save the index")
+    build.add_argument("--fresh", action="store_true", help="Ignore the saved index and re-embed everything")
+    query = sub.add_parser("query", help="Top matches for image files")
+    query.add_argument("images", nargs="+")
+    query.add_argument("-k", type=int, default=TOP_K)
+    args = parser.parse_args()
+
+    embed = load_embedder()
+    if args.command == "build":
+        gallery = Gallery(version=model_version()) if args.fresh else Gallery.load(version=model_version())
+        start = time.perf_counter()
+        added = sync(gallery, embed)
+        gallery.save()
+        print(json.dumps({"added": added, "seconds": round(time.perf_counter() - start, 2),
+                          **gallery.stats(), "per_species": gallery.species_counts()}, indent=2))
+    else:
+        gallery = Gallery.load(version=model_version())
+        for path, vector in zip(args.images, embed_images(embed, args.images)):
+            print(json.dumps({"image": path, **gallery.identify(vector, k=args.k)}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,532 @@
+"""
+One process owns the model; uvicorn workers hand it preprocessed images
+through shared memory.
+
+    python inference_server.py --http-workers 4 --port 8001
+
+loads the model, listens on a Unix socket and then runs
+`uvicorn main:app --workers 4` with FISH_INFERENCE_SOCKET pointing at
+it. Only this process imports TensorFlow and holds fish_classifier.h5;
+an HTTP worker is a plain FastAPI process (upload, decode, batching).
+Workers can also be started separately once the server is up:
+
+    python inference_server.py --socket /tmp/fish-inference.sock
+    FISH_INFERENCE_SOCKET=/tmp/fish-inference.sock uvicorn main:app --workers 4
+
+Transport, per HTTP worker:
+
+    shared memory ring   SLOTS x (SLOT_BATCH uint8 224x224x3 inputs +
+                         SLOT_BATCH float32 outputs), created by the worker
+    Unix socket          JSON-line handshake, then 12-byte messages:
+                         (slot, count, op) -> (slot, count, status)
+
+A worker copies a batch into a free slot and sends the slot number. The
+server gathers ready slots from all workers into one forward pass (up to
+--max-batch images, waiting at most --max-wait-ms), writes the results
+back into each slot and answers. Pixels never go through pickle or the
+socket.
+
+Besides class probabilities (OP_PREDICT) the server answers gallery
+embeddings (OP_EMBED) from the same keras model, so the gallery doesn't
+load a second copy per worker. --threads runs that many forward passes
+at once on the one model (TensorFlow releases the GIL); --cpus pins the
+server to cores (e.g. 0-3), leaving the rest to the HTTP workers.
+"""
+import argparse
+import json
+import os
+import queue
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from preprocess import INPUT_SHAPE, InputBuffer
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SOCKET = "/tmp/fish-inference.sock"
+
+# --- CLIENT CONFIG (HTTP workers) ---
+SOCKET_PATH = os.getenv("FISH_INFERENCE_SOCKET")
+RING_SLOTS = int(os.getenv("FISH_INFERENCE_SLOTS", "8"))
+SLOT_BATCH = int(os.getenv("FISH_INFERENCE_SLOT_BATCH", "16"))  # keep >= CUSTOM_MODEL_MAX_BATCH
+CONNECT_TIMEOUT = float(os.getenv("FISH_INFERENCE_CONNECT_TIMEOUT", "120"))  # server may still be loading
+CALL_TIMEOUT = float(os.getenv("FISH_INFERENCE_TIMEOUT", "30"))
+RECONNECT_TIMEOUT = 2.0  # once serving, a missing server fails the request instead of hanging it
+
+OP_PREDICT, OP_EMBED = 0, 1
+STATUS_OK, STATUS_FAILED, STATUS_BAD_REQUEST, STATUS_DISCONNECTED = 0, 1, 2, -1
+MESSAGE = struct.Struct("!IIi")
+
+
+class Ring:
+    """Per-slot input/output views over one shared memory block."""
+
+    def __init__(self, shm, slots, slot_batch, out_dim):
+        self.shm = shm
+        self.slots = slots
+        self.slot_batch = slot_batch
+        in_bytes = slot_batch * int(np.prod(INPUT_SHAPE))
+        slot_bytes = self.nbytes(1, slot_batch, out_dim)
+        self.inputs = [
+            np.ndarray((slot_batch,) + INPUT_SHAPE, np.uint8, buffer=shm.buf, offset=i * slot_bytes)
+            for i in range(slots)
+        ]
+        self.outputs = [
+            np.ndarray((slot_batch, out_dim), np.float32, buffer=shm.buf, offset=i * slot_bytes + in_bytes)
+            for i in range(slots)
+        ]
+
+    @staticmethod
+    def nbytes(slots, slot_batch, out_dim):
+        return slots * slot_batch * (int(np.prod(INPUT_SHAPE)) + out_dim * 4)
+
+    def close(self, unlink=False):
+        # The views must go before the mapping can be closed
+        self.inputs = self.outputs = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # a forward pass still holds a view; the mapping goes with it
+        if unlink:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def attach_shm(name):
+    """Opens a worker's block without letting this process's resource tracker unlink it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+def recv_exact(sock, n):
+    data = bytearray()
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+def recv_line(sock):
+    data = bytearray()
+    while not data.endswith(b"\n"):
+        chunk = sock.recv(1)
+        if not chunk:
+            return None
+        data += chunk
+    return json.loads(data)
+
+
+def send_line(sock, obj):
+    sock.sendall(json.dumps(obj).encode() + b"\n")
+
+
+# --- SERVER SIDE ---
+class _Client:
+    def __init__(self, conn, ring):
+        self.conn = conn
+        self.ring = ring
+        self.send_lock = threading.Lock()
+        self.closed = False
+
+    def reply(self, slot, count, status):
+        if self.closed:
+            return
+        try:
+            with self.send_lock:
+                self.conn.sendall(MESSAGE.pack(slot, count, status))
+        except OSError:
+            self.closed = True
+
+
+class InferenceServer:
+    def __init__(self, backend, socket_path=DEFAULT_SOCKET, max_batch=32, max_wait_ms=5, threads=1):
+        self.backend = backend
+        self.socket_path = socket_path
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000
+        self.threads = max(1, int(threads))
+        self.queues = {OP_PREDICT: queue.Queue(), OP_EMBED: queue.Queue()}
+        self.fns = {OP_PREDICT: backend.predict, OP_EMBED: None}
+
+        # Also a warm-up: the first forward pass is the slow one
+        probe = np.zeros((1,) + INPUT_SHAPE, np.float32)
+        self.num_classes = int(np.asarray(backend.predict(probe)).shape[-1])
+        self.embed_dim = 0
+        if getattr(backend, "name", None) == "keras":
+            try:
+                from gallery import keras_embedder
+
+                self.fns[OP_EMBED] = keras_embedder(backend.model)
+                self.embed_dim = int(self.fns[OP_EMBED](probe).shape[-1])
+            except Exception as e:
+                print(f"⚠️ No embedding output, gallery requests will fail: {e}")
+        self.clients = 0
+        self.requests = 0
+        self.batches = 0
+        self.images = 0
+
+    def hello(self):
+        return {
+            "backend": self.backend.name,
+            "model_path": self.backend.model_path,
+            "num_classes": self.num_classes,
+            "embed_dim": self.embed_dim,
+        }
+
+    def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        listener.listen(64)
+
+        for op in self.queues:
+            for i in range(self.threads if op == OP_PREDICT else 1):
+                threading.Thread(target=self._run, args=(op,), name=f"inference-{op}-{i}", daemon=True).start()
+        print(f"✅ Inference server ({self.backend.name}, {self.num_classes} classes) on {self.socket_path}")
+
+        while True:
+            conn, _ = listener.accept()
+            threading.Thread(target=self._serve_client, args=(conn,), daemon=True).start()
+
+    def _serve_client(self, conn):
+        client = None
+        try:
+            send_line(conn, self.hello())
+            setup = recv_line(conn)
+            if setup is None:
+                return
+            ring = Ring(attach_shm(setup["shm"]), setup["slots"], setup["slot_batch"],
+                        max(self.num_classes, self.embed_dim))
+            client = _Client(conn, ring)
+            self.clients += 1
+            while True:
+                message = recv_exact(conn, MESSAGE.size)
+                if message is None:
+                    break
+                slot, count, op = MESSAGE.unpack(message)
+                if slot >= ring.slots or not 0 < count <= ring.slot_batch or self.fns.get(op) is None:
+                    client.reply(slot, count, STATUS_BAD_REQUEST)
+                    continue
+                self.requests += 1
+                self.queues[op].put((client, slot, count))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ Inference client dropped: {e}")
+        finally:
+            conn.close()
+            if client is not None:
+                client.closed = True
+                self.clients -= 1
+                client.ring.close()
+
+    def _collect(self, op, first):
+        items, total = [first], first[2]
+        deadline = time.monotonic() + self.max_wait
+        while total < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self.queues[op].get(timeout=remaining) if remaining > 0 else self.queues[op].get_nowait()
+            except queue.Empty:
+                break
+            items.append(item)
+            total += item[2]
+        return items, total
+
+    def _run(self, op):
+        buffer = InputBuffer(self.max_batch)
+        fn = self.fns[op]
+        while True:
+            items, total = self._collect(op, self.queues[op].get())
+            # Hold on to the views: a client that disconnects now can't pull them away mid-copy
+            live = [(client, slot, count, client.ring.inputs, client.ring.outputs) for client, slot, count in items]
+            live = [item for item in live if not item[0].closed and item[3] is not None]
+            if not live:
+                continue
+            try:
+                batch = buffer.batch(sum(item[2] for item in live))
+                pos = 0
+                for _, slot, count, inputs, _ in live:
+                    batch[pos:pos + count] = inputs[slot][:count]
+                    pos += count
+                out = np.asarray(fn(batch))
+                pos = 0
+                for _, slot, count, _, outputs in live:
+                    outputs[slot][:count, :out.shape[1]] = out[pos:pos + count]
+                    pos += count
+                status = STATUS_OK
+            except Exception as e:
+                print(f"❌ Inference batch failed: {e}")
+                status = STATUS_FAILED
+            self.batches += 1
+            self.images += total
+            for client, slot, count, _, _ in live:
+                client.reply(slot, count, status)
+
+    def stats(self):
+        return {"clients": self.clients, "requests": self.requests, "batches": self.batches, "images": self.images}
+
+
+# --- CLIENT SIDE (HTTP workers) ---
+class _Connection:
+    """
+    One socket and its shared memory ring. A reconnect retires the old
+    connection; its ring is closed and unlinked only once the last call
+    still using it has finished, never under a running call.
+    """
+
+    def __init__(self, sock, ring, slots):
+        self.sock = sock
+        self.ring = ring
+        self.send_lock = threading.Lock()
+        # Guards waiters, users and the reply/timeout handoff of a slot
+        self.lock = threading.Lock()
+        self.free = queue.Queue()
+        for slot in range(slots):
+            self.free.put(slot)
+        self.waiters = {}
+        self.users = 0
+        self.broken = False
+        self.retired = False
+        threading.Thread(target=self._read_replies, name="inference-replies", daemon=True).start()
+
+    def _read_replies(self):
+        while True:
+            try:
+                message = recv_exact(self.sock, MESSAGE.size)
+            except OSError:
+                message = None
+            if message is None:
+                break
+            slot, _, status = MESSAGE.unpack(message)
+            with self.lock:
+                waiter = self.waiters.pop(slot, None)
+                if waiter is None:
+                    continue
+                waiter["status"] = status
+                if waiter["abandoned"]:
+                    self.free.put(slot)  # the caller timed out; the slot is safe to reuse now
+                waiter["event"].set()
+        # Server gone: wake everyone still waiting on this connection
+        with self.lock:
+            self.broken = True
+            for waiter in self.waiters.values():
+                waiter["status"] = STATUS_DISCONNECTED
+                waiter["event"].set()
+            self.waiters.clear()
+
+    def wait(self, slot, waiter, timeout):
+        """True once answered; False if the caller gave up (the reader then frees the slot)."""
+        if waiter["event"].wait(timeout):
+            return True
+        with self.lock:
+            # A reply that lands right now must either see `abandoned` or be seen here
+            if waiter["event"].is_set():
+                return True
+            waiter["abandoned"] = True
+            return False
+
+    def register(self, slot):
+        waiter = {"event": threading.Event(), "status": None, "abandoned": False}
+        with self.lock:
+            if self.broken:
+                raise RuntimeError("Inference server connection lost")
+            self.waiters[slot] = waiter
+        return waiter
+
+    def acquire(self):
+        with self.lock:
+            self.users += 1
+
+    def release(self):
+        with self.lock:
+            self.users -= 1
+            idle = self.retired and self.users == 0
+        if idle:
+            self.ring.close(unlink=True)
+
+    def retire(self):
+        with self.lock:
+            if self.retired:
+                return
+            self.retired = True
+            idle = self.users == 0
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+        if idle:
+            self.ring.close(unlink=True)
+
+
+class RemoteModel:
+    """A backends.py-style model whose forward passes run in the inference server."""
+
+    def __init__(self, socket_path=None, slots=RING_SLOTS, slot_batch=SLOT_BATCH):
+        self.socket_path = socket_path or SOCKET_PATH or DEFAULT_SOCKET
+        self.slots = slots
+        self.slot_batch = slot_batch
+        self._lock = threading.Lock()
+        self._closed = False
+        self.calls = 0
+        self.images = 0
+        self.reconnects = 0
+        self.timeouts = 0
+        self._conn = self._connect(CONNECT_TIMEOUT)
+        self.embed = self._embed if self.embed_dim else None
+
+    def _connect(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.socket_path)
+                hello = recv_line(sock)
+                if hello is not None:
+                    break
+            except OSError:
+                pass
+            sock.close()
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"No inference server at {self.socket_path}")
+            time.sleep(0.5)
+
+        self.name = hello["backend"]
+        self.model_path = hello["model_path"]
+        self.num_classes = hello["num_classes"]
+        self.embed_dim = hello["embed_dim"]
+        out_dim = max(self.num_classes, self.embed_dim)
+        shm = shared_memory.SharedMemory(create=True, size=Ring.nbytes(self.slots, self.slot_batch, out_dim))
+        ring = Ring(shm, self.slots, self.slot_batch, out_dim)
+        send_line(sock, {"shm": shm.name, "slots": self.slots, "slot_batch": self.slot_batch})
+        return _Connection(sock, ring, self.slots)
+
+    def _checkout(self):
+        """The live connection (reconnecting if the server went away), held until release()."""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Inference client is closed")
+            if self._conn.broken:
+                self._conn.retire()
+                self._conn = self._connect(RECONNECT_TIMEOUT)
+                self.reconnects += 1
+            conn = self._conn
+            conn.acquire()
+        return conn
+
+    def _call(self, op, batch, dim):
+        conn = self._checkout()
+        try:
+            out = np.empty((len(batch), dim), np.float32)
+            for start in range(0, len(batch), self.slot_batch):
+                chunk = batch[start:start + self.slot_batch]
+                slot = conn.free.get(timeout=CALL_TIMEOUT)
+                release = True
+                try:
+                    # uint8 pixels: preprocess only ever writes 0..255 values
+                    np.copyto(conn.ring.inputs[slot][:len(chunk)], chunk, casting="unsafe")
+                    waiter = conn.register(slot)
+                    with conn.send_lock:
+                        conn.sock.sendall(MESSAGE.pack(slot, len(chunk), op))
+                    if not conn.wait(slot, waiter, CALL_TIMEOUT):
+                        release = False
+                        self.timeouts += 1
+                        raise TimeoutError("Inference server did not answer in time")
+                    if waiter["status"] != STATUS_OK:
+                        raise RuntimeError(f"Inference server failed this batch (status {waiter['status']})")
+                    out[start:start + len(chunk)] = conn.ring.outputs[slot][:len(chunk), :dim]
+                finally:
+                    if release:
+                        conn.free.put(slot)
+        finally:
+            conn.release()
+        self.calls += 1
+        self.images += len(batch)
+        return out
+
+    def predict(self, batch):
+        return self._call(OP_PREDICT, batch, self.num_classes)
+
+    def _embed(self, batch):
+        return self._call(OP_EMBED, batch, self.embed_dim)
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._conn.retire()  # the ring goes once in-flight calls are done
+
+    def stats(self):
+        return {"calls": self.calls, "images": self.images, "reconnects": self.reconnects, "timeouts": self.timeouts}
+
+
+def parse_cpus(value):
+    """'0-3,6' -> {0, 1, 2, 3, 6}"""
+    cpus = set()
+    for part in value.split(","):
+        start, _, end = part.partition("-")
+        cpus.update(range(int(start), int(end or start) + 1))
+    return cpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", default=DEFAULT_SOCKET)
+    parser.add_argument("--backend", default=None, help="keras/tflite/onnx (default FISH_MODEL_BACKEND)")
+    parser.add_argument("--max-batch", type=int, default=32, help="Images per forward pass across all workers")
+    parser.add_argument("--max-wait-ms", type=float, default=5)
+    parser.add_argument("--threads", type=int, default=1, help="Concurrent forward passes")
+    parser.add_argument("--cpus", help="Pin the server to these cores, e.g. 0-3")
+    parser.add_argument("--http-workers", type=int, default=0, help="Also run uvicorn main:app with this many workers")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    args = parser.parse_args()
+
+    if args.cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, parse_cpus(args.cpus))
+
+    from backends import load_backend
+
+    print(f"🔄 Loading model for the inference server (pid {os.getpid()})")
+    server = InferenceServer(load_backend(args.backend), args.socket, args.max_batch, args.max_wait_ms, args.threads)
+
+    # `kill` stops the HTTP workers too, like Ctrl+C
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    http = None
+    if args.http_workers:
+        env = dict(os.environ, FISH_INFERENCE_SOCKET=args.socket)
+        http = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", args.host, "--port", str(args.port),
+             "--workers", str(args.http_workers)],
+            cwd=os.path.dirname(BASE_DIR), env=env
+        )
+        print(f"✅ {args.http_workers} HTTP workers on port {args.port} (pid {http.pid})")
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        if http is not None:
+            http.terminate()
+            http.wait(10)
+        print(f"🔄 Inference server stopped: {json.dumps(server.stats())}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Allocation-light image preprocessing for the fish classifier.
+
+The old path was Image.open -> convert("RGB") -> resize -> np.array ->
+np.expand_dims, which decodes phone photos at full resolution and makes
+several full-frame copies. Here:
+
+  * JPEGs are opened with draft(), so libjpeg decodes straight to the
+    smallest DCT scale (1/2, 1/4, 1/8) that is still >= 224x224.
+  * Other formats use resize(reducing_gap=...) to shrink in cheap steps.
+  * The final 224x224 pixels are written into a caller-provided slot of a
+    preallocated float32 batch buffer instead of a fresh array.
+
+Draft decoding changes pixel values very slightly compared with a full
+decode; run export_model.py's parity check after switching if in doubt.
+"""
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+
+IMG_SIZE = 224
+INPUT_SHAPE = (IMG_SIZE, IMG_SIZE, 3)
+REDUCING_GAP = 3.0
+# Largest per-thread buffer kept between calls (~0.6 MB per slot); bigger batches get a one-off array
+MAX_RETAINED_BATCH = int(os.getenv("CUSTOM_MODEL_MAX_BATCH", "16"))
+
+
+def open_reduced(source):
+    """Opens `source` (path or file object) already reduced towards 224x224."""
+    img = Image.open(source)
+    if img.format == "JPEG":
+        img.draft("RGB", (IMG_SIZE, IMG_SIZE))
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    if img.size != (IMG_SIZE, IMG_SIZE):
+        img = img.resize((IMG_SIZE, IMG_SIZE), reducing_gap=REDUCING_GAP)
+    return img
+
+
+def decode_into(source, out):
+    """Decodes one image into `out`, a (224, 224, 3) slot of a batch buffer."""
+    out[...] = np.asarray(open_reduced(source))
+    return out
+
+
+def decode(source):
+    """Decodes one image into a new uint8 (224, 224, 3) array."""
+    return np.asarray(open_reduced(source))
+
+
+class InputBuffer:
+    """
+    A preallocated float32 (capacity, 224, 224, 3) model input that is
+    reused across batches. It grows up to `max_capacity` slots; a batch
+    larger than that gets a temporary array that is not kept.
+    """
+
+    def __init__(self, capacity=1, max_capacity=None):
+        self.max_capacity = max_capacity
+        if max_capacity:
+            capacity = min(capacity, max_capacity)
+        self.array = np.empty((max(1, capacity),) + INPUT_SHAPE, dtype=np.float32)
+
+    def batch(self, n):
+        """Returns a view over the first `n` slots, growing if needed."""
+        if n > len(self.array):
+            if self.max_capacity and n > self.max_capacity:
+                return np.empty((n,) + INPUT_SHAPE, dtype=np.float32)
+            self.array = np.empty((n,) + INPUT_SHAPE, dtype=np.float32)
+        return self.array[:n]
+
+
+_local = threading.local()
+
+
+def thread_buffer(n):
+    """
+    A per-thread InputBuffer, so request threads never share slots. Each
+    thread keeps at most MAX_RETAINED_BATCH slots, so one large upload
+    doesn't pin a large buffer to every pool thread it ever ran on.
+    """
+    buffer = getattr(_local, "buffer", None)
+    if buffer is None:
+        buffer = _local.buffer = InputBuffer(n, max_capacity=MAX_RETAINED_BATCH)
+    return buffer.batch(n)
@@ -0,0 +1,13 @@
+"""
+Puts backend/shared on sys.path, so `import fishapp` works both from
+backend-ml/main.py and from scripts run inside code_a_thon/.
+
+    import shared  # noqa: F401
+    from fishapp.metrics import stage
+"""
+import os
+import sys
+
+SHARED_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "shared")
+if SHARED_DIR not in sys.path:
+    sys.path.append(SHARED_DIR)
@@ -37,33 +37,89 @@
 # print("Confidence:", round(confidence * 100, 2), "%")
 
 
-import tensorflow as tf
 import numpy as np
-from PIL import Image
 import json
 import os
 
+import shared  # noqa: F401
+import preprocess
+from backends import MODEL_PATHS, DEFAULT_BACKEND, file_digest, load_backend
+from fishapp.metrics import stage
+
 # --- 1. SETUP PATHS DYNAMICALLY ---
 # Get the directory where THIS file (test_single_image.py) is located
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-MODEL_PATH = os.path.join(BASE_DIR, "model", "fish_classifier.h5")
+MODEL_PATH = MODEL_PATHS.get(DEFAULT_BACKEND, MODEL_PATHS["keras"])
 INDICES_PATH = os.path.join(BASE_DIR, "model", "class_indices.json")
 
 # --- 2. LOAD MODEL (Global Load for Speed) ---
-print(f"🔄 Loading model from: {MODEL_PATH}")
+# FISH_MODEL_BACKEND=tflite/onnx serves without importing TensorFlow at all;
+# FISH_INFERENCE_SOCKET uses the one model in inference_server.py instead of loading a copy
+INFERENCE_SOCKET = os.getenv("FISH_INFERENCE_SOCKET")
+if INFERENCE_SOCKET:
+    print(f"🔄 Connecting to inference server at: {INFERENCE_SOCKET}")
+else:
+    print(f"🔄 Loading {DEFAULT_BACKEND} model from: {MODEL_PATH}")
 try:
-    model = tf.keras.models.load_model(MODEL_PATH)
+    if INFERENCE_SOCKET:
+        from inference_server import RemoteModel
+        model = RemoteModel(INFERENCE_SOCKET)
+    else:
+        model = load_backend()
     with open(INDICES_PATH) as f:
         class_indices = json.load(f)
     # reverse mapping: index -> class name
     labels = {v: k for k, v in class_indices.items()}
+    # Retraining changes the weights file, which changes every cache key
+    MODEL_VERSION = f"{model.name}:{file_digest(model.model_path)}:{file_digest(INDICES_PATH)}"
     print("✅ Model loaded successfully")
 except Exception as e:
     print(f"❌ Error loading model: {e}")
     model = None
     labels = {}
+    MODEL_VERSION = None
+
+# --- 3. PREDICTION FUNCTIONS ---
+IMG_SIZE = preprocess.IMG_SIZE
+
+
+def load_image_array(image_file):
+    """
+    Accepts a file path, file-like object or FastAPI UploadFile and returns
+    a (224, 224, 3) array ready to be stacked into a batch.
+    """
+    if hasattr(image_file, "file"):
+        image_file = image_file.file  # Handle FastAPI UploadFile
+    with stage("decode"):
+        return preprocess.decode(image_file)
+
+
+def format_prediction(probs):
+    """Turns one row of softmax output into the response dictionary."""
+    predicted_index = int(np.argmax(probs))
+    confidence = float(np.max(probs))
+    predicted_class = labels.get(predicted_index, "Unknown")
+
+    return {
+        "status": "success",
+        "predicted_fish": predicted_class,
+        "confidence_score": round(confidence * 100, 2)
+    }
+
+
+def predict_batch(batch):
+    """
+    Runs one forward pass over a stacked (N, 224, 224, 3) batch and returns
+    one result dictionary per row, in the same order.
+    """
+    if model is None:
+        raise RuntimeError("Model not loaded")
+
+    with stage("forward", batch=len(batch)):
+        preds = model.predict(batch)
+    return [format_prediction(row) for row in preds]
+
 
-# --- 3. PREDICTION FUNCTION ---
 def predict_fish_from_image(image_file):
     """
     Accepts a PIL Image or file path, returns dictionary result.
@@ -72,28 +128,49 @@ def predict_fish_from_image(image_file):
         return {"error": "Model not loaded"}
 
     try:
-        # Load Image
-        if isinstance(image_file, str):
-            img = Image.open(image_file).convert("RGB")
-        else:
-            img = Image.open(image_file.file).convert("RGB") # Handle FastAPI UploadFile
-
-        # Preprocess
-        img = img.resize((224, 224))
-        img_array = np.array(img)
-        img_array = np.expand_dims(img_array, axis=0)
-
-        # Predict
-        preds = model.predict(img_array)
-        predicted_index = np.argmax(preds)
-        confidence = float(np.max(preds))
-        predicted_class = labels.get(predicted_index, "Unknown")
-
-        return {
-            "status": "success",
-            "predicted_fish": predicted_class,
-            "confidence_score": round(confidence * 100, 2)
-        }
-    
+        img_array = np.expand_dims(load_image_array(image_file), axis=0)
+        return predict_batch(img_array)[0]
+
     except Exception as e:
-        return {"status": "error", "message": str(e)}
\ No newline at end of file
+        return {"status": "error", "message": str(e)}
+
+
+def predict_many(image_files):
+    """
+    Decodes every image, stacks the good ones into one tensor and makes a
+    single forward pass. Returns one result per input, in input order;
+    images that fail to decode get an error entry instead.
+    """
+    results = [None] * len(image_files)
+    # Decode straight into this thread's reusable model input buffer
+    batch = preprocess.thread_buffer(len(image_files))
+    positions = []
+
+    for i, image_file in enumerate(image_files):
+        try:
+            if hasattr(image_file, "file"):
+                image_file = image_file.file
+            preprocess.decode_into(image_file, batch[len(positions)])
+            positions.append(i)
+        except Exception as e:
+            results[i] = {"status": "error", "message": str(e)}
+
+    if positions:
+        try:
+            for i, result in zip(positions, predict_batch(batch[:len(positions)])):
+                results[i] = result
+        except Exception as e:
+            for i in positions:
+                results[i] = {"status": "error", "message": str(e)}
+
+    return results
+
+
+def iter_predictions(image_files, chunk_size=16):
+    """
+    Same as predict_many() but works through the images chunk by chunk and
+    yields results as soon as each chunk is done, so a large haul is never
+    held in memory as one tensor.
+    """
+    for start in range(0, len(image_files), chunk_size):
+        yield from predict_many(image_files[start:start + chunk_size])
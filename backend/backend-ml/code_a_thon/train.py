@@ -1,127 +1,210 @@
+"""
+Train the fish classifier: EfficientNetB0 with a new head, then fine-tune.
+
+Run from this folder:
+
+    python train.py                              # resized images cached in memory
+    python train.py --cache-dir /tmp/fish-cache  # cached on disk (datasets bigger than RAM)
+    python train.py --input-only                 # just time the input pipeline
+    python train.py --feature-cache              # phase 1 on cached embeddings (fast on CPU)
+
+Input comes from the tf.data pipeline in train_input.py. Training
+images/sec is printed every epoch and summarised at the end. Delete the
+--cache-dir folder after changing the dataset.
+
+With --feature-cache, phase 1 (frozen backbone) trains the head on
+pooled embeddings computed once by feature_cache.py, then copies the
+head's weights onto the full model before fine-tuning.
+"""
+import argparse
+import json
+import os
+
 import tensorflow as tf
 from tensorflow.keras.applications import EfficientNetB0
 from tensorflow.keras.layers import Dense, GlobalAveragePooling2D, Dropout
 from tensorflow.keras.models import Model
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
-import json
-import os
+
+from dataset_index import class_indices_from_dir
+from feature_cache import FEATURES_DIR, cached_features
+from preprocess import IMG_SIZE
+from train_input import ThroughputLogger, make_dataset, time_pipeline
 
 # -------------------------
 # Basic config
 # -------------------------
-IMG_SIZE = 224
 BATCH_SIZE = 32
 EPOCHS = 10
-
-TRAIN_DIR = "datasets/train"
-VAL_DIR = "datasets/valid"
-
-# -------------------------
-# Data generators
-# Only folders are treated as classes
-# Loose files + XML are ignored
-# -------------------------
-train_gen = ImageDataGenerator(
-    rotation_range=25,
-    width_shift_range=0.1,
-    height_shift_range=0.1,
-    zoom_range=0.2,
-    horizontal_flip=True
-)
-
-val_gen = ImageDataGenerator()
-
-
-train_data = train_gen.flow_from_directory(
-    TRAIN_DIR,
-    target_size=(IMG_SIZE, IMG_SIZE),
-    batch_size=BATCH_SIZE,
-    class_mode="categorical"
-)
-
-val_data = val_gen.flow_from_directory(
-    VAL_DIR,
-    target_size=(IMG_SIZE, IMG_SIZE),
-    batch_size=BATCH_SIZE,
-    class_mode="categorical"
-)
-
-NUM_CLASSES = train_data.num_classes
-print("Number of classes:", NUM_CLASSES)
-
-# -------------------------
-# Model: EfficientNetB0
-# -------------------------
-base_model = EfficientNetB0(
-    weights="imagenet",
-    include_top=False,
-    input_shape=(IMG_SIZE, IMG_SIZE, 3)
-)
-
-# Freeze base model
-base_model.trainable = False
-
-x = base_model.output
-x = GlobalAveragePooling2D()(x)
-x = Dense(256, activation="relu")(x)
-x = Dropout(0.25)(x)
-outputs = Dense(NUM_CLASSES, activation="softmax")(x)
-
-model = Model(inputs=base_model.input, outputs=outputs)
-
-# -------------------------
-# Compile
-# -------------------------
-model.compile(
-    optimizer=tf.keras.optimizers.Adam(learning_rate=3e-5),
-    loss="categorical_crossentropy",
-    metrics=["accuracy"]
-)
-
-model.summary()
-
-# -------------------------
-# Train
-# -------------------------
-history = model.fit(
-    train_data,
-    validation_data=val_data,
-    epochs=EPOCHS
-)
-
-# -------------------------
-# Fine-tuning
-# -------------------------
-base_model.trainable = True
-
-# Freeze only early layers
-for layer in base_model.layers[:100]:
-    layer.trainable = False
-
-
-model.compile(
-    optimizer=tf.keras.optimizers.Adam(learning_rate=1e-4),
-    loss="categorical_crossentropy",
-    metrics=["accuracy"]
-)
-
-fine_tune_epochs = 20
-
-model.fit(
-    train_data,
-    validation_data=val_data,
-    epochs=fine_tune_epochs
-)
-
-
-# -------------------------
-# Save model
-# -------------------------
-os.makedirs("model", exist_ok=True)
-model.save("model/fish_classifier.h5")
-
-# Save class indices (VERY IMPORTANT)
-with open("model/class_indices.json", "w") as f:
-    json.dump(train_data.class_indices, f)
-
-print("Training complete. Model saved.")
+FINE_TUNE_EPOCHS = 20
+
+# Head-only training on cached embeddings (--feature-cache)
+HEAD_EPOCHS = 30
+HEAD_LEARNING_RATE = 1e-3
+BACKBONE = "EfficientNetB0/imagenet"
+HEAD_LAYERS = ("head_dense", "head_dropout", "head_output")
+
+# Splits under datasets/
+TRAIN_DIR = "train"
+VAL_DIR = "valid"
+
+
+def build_head(x, num_classes):
+    # Named so a head trained on embeddings can be copied onto the full model
+    x = Dense(256, activation="relu", name="head_dense")(x)
+    x = Dropout(0.25, name="head_dropout")(x)
+    return Dense(num_classes, activation="softmax", name="head_output")(x)
+
+
+def build_model(num_classes):
+    base_model = EfficientNetB0(
+        weights="imagenet",
+        include_top=False,
+        input_shape=(IMG_SIZE, IMG_SIZE, 3)
+    )
+
+    # Freeze base model
+    base_model.trainable = False
+
+    x = GlobalAveragePooling2D(name="head_pool")(base_model.output)
+    outputs = build_head(x, num_classes)
+
+    return base_model, Model(inputs=base_model.input, outputs=outputs)
+
+
+def train_head_on_features(model, class_indices, args):
+    """Phase 1 on cached embeddings; the trained head is copied into `model`."""
+    num_classes = len(class_indices)
+    # Same graph (and frozen BatchNorm) as phase 1 would run, cut at the pooling layer
+    extractor = Model(inputs=model.input, outputs=model.get_layer("head_pool").output)
+    train_features = cached_features(extractor, TRAIN_DIR, class_indices, BACKBONE, root=args.features_dir)
+    val_features = cached_features(extractor, VAL_DIR, class_indices, BACKBONE, root=args.features_dir)
+
+    inputs = tf.keras.Input(shape=(train_features.embeddings.shape[1],))
+    head = Model(inputs=inputs, outputs=build_head(inputs, num_classes))
+    head.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=args.head_lr),
+        loss="categorical_crossentropy",
+        metrics=["accuracy"]
+    )
+
+    speed = ThroughputLogger(len(train_features), "head (cached)")
+    head.fit(
+        train_features.dataset(num_classes, args.batch_size, training=True),
+        validation_data=val_features.dataset(num_classes, args.batch_size),
+        epochs=args.head_epochs,
+        callbacks=[speed]
+    )
+
+    # Stitch the trained head back onto the backbone
+    for name in HEAD_LAYERS:
+        model.get_layer(name).set_weights(head.get_layer(name).get_weights())
+    return speed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--epochs", type=int, default=EPOCHS)
+    parser.add_argument("--fine-tune-epochs", type=int, default=FINE_TUNE_EPOCHS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--cache-dir", help="Cache resized images on disk here instead of in memory")
+    parser.add_argument("--input-only", action="store_true", help="Time the input pipeline and exit")
+    parser.add_argument("--feature-cache", action="store_true", help="Train the head on cached backbone embeddings")
+    parser.add_argument("--features-dir", default=FEATURES_DIR)
+    parser.add_argument("--head-epochs", type=int, default=HEAD_EPOCHS, help="Epochs with --feature-cache")
+    parser.add_argument("--head-lr", type=float, default=HEAD_LEARNING_RATE, help="Learning rate with --feature-cache")
+    args = parser.parse_args()
+
+    # -------------------------
+    # Data
+    # Only folders are treated as classes, numbered in sorted order
+    # (same as flow_from_directory). Loose files + XML are ignored.
+    # -------------------------
+    class_indices = class_indices_from_dir(TRAIN_DIR)
+    NUM_CLASSES = len(class_indices)
+    print("Number of classes:", NUM_CLASSES)
+
+    train_data, num_train = make_dataset(
+        TRAIN_DIR, class_indices, args.batch_size, training=True,
+        cache_dir=os.path.join(args.cache_dir, "train") if args.cache_dir else None
+    )
+    val_data, num_val = make_dataset(
+        VAL_DIR, class_indices, args.batch_size,
+        cache_dir=os.path.join(args.cache_dir, "valid") if args.cache_dir else None
+    )
+    print(f"Found {num_train} training and {num_val} validation images")
+
+    if args.input_only:
+        time_pipeline(train_data, num_train)
+        return
+
+    # -------------------------
+    # Model: EfficientNetB0
+    # -------------------------
+    base_model, model = build_model(NUM_CLASSES)
+
+    # -------------------------
+    # Compile
+    # -------------------------
+    model.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=3e-5),
+        loss="categorical_crossentropy",
+        metrics=["accuracy"]
+    )
+
+    model.summary()
+
+    # -------------------------
+    # Train
+    # -------------------------
+    if args.feature_cache:
+        head_speed = train_head_on_features(model, class_indices, args)
+        loss, accuracy = model.evaluate(val_data, verbose=0)
+        print(f"✅ Head stitched onto the backbone: val_accuracy={accuracy:.4f} val_loss={loss:.4f}")
+    else:
+        head_speed = ThroughputLogger(num_train, "head")
+        model.fit(
+            train_data,
+            validation_data=val_data,
+            epochs=args.epochs,
+            callbacks=[head_speed]
+        )
+
+    # -------------------------
+    # Fine-tuning
+    # -------------------------
+    base_model.trainable = True
+
+    # Freeze only early layers
+    for layer in base_model.layers[:100]:
+        layer.trainable = False
+
+    model.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=1e-4),
+        loss="categorical_crossentropy",
+        metrics=["accuracy"]
+    )
+
+    fine_tune_speed = ThroughputLogger(num_train, "fine-tune")
+    model.fit(
+        train_data,
+        validation_data=val_data,
+        epochs=args.fine_tune_epochs,
+        callbacks=[fine_tune_speed]
+    )
+
+    # -------------------------
+    # Save model
+    # -------------------------
+    os.makedirs("model", exist_ok=True)
+    model.save("model/fish_classifier.h5")
+
+    # Save class indices (VERY IMPORTANT)
+    with open("model/class_indices.json", "w") as f:
+        json.dump(class_indices, f)
+
+    print("Training speed:", json.dumps({"head": head_speed.summary(), "fine_tune": fine_tune_speed.summary()}))
+    print("Training complete. Model saved.")
+
+
+if __name__ == "__main__":
+    main()
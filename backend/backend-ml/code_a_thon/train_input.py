@@ -0,0 +1,135 @@
+"""
+tf.data input pipeline for train.py.
+
+Replaces ImageDataGenerator.flow_from_directory, which decoded, resized
+and augmented every JPEG in Python on one thread, every epoch:
+
+  * files are decoded and resized by parallel map() calls,
+  * the resized 224x224 uint8 images are cached after the first pass
+    (in memory, or in files under --cache-dir for big datasets),
+  * augmentation runs as Keras preprocessing layers on whole batches,
+  * batches are prefetched while the model trains on the previous one.
+
+Labels are one-hot, in the same class order as flow_from_directory, so
+the model and class_indices.json line up exactly as before.
+"""
+import os
+import time
+
+import tensorflow as tf
+from tensorflow.keras import layers
+
+from dataset_index import list_labelled_images
+from preprocess import IMG_SIZE
+
+AUTOTUNE = tf.data.AUTOTUNE
+SHUFFLE_BUFFER = 1000
+
+
+def build_augmentation():
+    # Same ranges as the old ImageDataGenerator (rotation 25°, shift 0.1,
+    # zoom 0.2, horizontal flip), with its "nearest" edge filling
+    return tf.keras.Sequential([
+        layers.RandomRotation(25 / 360, fill_mode="nearest"),
+        layers.RandomTranslation(0.1, 0.1, fill_mode="nearest"),
+        layers.RandomZoom(0.2, fill_mode="nearest"),
+        layers.RandomFlip("horizontal"),
+    ], name="augmentation")
+
+
+def load_resized(path, label):
+    """Decode one file and resize it to 224x224, kept as uint8 so the cache stays small."""
+    img = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+    img = tf.image.resize(img, (IMG_SIZE, IMG_SIZE), antialias=True)
+    return tf.saturate_cast(tf.round(img), tf.uint8), label
+
+
+def make_dataset(split, class_indices, batch_size, training=False, cache_dir=None, cache=True):
+    """
+    (dataset, number of images) for one split. EfficientNet rescales
+    internally, so images come out as float32 in 0..255 like before.
+    Pass cache=False for single passes (e.g. feature extraction).
+    """
+    items = list_labelled_images(split, class_indices)
+    if not items:
+        raise ValueError(f"No labelled images found for split '{split}'")
+    paths, labels = zip(*items)
+    num_classes = len(class_indices)
+
+    ds = tf.data.Dataset.from_tensor_slices((list(paths), list(labels)))
+    if training:
+        # Shuffle the file order once so the cache isn't grouped by class
+        ds = ds.shuffle(len(items), seed=0, reshuffle_each_iteration=False)
+    ds = ds.map(load_resized, num_parallel_calls=AUTOTUNE, deterministic=not training)
+
+    if cache and cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        ds = ds.cache(os.path.join(cache_dir, f"{os.path.basename(split.rstrip(os.sep))}-{IMG_SIZE}"))
+    elif cache:
+        ds = ds.cache()
+
+    if training:
+        ds = ds.shuffle(min(len(items), SHUFFLE_BUFFER), reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size)
+
+    augmentation = build_augmentation() if training else None
+
+    def finish(images, labels):
+        images = tf.cast(images, tf.float32)
+        if augmentation is not None:
+            images = augmentation(images, training=True)
+        return images, tf.one_hot(labels, num_classes)
+
+    ds = ds.map(finish, num_parallel_calls=AUTOTUNE)
+    return ds.prefetch(AUTOTUNE), len(items)
+
+
+class ThroughputLogger(tf.keras.callbacks.Callback):
+    """
+    Prints training images/sec per epoch. The clock stops at the last
+    training batch, so validation time isn't counted.
+    """
+
+    def __init__(self, num_images, label="train"):
+        super().__init__()
+        self.num_images = num_images
+        self.label = label
+        self.rates = []
+        self._start = None
+        self._last = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._start = self._last = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        self._last = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        elapsed = max(self._last - self._start, 1e-9)
+        rate = self.num_images / elapsed
+        self.rates.append(rate)
+        print(f"⏱️ {self.label} epoch {epoch + 1}: {rate:.1f} images/sec ({elapsed:.1f}s)")
+
+    def summary(self):
+        """First epoch (decode + fill the cache) vs the rest (served from the cache)."""
+        if not self.rates:
+            return {}
+        rest = sorted(self.rates[1:])
+        return {
+            "epochs": len(self.rates),
+            "first_epoch_images_per_sec": round(self.rates[0], 1),
+            "cached_images_per_sec": round(rest[len(rest) // 2], 1) if rest else None,
+        }
+
+
+def time_pipeline(ds, num_images, epochs=3):
+    """Iterate the dataset without a model: images/sec of the input pipeline alone."""
+    rates = []
+    for epoch in range(epochs):
+        start = time.perf_counter()
+        for _ in ds:
+            pass
+        elapsed = time.perf_counter() - start
+        rates.append(num_images / elapsed)
+        print(f"⏱️ input epoch {epoch + 1}: {rates[-1]:.1f} images/sec ({elapsed:.1f}s)")
+    return rates
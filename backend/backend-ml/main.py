@@ -1,7 +1,13 @@
+import asyncio
 import sys
 import os
-from fastapi import FastAPI, UploadFile, File
+import json
+from typing import List
+from io import BytesIO
+from fastapi import FastAPI, UploadFile, File, Query, Response
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 
 # --- SETUP APP ---
 app = FastAPI(title="Fish AI Master Backend")
@@ -33,15 +39,218 @@ try:
     # 1. Add folder to path (Make sure folder is named 'code_a_thon')
     sys.path.append(os.path.join(os.path.dirname(__file__), "code_a_thon"))
     
-    # 2. Import your updated script
+    # 2. Import your updated script (shared puts backend/shared on the path for fishapp)
+    import shared  # noqa: F401
     import test_single_image
+    from batching import BatchingEngine
+    from fishapp.result_cache import ResultCache, content_key
+    from cascade import Thresholds
+    from fishapp.metrics import ERRORS, cache_event, http_metrics_middleware, register_stats, render_metrics, stage
+
+    # 3. One shared engine gathers concurrent uploads into real model batches
+    engine = BatchingEngine(test_single_image.predict_batch)
+
+    # 4. Re-submitted photos are answered from a content-hash cache
+    prediction_cache = ResultCache(
+        "custom-model",
+        max_entries=int(os.getenv("CUSTOM_MODEL_CACHE_SIZE", "2048")),
+        ttl_seconds=float(os.getenv("CUSTOM_MODEL_CACHE_TTL", "86400")),
+        disk_dir=os.getenv("CUSTOM_MODEL_CACHE_DIR")
+    )
+
+    # 5. Per-class confidence thresholds (cascade.py calibrate) mark which answers are
+    #    good enough to skip a remote model; cached predictions are annotated on the way out
+    thresholds = Thresholds.load(version=test_single_image.MODEL_VERSION)
+
+    # 6. Prometheus /metrics: per-route latency plus decode/forward/batch stages
+    app.middleware("http")(http_metrics_middleware)
+    register_stats("custom_model_cache", prediction_cache.stats)
+    register_stats("cascade", thresholds.stats)
+    if hasattr(test_single_image.model, "stats"):
+        register_stats("inference_client", test_single_image.model.stats)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        body, content_type = render_metrics()
+        return Response(content=body, media_type=content_type)
+
+    @app.on_event("startup")
+    async def start_batching_engine():
+        engine.start()
+
+    @app.on_event("shutdown")
+    async def stop_batching_engine():
+        engine.stop()
+        if hasattr(test_single_image.model, "close"):
+            test_single_image.model.close()  # unlinks this worker's shared memory ring
 
     @app.post("/custom-model/predict")
     async def predict_custom(file: UploadFile = File(...)):
         """
         Receives an image file -> Sends to test_single_image.py -> Returns JSON
         """
-        return test_single_image.predict_fish_from_image(file)
+        if test_single_image.model is None:
+            return {"error": "Model not loaded"}
+
+        try:
+            with stage("upload_read"):
+                data = await file.read()
+            cache_key = content_key(data, test_single_image.MODEL_VERSION)
+            cached = await prediction_cache.aget(cache_key)
+            cache_event("custom-model", cached is not None)
+            if cached is not None:
+                return thresholds.annotate(cached)
+
+            # Decode off the event loop, then wait for the batcher to answer
+            img_array = await run_in_threadpool(test_single_image.load_image_array, BytesIO(data))
+            result = await engine.predict(img_array)
+            await prediction_cache.aset(cache_key, result)
+            return thresholds.annotate(result)
+        except Exception as e:
+            ERRORS.labels("custom_model_predict").inc()
+            return {"status": "error", "message": str(e)}
+
+    @app.get("/custom-model/cache/stats")
+    async def custom_cache_stats():
+        return prediction_cache.stats()
+
+    @app.get("/custom-model/thresholds")
+    async def custom_thresholds():
+        return {**thresholds.stats(), "default": thresholds.default, "per_class": thresholds.per_class,
+                "target_accuracy": thresholds.meta.get("target_accuracy")}
+
+    @app.post("/custom-model/predict-batch")
+    async def predict_custom_batch(
+        files: List[UploadFile] = File(...),
+        stream: bool = Query(False, description="Stream results back as NDJSON")
+    ):
+        """
+        Receives many image files -> one forward pass -> per-image results in input order
+        """
+        if test_single_image.model is None:
+            return {"error": "Model not loaded"}
+
+        streams = [f.file for f in files]
+
+        if not stream:
+            results = await run_in_threadpool(test_single_image.predict_many, streams)
+            return {
+                "status": "success",
+                "count": len(results),
+                "results": [
+                    {"index": i, "filename": f.filename, **thresholds.annotate(r)}
+                    for i, (f, r) in enumerate(zip(files, results))
+                ]
+            }
+
+        def ndjson_lines():
+            # Runs in Starlette's threadpool because it is a plain generator
+            results = test_single_image.iter_predictions(streams, engine.max_batch_size)
+            for i, (f, r) in enumerate(zip(files, results)):
+                yield json.dumps({"index": i, "filename": f.filename, **thresholds.annotate(r)}) + "\n"
+
+        return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+    # 7. Nearest-neighbour gallery: identifies any species with a few labelled
+    #    photos in code_a_thon/gallery/, no retraining (see gallery.py)
+    import gallery as species_gallery
+
+    gallery_state = {"gallery": None, "embed": None, "error": None}
+
+    def gallery_stats():
+        g = gallery_state["gallery"]
+        return g.stats() if g is not None else {"images": 0, "species_count": 0}
+
+    register_stats("gallery", gallery_stats)
+
+    async def load_gallery():
+        # Embedding a fresh gallery can take a while on CPU; serve predictions meanwhile
+        try:
+            g, embed = await run_in_threadpool(species_gallery.open_gallery, test_single_image.model)
+            gallery_state.update(gallery=g, embed=embed)
+        except Exception as e:
+            gallery_state["error"] = str(e)
+            print(f"⚠️ Gallery unavailable: {e}")
+
+    @app.on_event("startup")
+    async def start_gallery():
+        if os.getenv("GALLERY_ENABLED", "true").lower() not in ("1", "true", "yes"):
+            gallery_state["error"] = "Gallery disabled (GALLERY_ENABLED=false)"
+        elif test_single_image.model is None:
+            gallery_state["error"] = "Model not loaded"
+        else:
+            asyncio.create_task(load_gallery())
+
+    def gallery_not_ready():
+        if gallery_state["gallery"] is None:
+            return {"status": "error", "message": gallery_state["error"] or "Gallery is still loading"}
+        return None
+
+    @app.post("/gallery/identify")
+    async def gallery_identify(
+        file: UploadFile = File(...),
+        k: int = Query(species_gallery.TOP_K, ge=1, le=50)
+    ):
+        """
+        Receives an image file -> embedding -> closest gallery images -> species, similarity, confident
+        """
+        not_ready = gallery_not_ready()
+        if not_ready:
+            return not_ready
+        try:
+            with stage("upload_read"):
+                data = await file.read()
+            vectors = await run_in_threadpool(species_gallery.embed_images, gallery_state["embed"], [BytesIO(data)])
+            with stage("gallery_search"):
+                return gallery_state["gallery"].identify(vectors[0], k=k)
+        except Exception as e:
+            ERRORS.labels("gallery_identify").inc()
+            return {"status": "error", "message": str(e)}
+
+    @app.post("/gallery/species/{species}")
+    async def gallery_add_species(species: str, files: List[UploadFile] = File(...)):
+        """
+        Adds labelled photos of one species (new or existing) to the gallery
+        """
+        not_ready = gallery_not_ready()
+        if not_ready:
+            return not_ready
+        # The name becomes a folder under gallery/
+        if not species.strip() or species.startswith(".") or "/" in species or "\\" in species:
+            return {"status": "error", "message": f"Invalid species name: {species!r}"}
+
+        images = [(f.filename, await f.read()) for f in files]
+        g = gallery_state["gallery"]
+        try:
+            added = await run_in_threadpool(
+                species_gallery.add_species_images, g, gallery_state["embed"], species.strip(), images
+            )
+            await run_in_threadpool(g.save)
+        except Exception as e:
+            ERRORS.labels("gallery_add").inc()
+            return {"status": "error", "message": str(e)}
+        return {"status": "success", "species": species.strip(), "added": added, **g.stats()}
+
+    @app.post("/gallery/sync")
+    async def gallery_sync():
+        """
+        Picks up images dropped into gallery/<Species>/ since startup
+        """
+        not_ready = gallery_not_ready()
+        if not_ready:
+            return not_ready
+        g = gallery_state["gallery"]
+        added = await run_in_threadpool(species_gallery.sync, g, gallery_state["embed"])
+        if added:
+            await run_in_threadpool(g.save)
+        return {"status": "success", "added": added, **g.stats()}
+
+    @app.get("/gallery/stats")
+    async def gallery_stats_route():
+        g = gallery_state["gallery"]
+        if g is None:
+            return {"ready": False, "error": gallery_state["error"]}
+        return {"ready": True, **g.stats(), "per_species": g.species_counts()}
 
     print("✅ Code-a-thon Logic connected at /custom-model/predict")
 
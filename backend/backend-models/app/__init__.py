@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Modules shared with backend-ml live in backend/shared/fishapp
+SHARED_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "shared")
+if SHARED_DIR not in sys.path:
+    sys.path.append(SHARED_DIR)
@@ -11,6 +11,87 @@ CLOUDINARY_CLOUD_NAME = os.getenv("CLOUDINARY_CLOUD_NAME")
 CLOUDINARY_API_KEY = os.getenv("CLOUDINARY_API_KEY")
 CLOUDINARY_API_SECRET = os.getenv("CLOUDINARY_API_SECRET")
 
+# Upstream base URLs; only overridden to point at local fakes (see backend/benchmarks)
+GEMINI_BASE_URL=os.getenv("GEMINI_BASE_URL")  # unset = Google's default endpoint
+ROBOFLOW_API_URL=os.getenv("ROBOFLOW_API_URL", "https://serverless.roboflow.com")
+CLOUDINARY_UPLOAD_PREFIX=os.getenv("CLOUDINARY_UPLOAD_PREFIX")  # unset = https://api.cloudinary.com
+NOMINATIM_DOMAIN=os.getenv("NOMINATIM_DOMAIN", "nominatim.openstreetmap.org")
+NOMINATIM_SCHEME=os.getenv("NOMINATIM_SCHEME", "https")
+
 MONGO_URI=os.getenv("MONGO_URI")
 MONGO_DB_NAME=os.getenv("MONGO_DB_NAME")
-GEMINI_API_KEY=os.getenv("GEMINI_API_KEY")
\ No newline at end of file
+GEMINI_API_KEY=os.getenv("GEMINI_API_KEY")
+
+# Content-hash result cache in front of the identify route
+PREDICTION_CACHE_SIZE=int(os.getenv("PREDICTION_CACHE_SIZE", "2048"))
+PREDICTION_CACHE_TTL=float(os.getenv("PREDICTION_CACHE_TTL", "86400"))
+PREDICTION_CACHE_DIR=os.getenv("PREDICTION_CACHE_DIR")  # unset = memory only
+
+# Price dataset: polled for changes and hot-swapped without a restart
+PRICE_CSV_PATH=os.getenv("PRICE_CSV_PATH", "data/pricing_dataset.csv")
+PRICE_SNAPSHOT_PATH=os.getenv("PRICE_SNAPSHOT_PATH")  # optional Parquet snapshot for fast cold loads
+PRICE_WATCH_INTERVAL=float(os.getenv("PRICE_WATCH_INTERVAL", "30"))  # seconds, 0 disables
+PRICE_ADMIN_TOKEN=os.getenv("PRICE_ADMIN_TOKEN")
+
+# Offline state lookup; Nominatim is only used when explicitly enabled
+STATE_BOUNDARIES_PATH=os.getenv("STATE_BOUNDARIES_PATH", "data/india_states.geojson")
+INDIA_WATERS_PATH=os.getenv("INDIA_WATERS_PATH", "data/india_waters.geojson")  # EEZ + coastal strip, for points at sea
+GEOCODER_ONLINE_FALLBACK=os.getenv("GEOCODER_ONLINE_FALLBACK", "false").lower() in ("1", "true", "yes")
+GEOCODE_CACHE_RESOLUTION=float(os.getenv("GEOCODE_CACHE_RESOLUTION", "0.01"))  # degrees, ~1.1 km
+GEOCODE_CACHE_SIZE=int(os.getenv("GEOCODE_CACHE_SIZE", "50000"))
+GEOCODE_CACHE_PATH=os.getenv("GEOCODE_CACHE_PATH")  # optional JSON file kept across restarts
+MAX_OFFSHORE_KM=float(os.getenv("MAX_OFFSHORE_KM", "370"))  # ~200 nautical miles (EEZ)
+
+# Background Cloudinary archive uploads (off the /detect critical path)
+UPLOAD_CONCURRENCY=int(os.getenv("UPLOAD_CONCURRENCY", "4"))
+UPLOAD_MAX_RETRIES=int(os.getenv("UPLOAD_MAX_RETRIES", "4"))
+UPLOAD_MAX_PENDING=int(os.getenv("UPLOAD_MAX_PENDING", "1000"))  # full queue = skip the archive, never block
+
+# Heatmap grid/tile endpoint: cells per request, fan-out cap and tile cache
+HEATMAP_MAX_GRID_CELLS=int(os.getenv("HEATMAP_MAX_GRID_CELLS", "1024"))
+HEATMAP_GRID_CONCURRENCY=int(os.getenv("HEATMAP_GRID_CONCURRENCY", "16"))  # cells in flight per process, all grids together
+HEATMAP_TILE_CACHE_SIZE=int(os.getenv("HEATMAP_TILE_CACHE_SIZE", "512"))
+HEATMAP_TILE_TTL=float(os.getenv("HEATMAP_TILE_TTL", "3600"))
+HEATMAP_TILE_CACHE_DIR=os.getenv("HEATMAP_TILE_CACHE_DIR")  # unset = memory only
+
+# Precomputed fish-probability surface (python -m app.services.fish_surface)
+HEATMAP_SPACE_URL=os.getenv("HEATMAP_SPACE_URL", "https://volcanicbat64-fish-spatial.hf.space")
+FISH_SURFACE_PATH=os.getenv("FISH_SURFACE_PATH", "data/fish_surface.npy")
+FISH_SURFACE_STEP=float(os.getenv("FISH_SURFACE_STEP", "0.25"))  # degrees between grid nodes
+# An existing surface is rebuilt in the background once older than this (one worker sweeps, the
+# others wait for the file); 0 = off, rebuild with the CLI / a cron job instead
+FISH_SURFACE_REFRESH_HOURS=float(os.getenv("FISH_SURFACE_REFRESH_HOURS", "0"))
+
+# Write-behind buffer for analysis inserts (off = one insert_one per request)
+ANALYSIS_WRITE_BEHIND=os.getenv("ANALYSIS_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+ANALYSIS_BATCH_SIZE=int(os.getenv("ANALYSIS_BATCH_SIZE", "100"))
+ANALYSIS_FLUSH_INTERVAL=float(os.getenv("ANALYSIS_FLUSH_INTERVAL", "0.5"))  # seconds
+ANALYSIS_SPILL_PATH=os.getenv("ANALYSIS_SPILL_PATH", "data/analysis_spill.jsonl")  # used while Mongo is unreachable
+
+# Local cascade tiers on backend-ml (classifier and gallery) before Gemini/Roboflow; unset = always ask remote
+LOCAL_ID_URL=os.getenv("LOCAL_ID_URL")  # e.g. http://localhost:8001
+LOCAL_ID_TIMEOUT=float(os.getenv("LOCAL_ID_TIMEOUT", "2.0"))  # seconds for both tiers together; slower = ask Gemini
+# Custom classifier tier: it only knows a few freshwater species, so it is off by default and,
+# when on, only trusted if the gallery agrees at least this closely (anything else is out of its domain)
+LOCAL_MODEL_TIER=os.getenv("LOCAL_MODEL_TIER", "false").lower() in ("1", "true", "yes")
+LOCAL_MODEL_MIN_SIMILARITY=float(os.getenv("LOCAL_MODEL_MIN_SIMILARITY", "0.70"))
+
+# Gemini gateway: identical photos share one call, concurrent ones share a multi-image prompt
+# Multi-image prompts are opt-in: the model can mis-number its answers and swap species between callers
+GEMINI_MAX_BATCH=int(os.getenv("GEMINI_MAX_BATCH", "1"))  # 1 = one image per call; >1 packs concurrent photos
+GEMINI_BATCH_WAIT_MS=float(os.getenv("GEMINI_BATCH_WAIT_MS", "25"))  # how long a call waits for company
+GEMINI_MAX_QPS=float(os.getenv("GEMINI_MAX_QPS", "0"))  # calls/second; 0 = unlimited
+GEMINI_MAX_TOKENS_PER_MINUTE=int(os.getenv("GEMINI_MAX_TOKENS_PER_MINUTE", "0"))  # 0 = unlimited
+GEMINI_BUDGET_WAIT=float(os.getenv("GEMINI_BUDGET_WAIT", "10"))  # seconds to wait for budget before a 503
+
+# Upload ingestion: size cap, then every photo is shrunk before any upstream or Cloudinary sees it
+UPLOAD_MAX_BYTES=int(os.getenv("UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))  # per photo (and per single-photo request); bigger = 413
+UPLOAD_MAX_BATCH_FILES=int(os.getenv("UPLOAD_MAX_BATCH_FILES", "20"))  # photos per /detect/batch haul
+UPLOAD_MAX_REQUEST_BYTES=int(os.getenv("UPLOAD_MAX_REQUEST_BYTES", str(100 * 1024 * 1024)))  # whole /detect/batch request
+UPLOAD_MAX_EDGE=int(os.getenv("UPLOAD_MAX_EDGE", "1280"))  # px on the long side
+UPLOAD_JPEG_QUALITY=int(os.getenv("UPLOAD_JPEG_QUALITY", "85"))
+
+# Heavy clients/datasets are built on first use; these are built in the background right after startup
+# ("all", "none" or a comma list of: gemini, roboflow, cloudinary, price_dataset, gradio_space, geolocator)
+PREWARM_SERVICES=os.getenv("PREWARM_SERVICES", "gemini,cloudinary,price_dataset")
+PREWARM_DELAY=float(os.getenv("PREWARM_DELAY", "1.0"))  # seconds after startup, so startup itself isn't slowed
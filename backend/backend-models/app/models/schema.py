@@ -24,9 +24,16 @@ class AnalysisModel(BaseModel):
     user_id: str = Field(...) 
     fish_class: str = Field(...)
     location: dict = Field(...) 
+    # GeoJSON copy of location for the 2dsphere index; filled in by save_analysis
+    geo: Optional[dict] = None
     qty_captured: int = Field(...)
     total_price: float = Field(...)
     weight_kg: float = Field(...)
+
+    # --- Archived photo ---
+    # upload_id comes from /detect; image_url is set when the background upload finishes
+    upload_id: Optional[str] = None
+    image_url: Optional[str] = None
     
     # --- New Timestamp Field ---
     # default_factory ensures the time is captured at the moment of instantiation
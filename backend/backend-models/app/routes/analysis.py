@@ -1,22 +1,56 @@
 from fastapi import APIRouter, HTTPException, Depends
+from app import config
 from app.db.mongo import db
 from app.models.schema import AnalysisModel
+from app.services.cloudinary_service import link_upload_url, lookup_upload_url
+from app.services.analysis_writer import AnalysisWriter
+from app.services.price_loader import resolve_data_path
+from fishapp.metrics import ERRORS, stage
 
 router = APIRouter()
 
+# Batches inserts when ANALYSIS_WRITE_BEHIND is on; started/stopped in main.py
+analysis_writer = AnalysisWriter(
+    max_batch=config.ANALYSIS_BATCH_SIZE,
+    max_delay=config.ANALYSIS_FLUSH_INTERVAL,
+    spill_path=resolve_data_path(config.ANALYSIS_SPILL_PATH) if config.ANALYSIS_SPILL_PATH else None
+)
+
 @router.post("")
-async def save_analysis(analysis_data: AnalysisModel):
-    """Saves the final analysis data to the MongoDB 'analysis' collection."""
+async def save_analysis(analysis_data: AnalysisModel, sync: bool = False):
+    """
+    Saves the final analysis data to the MongoDB 'analysis' collection.
+    With the write-behind buffer on, the document is queued and its id
+    returned straight away; pass sync=True to wait for the insert.
+    """
     try:
-        analysis_collection = db.database.get_collection("analysis")
+        # If the archive upload already finished, attach its URL now;
+        # otherwise the upload worker sets it on this record when it lands
+        if analysis_data.upload_id and not analysis_data.image_url:
+            analysis_data.image_url = await lookup_upload_url(analysis_data.upload_id)
         
+        location = analysis_data.location
+        if analysis_data.geo is None and "lat" in location and "lon" in location:
+            analysis_data.geo = {"type": "Point", "coordinates": [location["lon"], location["lat"]]}
+
         # Convert Pydantic model to a dictionary
         analysis_dict = analysis_data.model_dump(by_alias=True,exclude_none=True)
-        print(analysis_dict)
-        
-        result = await analysis_collection.insert_one(analysis_dict)
-        print(result)
-        
+
+        if analysis_writer.running and not sync:
+            inserted_id = analysis_writer.add(analysis_dict)
+            return {
+                "success": True,
+                "message": "Analysis data queued for saving",
+                "inserted_id": str(inserted_id),
+                "queued": True
+            }
+
+        analysis_collection = db.database.get_collection("analysis")
+        with stage("mongo_insert"):
+            result = await analysis_collection.insert_one(analysis_dict)
+        if analysis_data.upload_id and not analysis_data.image_url:
+            await link_upload_url(result.inserted_id, analysis_data.upload_id)
+
         return {
             "success": True,
             "message": "Analysis data saved successfully",
@@ -24,4 +58,5 @@ async def save_analysis(analysis_data: AnalysisModel):
         }
 
     except Exception as e:
+        ERRORS.labels("save_analysis").inc()
         raise HTTPException(status_code=500, detail=str(e))
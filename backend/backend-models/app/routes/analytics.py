@@ -0,0 +1,151 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from datetime import datetime
+from typing import Literal, Optional
+import json
+from app.db.mongo import db
+from app.services.analytics import (
+    RECORD_SORT, after_cursor, build_match, encode_cursor, near_pipeline, near_totals_pipeline,
+    serialize, timeseries_pipeline, totals_pipeline
+)
+
+router = APIRouter()
+
+# Server-side aggregations over the `analysis` collection.
+# Indexes are created at startup (see ensure_indexes in main.py).
+
+
+def _collection():
+    return db.database.get_collection("analysis")
+
+
+async def _aggregate(pipeline):
+    try:
+        return [serialize(doc) async for doc in _collection().aggregate(pipeline)]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/users/{user_id}/totals")
+async def user_totals(
+    user_id: str,
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None)
+):
+    """Catches, quantity, weight and revenue per species for one user."""
+    per_species = await _aggregate(totals_pipeline(build_match(user_id=user_id, start=start, end=end), "fish_class"))
+    overall = {
+        key: sum(row[key] for row in per_species)
+        for key in ("catches", "qty_captured", "weight_kg", "total_price")
+    }
+    return {"user_id": user_id, "overall": overall, "species": per_species}
+
+
+@router.get("/species/totals")
+async def species_totals(
+    user_id: Optional[str] = Query(None),
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None)
+):
+    """Totals per species across everyone (or one user)."""
+    return await _aggregate(totals_pipeline(build_match(user_id=user_id, start=start, end=end), "fish_class"))
+
+
+@router.get("/species/{fish_class}/users")
+async def species_top_users(
+    fish_class: str,
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    limit: int = Query(50, ge=1, le=500)
+):
+    """Which users land the most of one species."""
+    pipeline = totals_pipeline(build_match(fish_class=fish_class, start=start, end=end), "user_id")
+    return await _aggregate(pipeline + [{"$limit": limit}])
+
+
+@router.get("/timeseries")
+async def timeseries(
+    bucket: Literal["hour", "day", "week", "month", "year"] = Query("day"),
+    user_id: Optional[str] = Query(None),
+    fish_class: Optional[str] = Query(None),
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    timezone: str = Query("Asia/Kolkata")
+):
+    """Totals per time bucket, oldest first."""
+    match = build_match(user_id=user_id, fish_class=fish_class, start=start, end=end)
+    return await _aggregate(timeseries_pipeline(match, bucket, timezone))
+
+
+@router.get("/near")
+async def near(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(25, gt=0, le=1000),
+    fish_class: Optional[str] = Query(None),
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """Closest catches to a point, nearest first, with distance_km."""
+    match = build_match(fish_class=fish_class, start=start, end=end)
+    return await _aggregate(near_pipeline(lat, lon, radius_km, match, limit))
+
+
+@router.get("/near/totals")
+async def near_totals(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(25, gt=0, le=1000),
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None)
+):
+    """Per-species totals for catches within radius_km of a point."""
+    return await _aggregate(near_totals_pipeline(lat, lon, radius_km, build_match(start=start, end=end)))
+
+
+@router.get("/records")
+async def records(
+    user_id: Optional[str] = Query(None),
+    fish_class: Optional[str] = Query(None),
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None)  # next_cursor from the previous page
+):
+    """Newest-first pages of raw records; follow next_cursor until it is null."""
+    try:
+        query = after_cursor(build_match(user_id=user_id, fish_class=fish_class, start=start, end=end), cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        docs = await _collection().find(query).sort(RECORD_SORT).limit(limit + 1).to_list(length=limit + 1)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    # One extra document tells us whether there is another page
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    return {
+        "items": [serialize(doc) for doc in docs],
+        "next_cursor": encode_cursor(docs[-1]) if has_more else None
+    }
+
+
+@router.get("/export")
+async def export(
+    user_id: Optional[str] = Query(None),
+    fish_class: Optional[str] = Query(None),
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None)
+):
+    """All matching records as NDJSON, streamed straight off the Mongo cursor."""
+    query = build_match(user_id=user_id, fish_class=fish_class, start=start, end=end)
+
+    async def lines():
+        cursor = _collection().find(query).sort(RECORD_SORT).batch_size(500)
+        async for doc in cursor:
+            yield json.dumps(serialize(doc)) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
@@ -1,48 +1,56 @@
 from fastapi import APIRouter, File, UploadFile, HTTPException
-import cloudinary
-import cloudinary.uploader
-import tempfile
-from inference_sdk import InferenceHTTPClient
+import base64
 from app import config  # ✅ import config from app folder
-import os
+from app.services.executor import run_blocking, UpstreamError
+from app.services.cloudinary_service import upload_queue
+from app.services.ingest import UploadRejected, ingest_upload
+from app.services.local_identify import local_answer
+from fishapp.metrics import ERRORS
+from app.services.registry import lazy_service
 
 router = APIRouter()
 
-# ✅ Configure Cloudinary
-cloudinary.config(
-    cloud_name=config.CLOUDINARY_CLOUD_NAME,
-    api_key=config.CLOUDINARY_API_KEY,
-    api_secret=config.CLOUDINARY_API_SECRET
-)
+# ✅ Roboflow client, built on first use: inference_sdk pulls in supervision and scipy
+def _make_roboflow_client():
+    from inference_sdk import InferenceHTTPClient
 
-# ✅ Initialize Roboflow client
-client = InferenceHTTPClient(
-    api_url="https://serverless.roboflow.com",
-    api_key=config.ROBOFLOW_API_KEY
-)
+    return InferenceHTTPClient(
+        api_url=config.ROBOFLOW_API_URL,
+        api_key=config.ROBOFLOW_API_KEY
+    )
+
+roboflow_client = lazy_service("roboflow", _make_roboflow_client)
 
 @router.post("")
 async def detect_route(image: UploadFile = File(...)):
     try:
-        # 1️⃣ Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
-            tmp.write(await image.read())
-            tmp_path = tmp.name
+        # 1️⃣ Bounded read, real format check, downscale: only the small JPEG goes anywhere
+        photo = await ingest_upload(image)
+        image_data = photo.data
+
+        # 2️⃣ A confident local answer (classifier the gallery agrees with, or the gallery) skips Roboflow
+        local = await local_answer(image_data, image.filename)
+        if local:
+            return {
+                "success": True,
+                "roboflow_result": local["species"],
+                "source": local["source"],
+                "upload_id": upload_queue.submit(image_data, filename=image.filename),
+            }
 
-        # 2️⃣ Send the local file to Roboflow (not URL)
-        result = client.run_workflow(
+        # 3️⃣ Otherwise send the image to Roboflow as base64 (not URL)
+        client = await roboflow_client.aget()
+        result = await run_blocking(
+            "roboflow",
+            client.run_workflow,
             workspace_name=config.ROBOFLOW_WORKSPACE,
             workflow_id=config.ROBOFLOW_WORKFLOW,
-            images={"image": tmp_path},  # 👈 pass local path instead of URL
+            images={"image": base64.b64encode(image_data).decode("ascii")},
             use_cache=True
         )
 
-        # 3️⃣ (Optional) Upload to Cloudinary AFTER successful Roboflow call
-        upload_result = cloudinary.uploader.upload(tmp_path)
-        image_url = upload_result.get("secure_url")
-
-        # 4️⃣ Clean up temp file
-        os.remove(tmp_path)
+        # 4️⃣ Archive to Cloudinary in the background; nobody waits on it
+        upload_id = upload_queue.submit(image_data, filename=image.filename)
 
         detected_species = None
         # Check for the correct nested path based on the new output structure
@@ -55,8 +63,12 @@ async def detect_route(image: UploadFile = File(...)):
         return {
             "success": True,
             "roboflow_result": detected_species,
-            
+            "source": "roboflow",
+            "upload_id": upload_id,
         }
 
+    except (UpstreamError, UploadRejected) as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
+        ERRORS.labels("detect").inc()
         raise HTTPException(status_code=500, detail=str(e))
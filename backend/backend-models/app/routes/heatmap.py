@@ -1,8 +1,14 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from gradio_client import Client
+import asyncio
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel, Field
 import json
-from typing import Dict, Any
+from typing import Dict, Any, Literal
+from app import config
+from app.services.executor import run_blocking
+from app.services.heatmap_grid import HeatmapGrid, encode_values
+from app.services.fish_surface import SurfaceStore
+from fishapp.metrics import cache_event, fallback
+from app.services.registry import lazy_service
 
 
 router = APIRouter()
@@ -10,19 +16,22 @@ router = APIRouter()
 
 # Initialize the Gradio client lazily
 # The client will only be initialized the first time an API call is made.
-_client = None
+def _connect_space():
+   from gradio_client import Client
+
+   # Connect to your Hugging Face Space API
+   return Client(config.HEATMAP_SPACE_URL)
+
+
+gradio_space = lazy_service("gradio_space", _connect_space)
 
 
 def get_client():
-   global _client
-   if _client is None:
-       try:
-           # Connect to your Hugging Face Space API
-           _client = Client("https://volcanicbat64-fish-spatial.hf.space")
-       except Exception as e:
-           print(f"Error initializing Gradio client: {e}")
-           raise HTTPException(status_code=503, detail=f"Unable to connect to prediction service: {str(e)}")
-   return _client
+   try:
+       return gradio_space.get()  # runs on worker threads; the registry locks the first build
+   except Exception as e:
+       print(f"Error initializing Gradio client: {e}")
+       raise HTTPException(status_code=503, detail=f"Unable to connect to prediction service: {str(e)}")
 
 
 class FishPredictionRequest(BaseModel):
@@ -41,79 +50,219 @@ class FishPredictionResponse(BaseModel):
    latitude: float
    longitude: float
    fish_probability: float
+   source: str = "live"  # interpolated | live | fallback | mock
+
+
+def parse_probability(result):
+   """
+   The Gradio API can return a simple string or a JSON-like object.
+   This handles both possibilities to ensure reliability.
+   """
+   fish_probability = None
+
+   if isinstance(result, str):
+       # Case 1: The Gradio API returns a simple string (e.g., "75.5")
+       try:
+           fish_probability = float(result)
+       except ValueError:
+           # Case 2: The Gradio API returns a JSON string, so we try to parse it.
+           try:
+               parsed_result = json.loads(result)
+               if isinstance(parsed_result, dict) and 'fish_probability' in parsed_result:
+                   fish_probability = parsed_result['fish_probability']
+           except (json.JSONDecodeError, KeyError):
+               # If parsing fails, fish_probability remains None
+               pass
+
+
+   elif isinstance(result, (float, int)):
+       # Case 3: The API returns a number directly (the simplest case)
+       fish_probability = float(result)
+
+
+   elif isinstance(result, dict) and 'fish_probability' in result:
+       # Case 4: The API returns a well-formed dictionary as expected
+       fish_probability = result['fish_probability']
+
+
+   # If we still don't have a valid probability after all checks, something went wrong.
+   if fish_probability is None:
+       raise ValueError("Invalid or unparseable response from prediction API")
+   return float(fish_probability)
+
+
+async def space_client():
+   # Initializes lazily; connecting is a blocking HTTP call, so only that goes to a thread
+   if gradio_space.ready:
+       return gradio_space.get()
+   return await run_blocking("gradio", get_client)
+
+
+async def fetch_probability(latitude: float, longitude: float, client=None) -> float:
+   """
+   One live prediction from the Hugging Face Space. Raises on failure.
+   """
+   if client is None:
+       client = await space_client()
+
+   # The api_name should match the function endpoint in your Gradio app.
+   # It's typically "/predict" for a single-function app.
+   result = await run_blocking(
+       "gradio",
+       client.predict,
+       latitude=latitude,
+       longitude=longitude,
+       api_name="/predict"
+   )
+   return parse_probability(result)
+
+
+# Precomputed surface, memory-mapped; refreshed in the background (see main.py)
+fish_surface = SurfaceStore(config.FISH_SURFACE_PATH)
+
+
+def grid_fetch():
+   """
+   Cell fetch for one grid: the precomputed surface first, otherwise the
+   Space, with the client looked up once per grid rather than per cell.
+   """
+   client = None
+
+   async def fetch(latitude: float, longitude: float) -> float:
+       nonlocal client
+       value = fish_surface.interpolate(latitude, longitude)
+       if value is not None:
+           return value
+       if client is None:
+           client = asyncio.ensure_future(space_client())  # concurrent cells share the one lookup
+       return await fetch_probability(latitude, longitude, await client)
+
+   return fetch
 
 
 @router.post("/predict", response_model=FishPredictionResponse)
 async def predict_fish_probability(request: FishPredictionRequest):
    """
-   Predict fish probability for given latitude and longitude coordinates
-   by calling the Hugging Face model.
+   Predict fish probability for given latitude and longitude coordinates,
+   from the precomputed surface when it covers the point, otherwise by
+   calling the Hugging Face model.
    """
-   try:
-       # Get the client (initializes lazily)
-       client = get_client()
-      
-       # Call the Hugging Face API with the provided coordinates
-       # The api_name should match the function endpoint in your Gradio app.
-       # It's typically "/predict" for a single-function app.
-       result = client.predict(
+   interpolated = fish_surface.interpolate(request.latitude, request.longitude)
+   cache_event("fish_surface", interpolated is not None)
+   if interpolated is not None:
+       return FishPredictionResponse(
+           status="success",
            latitude=request.latitude,
            longitude=request.longitude,
-           api_name="/predict"
+           fish_probability=interpolated,
+           source="interpolated"
        )
-      
-       # --- LOGIC FOR HANDLING GRADIO OUTPUT ---
-       # The Gradio API can return a simple string or a JSON-like object.
-       # This code handles both possibilities to ensure reliability.
-       fish_probability = None
-      
-       if isinstance(result, str):
-           # Case 1: The Gradio API returns a simple string (e.g., "75.5")
-           try:
-               fish_probability = float(result)
-           except ValueError:
-               # Case 2: The Gradio API returns a JSON string, so we try to parse it.
-               try:
-                   parsed_result = json.loads(result)
-                   if isinstance(parsed_result, dict) and 'fish_probability' in parsed_result:
-                       fish_probability = parsed_result['fish_probability']
-               except (json.JSONDecodeError, KeyError):
-                   # If parsing fails, fish_probability remains None
-                   pass
-
-
-       elif isinstance(result, (float, int)):
-           # Case 3: The API returns a number directly (the simplest case)
-           fish_probability = float(result)
-
-
-       elif isinstance(result, dict) and 'fish_probability' in result:
-           # Case 4: The API returns a well-formed dictionary as expected
-           fish_probability = result['fish_probability']
 
-
-       # If we still don't have a valid probability after all checks, something went wrong.
-       if fish_probability is None:
-           raise ValueError("Invalid or unparseable response from prediction API")
+   try:
+       fish_probability = await fetch_probability(request.latitude, request.longitude)
       
        # Return the structured response
        return FishPredictionResponse(
            status="success",
            latitude=request.latitude,
            longitude=request.longitude,
-           fish_probability=fish_probability
+           fish_probability=fish_probability,
+           source="live"
        )
       
    except Exception as e:
        print(f"Hugging Face API failed: {e}. Using fallback data.")
+       fallback("heatmap_default")
        # Fallback to mock data if Hugging Face API fails. This ensures your app
        # doesn't crash even if the external service is down.
        return FishPredictionResponse(
            status="success",
            latitude=request.latitude,
            longitude=request.longitude,
-           fish_probability=75.0  # A reasonable fallback value
+           fish_probability=75.0,  # A reasonable fallback value
+           source="fallback"
+       )
+
+
+# --- GRID / TILE ENDPOINTS ---
+# One request per map viewport instead of one per cell
+heatmap_grid = HeatmapGrid(
+   grid_fetch,
+   max_cells=config.HEATMAP_MAX_GRID_CELLS,
+   cache_size=config.HEATMAP_TILE_CACHE_SIZE,
+   cache_ttl=config.HEATMAP_TILE_TTL,
+   cache_dir=config.HEATMAP_TILE_CACHE_DIR,
+   version=lambda: fish_surface.version  # a refreshed surface starts a fresh set of tiles
+)
+
+
+class HeatmapGridRequest(BaseModel):
+   """
+   A bounding box split into cells of `resolution` degrees.
+   """
+   min_lat: float = Field(..., ge=-90, le=90)
+   min_lon: float = Field(..., ge=-180, le=180)
+   max_lat: float = Field(..., ge=-90, le=90)
+   max_lon: float = Field(..., ge=-180, le=180)
+   resolution: float = Field(0.25, gt=0, le=10)
+   format: Literal["json", "f32"] = "json"  # f32 = base64 little-endian float32, NaN = missing
+
+
+def _grid_response(payload, fmt):
+   if fmt == "f32":
+       payload = dict(payload, values=encode_values(payload["values"]), encoding="f32-base64")
+   return payload
+
+
+@router.post("/grid")
+async def predict_grid(request: HeatmapGridRequest):
+   """
+   Fish probability for every cell of a bounding box, as one row-major
+   array (row 0 = north). Cells that could not be predicted are null.
+   """
+   if request.min_lat >= request.max_lat or request.min_lon >= request.max_lon:
+       raise HTTPException(status_code=400, detail="min_lat/min_lon must be below max_lat/max_lon")
+   try:
+       payload = await heatmap_grid.bbox_grid(
+           request.min_lat, request.min_lon, request.max_lat, request.max_lon, request.resolution
        )
+   except ValueError as e:
+       raise HTTPException(status_code=400, detail=str(e))
+   return _grid_response(payload, request.format)
+
+
+@router.get("/tiles/{z}/{x}/{y}")
+async def predict_tile(
+   z: int,
+   x: int,
+   y: int,
+   size: int = Query(16, ge=1, le=64),
+   format: Literal["json", "f32"] = Query("json")
+):
+   """
+   Same as /grid for an XYZ map tile split into size x size cells.
+   """
+   if not 0 <= z <= 18:
+       raise HTTPException(status_code=400, detail="z must be between 0 and 18")
+   try:
+       payload = await heatmap_grid.tile_grid(z, x, y, size)
+   except ValueError as e:
+       raise HTTPException(status_code=400, detail=str(e))
+   return _grid_response(payload, format)
+
+
+@router.get("/grid/stats")
+async def grid_stats():
+   return heatmap_grid.cache.stats()
+
+
+@router.get("/surface")
+async def surface_info():
+   """
+   Version and coverage of the precomputed surface, if one is loaded.
+   """
+   surface = fish_surface.current
+   return surface.info() if surface is not None else {"loaded": False}
 
 
 @router.get("/health")
@@ -133,6 +282,7 @@ async def test_prediction(request: FishPredictionRequest):
        status="success",
        latitude=request.latitude,
        longitude=request.longitude,
-       fish_probability=85.5
+       fish_probability=85.5,
+       source="mock"
    )
 
@@ -1,67 +1,150 @@
+import asyncio
+from typing import List
 from fastapi import APIRouter, File, UploadFile, HTTPException
-import cloudinary
-import cloudinary.uploader
-import tempfile
-import os
-from google import genai
-from google.genai import types
 from app import config  # ✅ import config from app folder
+from fishapp.result_cache import ResultCache, content_key
+from app.services.executor import UpstreamError
+from app.services.cloudinary_service import upload_queue
+from app.services.gemini_gateway import BATCH_INSTRUCTIONS, Budget, GeminiGateway
+from app.services import ingest
+from app.services.ingest import UploadRejected, ingest_upload
+from app.services.local_identify import local_answer
+from fishapp.metrics import ERRORS, cache_event
+from app.services.registry import lazy_service
 
 router = APIRouter()
 
-# ✅ Configure Cloudinary
-cloudinary.config(
-    cloud_name=config.CLOUDINARY_CLOUD_NAME,
-    api_key=config.CLOUDINARY_API_KEY,
-    api_secret=config.CLOUDINARY_API_SECRET
+# ✅ Gemini client (Replacing Roboflow), built on first use: google.genai is slow to import
+def _make_gemini_client():
+    from google import genai
+    from google.genai import types
+
+    return genai.Client(
+        api_key=config.GEMINI_API_KEY,
+        http_options=types.HttpOptions(base_url=config.GEMINI_BASE_URL) if config.GEMINI_BASE_URL else None
+    )
+
+gemini_client = lazy_service("gemini", _make_gemini_client)
+
+GEMINI_MODEL = "gemini-3-flash-preview"
+GEMINI_PROMPT = [
+    "Identify this fish species.",
+    "Provide the Common English name and the "
+    "local name (e.g., Hindi or Marathi) if applicable. Nothing else."
+    "Format: 'English Name (Local Name)'"
+]
+# Changing the model or the prompts gives a new version, so old answers are not reused
+GEMINI_VERSION = f"{GEMINI_MODEL}:{content_key(''.join([*GEMINI_PROMPT, BATCH_INSTRUCTIONS]).encode(), 'prompt')}"
+
+# ✅ Coalesces identical photos, packs concurrent ones into one prompt, keeps to the budget
+gemini_gateway = GeminiGateway(
+    gemini_client,
+    GEMINI_MODEL,
+    GEMINI_PROMPT,
+    max_batch=config.GEMINI_MAX_BATCH,
+    max_wait_ms=config.GEMINI_BATCH_WAIT_MS,
+    budget=Budget(config.GEMINI_MAX_QPS, config.GEMINI_MAX_TOKENS_PER_MINUTE, config.GEMINI_BUDGET_WAIT)
 )
 
-# ✅ Initialize Gemini client (Replacing Roboflow)
-client = genai.Client(api_key=config.GEMINI_API_KEY)
+# ✅ Same photo re-submitted (retries, gallery picks) -> no second paid Gemini call
+result_cache = ResultCache(
+    "identify",
+    max_entries=config.PREDICTION_CACHE_SIZE,
+    ttl_seconds=config.PREDICTION_CACHE_TTL,
+    disk_dir=config.PREDICTION_CACHE_DIR
+)
+
+@router.get("/cache/stats")
+async def cache_stats():
+    return result_cache.stats()
+
+@router.get("/uploads/stats")
+async def upload_stats():
+    return upload_queue.stats()
+
+@router.get("/ingest/stats")
+async def ingest_stats():
+    return ingest.stats()
+
+@router.get("/gemini/stats")
+async def gemini_stats():
+    return gemini_gateway.stats()
+
+async def identify_species(image_data: bytes, filename: str = None, mime_type: str = "image/jpeg"):
+    """(species, source) from the first tier that answers."""
+    # 2️⃣ Cascade: the first confident local tier answers, Gemini only when none is sure
+    local = await local_answer(image_data, filename)
+    if local:
+        return local["species"], local["source"]
+    # Send the data to Gemini (Replacing Roboflow workflow), possibly alongside other photos
+    return await gemini_gateway.identify(image_data, mime_type), "gemini"
+
+async def identify_bytes(image_data: bytes, filename: str = None, mime_type: str = "image/jpeg"):
+    # Only the answer is cached ("answer" in the key keeps older whole-response entries out)
+    cache_key = content_key(image_data, f"{GEMINI_VERSION}:answer")
+    cached = await result_cache.aget(cache_key)
+    cache_event("identify", cached is not None)
+    if cached is not None:
+        detected_species, source = cached["species"], cached["source"]
+    else:
+        detected_species, source = await identify_species(image_data, filename, mime_type)
+        # Only Gemini's answers: the key is versioned by its model and prompt, not by the
+        # backend-ml model or gallery, which change under retraining and /gallery/sync
+        if detected_species and source == "gemini":
+            await result_cache.aset(cache_key, {"species": detected_species, "source": source})
+
+    # 3️⃣ Archive to Cloudinary in the background; every request gets its own upload_id
+    upload_id = upload_queue.submit(image_data, filename=filename)
+
+    return {
+        "success": True,
+        "roboflow_result": detected_species, # Kept key name same as per your request
+        "source": source,  # tier that answered: "local_model", "gallery" or "gemini"
+        "upload_id": upload_id,  # pass to /price to link the archived image
+    }
 
 @router.post("")
 async def detect_route(image: UploadFile = File(...)):
     try:
-        # 1️⃣ Save uploaded file temporarily
-        # Read the bytes once so we can use them for Gemini and the temp file
-        image_data = await image.read()
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
-            tmp.write(image_data)
-            tmp_path = tmp.name
-
-        # 2️⃣ Send the data to Gemini (Replacing Roboflow workflow)
-        response = client.models.generate_content(
-            model="gemini-3-flash-preview",
-            contents=[
-                types.Part.from_bytes(data=image_data, mime_type="image/jpeg"),
-                "Identify this fish species.",
-                "Provide the Common English name and the "
-                "local name (e.g., Hindi or Marathi) if applicable. Nothing else."
-                "Format: 'English Name (Local Name)'"
-            ]
-        )
-
-        # 3️⃣ Upload to Cloudinary AFTER successful GenAI call
-        upload_result = cloudinary.uploader.upload(tmp_path)
-        image_url = upload_result.get("secure_url")
-
-        # 4️⃣ Clean up temp file
-        os.remove(tmp_path)
-
-        # Extracting the text result to match your previous 'detected_species' logic
-        detected_species = response.text.strip() if response.text else None
-
-        return {
-            "success": True,
-            "roboflow_result": detected_species, # Kept key name same as per your request
-        }
+        # 1️⃣ Bounded read, real format check, downscale: only the small JPEG goes anywhere
+        photo = await ingest_upload(image)
+        return await identify_bytes(photo.data, image.filename, photo.mime_type)
 
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         # LOG THE ERROR so you can see it in your terminal
         print(f"CRITICAL ERROR: {e}")
-        
-        # Ensure cleanup if error occurs after file creation
-        if 'tmp_path' in locals() and os.path.exists(tmp_path):
-            os.remove(tmp_path)
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        ERRORS.labels("identify").inc()
+        status_code = e.status_code if isinstance(e, UpstreamError) else 500
+        raise HTTPException(status_code=status_code, detail=str(e))
+
+async def _ingest_and_identify(image: UploadFile):
+    photo = await ingest_upload(image)
+    return await identify_bytes(photo.data, image.filename, photo.mime_type)
+
+@router.post("/batch")
+async def detect_batch_route(images: List[UploadFile] = File(...)):
+    """
+    A whole catch at once -> per-photo results in upload order (one failed photo doesn't fail the rest)
+    """
+    # Each photo is held to UPLOAD_MAX_BYTES by ingest_upload; the haul to a photo count
+    if len(images) > config.UPLOAD_MAX_BATCH_FILES:
+        raise HTTPException(status_code=413, detail=f"At most {config.UPLOAD_MAX_BATCH_FILES} photos per batch")
+    # All photos reach the gateway together, so they share multi-image prompts
+    results = await asyncio.gather(
+        *(_ingest_and_identify(image) for image in images),
+        return_exceptions=True
+    )
+
+    items = []
+    for i, (image, result) in enumerate(zip(images, results)):
+        if isinstance(result, UploadRejected):
+            items.append({"index": i, "filename": image.filename, "success": False, "error": str(result)})
+        elif isinstance(result, Exception):
+            print(f"⚠️ Batch identify failed for {image.filename}: {result}")
+            ERRORS.labels("identify").inc()
+            items.append({"index": i, "filename": image.filename, "success": False, "error": str(result)})
+        else:
+            items.append({"index": i, "filename": image.filename, **result})
+    return {"success": True, "count": len(items), "results": items}
@@ -1,10 +1,17 @@
-from fastapi import APIRouter, Query, HTTPException
+import hmac
+from fastapi import APIRouter, Query, HTTPException, Header
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
 from enum import Enum
-from app.services.geolocation import get_state_from_latlon
-from app.services.price_loader import load_price_csv, get_avg_price
+from app import config
+from app.services.geolocation import aget_state_from_latlon, geocode_cache
+from app.services.price_loader import lookup_price, lookup_prices
+from app.services.price_store import PriceStore
 from app.models.schema import AnalysisModel
 from app.routes.analysis import save_analysis
-from typing import Optional
+from fishapp.metrics import stage
+from app.services.registry import lazy_service
+from typing import List, Optional
 
 router = APIRouter()
 
@@ -14,8 +21,19 @@ class PriceType(str, Enum):
     FH = "FH"
     FLC = "FLC"
 
-# Load dataset once at startup
-PRICE_DF = load_price_csv("data/pricing_dataset.csv")
+class PriceLookupItem(BaseModel):
+    species: str
+    state: str
+    price_type: PriceType
+
+# Load dataset once, on first use (or prewarm), and index it for O(1) lookups.
+# The store swaps in a new index when the file changes.
+def _load_price_store():
+    store = PriceStore(config.PRICE_CSV_PATH, snapshot_path=config.PRICE_SNAPSHOT_PATH)
+    store.start_watcher(config.PRICE_WATCH_INTERVAL)
+    return store
+
+price_dataset = lazy_service("price_dataset", _load_price_store)
 
 async def calculate_price(
     species: str,
@@ -27,12 +45,15 @@ async def calculate_price(
     """Calculates the price of the detected fish."""
     try:
         # Get state from lat/long
-        state = get_state_from_latlon(lat, lon)
+        with stage("geocode"):
+            state = await aget_state_from_latlon(lat, lon)
         if not state:
             raise HTTPException(status_code=400, detail="Could not determine state from coordinates")
 
-        # Get average price
-        avg_price = get_avg_price(PRICE_DF, species, state, price_type.value)
+        # Get average price (pin one snapshot for the whole request)
+        snapshot = (await price_dataset.aget()).current
+        with stage("price_lookup"):
+            avg_price = lookup_price(snapshot.index, species, state, price_type.value)
         if avg_price is None:
             raise HTTPException(
                 status_code=404,
@@ -49,7 +70,8 @@ async def calculate_price(
             "price_type": price_type.value,
             "weight_kg": weight_kg,
             "avg_price": round(avg_price, 2),
-            "total_price": total_price
+            "total_price": total_price,
+            "price_version": snapshot.version
         }
 
     except HTTPException:
@@ -64,7 +86,9 @@ async def process_and_save_price_analysis(
     weight_kg: float,
     lat: float,
     lon: float,
-    price_type: PriceType
+    price_type: PriceType,
+    upload_id: Optional[str] = None,
+    sync: bool = False
 ):
     """
     Calculates the price and saves the analysis data to the database.
@@ -87,11 +111,12 @@ async def process_and_save_price_analysis(
             location={"lat": lat, "lon": lon},
             qty_captured=qty_captured,
             total_price=price_result.get("total_price"),
-            weight_kg=weight_kg
+            weight_kg=weight_kg,
+            upload_id=upload_id  # image_url is filled in once the archive upload lands
         )
 
         # 3. Save to database via the analysis route's function
-        db_result = await save_analysis(analysis_data)
+        db_result = await save_analysis(analysis_data, sync=sync)
         
         return {
             "price_details": price_result,
@@ -111,7 +136,9 @@ async def calculate_and_save_endpoint(
     weight_kg: float = Query(...),
     lat: float = Query(...),
     lon: float = Query(...),
-    price_type: PriceType = Query(...)
+    price_type: PriceType = Query(...),
+    upload_id: Optional[str] = Query(None),  # from the /detect response
+    sync: bool = Query(False)  # wait for the Mongo insert even with write-behind on
 ):
     return await process_and_save_price_analysis(
         user_id=user_id,
@@ -120,5 +147,46 @@ async def calculate_and_save_endpoint(
         weight_kg=weight_kg,
         lat=lat,
         lon=lon,
-        price_type=price_type
+        price_type=price_type,
+        upload_id=upload_id,
+        sync=sync
     )
+
+@router.post("/lookup")
+async def lookup_prices_endpoint(items: List[PriceLookupItem]):
+    """Average price per kg for many (species, state, price type) keys at once."""
+    price_store = await price_dataset.aget()
+    prices = lookup_prices(price_store.current.index, [(i.species, i.state, i.price_type.value) for i in items])
+    return [
+        {
+            "species": item.species,
+            "state": item.state,
+            "price_type": item.price_type.value,
+            "avg_price": price
+        }
+        for item, price in zip(items, prices)
+    ]
+
+@router.get("/version")
+async def price_dataset_version():
+    """Which price dataset is currently being served."""
+    return (await price_dataset.aget()).current.info()
+
+@router.post("/admin/reload")
+async def reload_price_dataset(x_admin_token: Optional[str] = Header(None)):
+    """Rebuilds the price index from disk and swaps it in without a restart."""
+    # Disabled unless a token is configured (the file watcher still picks up changes)
+    if not config.PRICE_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Reload is disabled: PRICE_ADMIN_TOKEN is not set")
+    if not hmac.compare_digest((x_admin_token or "").encode(), config.PRICE_ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    price_store = await price_dataset.aget()
+    try:
+        snapshot = await run_in_threadpool(price_store.reload)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Reload failed, still serving {price_store.current.version}: {e}")
+    return snapshot.info()
+
+@router.get("/geocode/stats")
+async def geocode_cache_stats():
+    return geocode_cache.stats()
@@ -0,0 +1,245 @@
+"""
+Write-behind buffer for the `analysis` collection.
+
+Instead of one insert_one round trip per catch, documents are collected
+and written with insert_many(ordered=False) once `max_batch` are waiting
+or `max_delay` seconds have passed, whichever comes first.
+
+Ids are assigned client-side (ObjectId) when a document is queued, so
+callers still get an inserted_id back immediately.
+
+If Mongo can't be reached, the batch is appended to a local JSONL spill
+file (fsync'd) and replayed on the next successful flush or restart.
+Replays are idempotent: duplicate-key errors for ids that already made
+it in are ignored. Lines that don't parse (e.g. a write cut short by a
+crash) are moved to `<spill>.bad` instead of blocking the replay, and
+`*.replay` files left behind by a crash mid-replay are picked up again.
+"""
+import asyncio
+import glob
+import os
+import time
+
+from bson import ObjectId, json_util
+from pymongo.errors import BulkWriteError
+
+from app.db.mongo import db
+from app.services.cloudinary_service import link_upload_url, upload_queue
+from fishapp.metrics import BATCH_SIZE, stage
+
+DUPLICATE_KEY = 11000
+
+
+class AnalysisWriter:
+    def __init__(self, collection: str = "analysis", max_batch: int = 100, max_delay: float = 0.5,
+                 spill_path: str = None):
+        self.collection = collection
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.spill_path = spill_path
+        self._pending = []
+        self._full = None
+        self._flush_lock = None
+        self._task = None
+        self.written = 0
+        self.batches = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.rejected = 0
+
+    # --- LIFECYCLE ---
+    async def start(self):
+        if self._task is not None:
+            return
+        self._full = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        # Anything left over from a previous run goes in first
+        try:
+            await self.replay_spill()
+        except Exception as e:
+            print(f"⚠️ Could not replay spilled analysis documents, will retry after the next flush: {e}")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flushes everything still buffered; anything Mongo won't take ends up in the spill file."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        await self.flush()
+
+    @property
+    def running(self):
+        return self._task is not None
+
+    # --- PRODUCER SIDE ---
+    def add(self, doc: dict):
+        """Queues a document and returns its (pre-assigned) _id."""
+        doc.setdefault("_id", ObjectId())
+        self._pending.append(doc)
+        if len(self._pending) >= self.max_batch:
+            self._full.set()
+        return doc["_id"]
+
+    # --- FLUSHING ---
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.max_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                # Keep the writer alive; whatever failed is retried on the next round
+                print(f"❌ Analysis flush failed: {e}")
+
+    def _attach_image_urls(self, batch):
+        # Uploads that finished while the document sat in the buffer
+        for doc in batch:
+            if doc.get("upload_id") and not doc.get("image_url"):
+                known = upload_queue.result(doc["upload_id"])
+                if known and known.get("image_url"):
+                    doc["image_url"] = known["image_url"]
+
+    async def _link_late_uploads(self, batch):
+        # Uploads that finished between _attach_image_urls and the insert updated nothing
+        for doc in batch:
+            if doc.get("upload_id") and not doc.get("image_url"):
+                try:
+                    await link_upload_url(doc["_id"], doc["upload_id"])
+                except Exception as e:
+                    print(f"⚠️ Could not link upload {doc['upload_id']}: {e}")
+
+    async def _insert(self, batch):
+        """insert_many; True if Mongo has every document (or rejected it for good)."""
+        if db.database is None:
+            return False
+        try:
+            BATCH_SIZE.labels("analysis_insert").observe(len(batch))
+            with stage("mongo_insert_many"):
+                await db.database.get_collection(self.collection).insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            errors = [err for err in e.details.get("writeErrors", []) if err.get("code") != DUPLICATE_KEY]
+            # Bad documents will never go in; log them rather than spill forever
+            for err in errors:
+                print(f"❌ Analysis document rejected by Mongo: {err.get('errmsg')}")
+            self.rejected += len(errors)
+        except Exception as e:
+            print(f"⚠️ Analysis insert_many failed ({e}), spilling {len(batch)} documents")
+            return False
+        return True
+
+    async def flush(self):
+        if not self._pending:
+            return 0
+        async with self._flush_lock:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            try:
+                self._attach_image_urls(batch)
+                inserted = await self._insert(batch)
+            except BaseException:
+                # Nothing was written: back in the buffer for the next flush
+                self._pending[:0] = batch
+                raise
+            if inserted:
+                self.written += len(batch)
+                self.batches += 1
+                await self._link_late_uploads(batch)
+                if self._has_spill():
+                    await self._replay_locked()
+            else:
+                try:
+                    await asyncio.to_thread(self._spill, batch)
+                except OSError as e:
+                    # Neither Mongo nor the disk took them: keep them buffered for the next flush
+                    print(f"❌ Could not spill {len(batch)} analysis documents ({e}), keeping them in memory")
+                    self._pending[:0] = batch
+            return len(batch)
+
+    # --- SPILL FILE ---
+    def _spill(self, batch):
+        """Appends to the spill file (blocking: call through asyncio.to_thread)."""
+        if not self.spill_path:
+            print(f"❌ Dropped {len(batch)} analysis documents: Mongo unreachable and no spill file configured")
+            return
+        os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+        with open(self.spill_path, "a", encoding="utf-8") as f:
+            for doc in batch:
+                f.write(json_util.dumps(doc) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.spilled += len(batch)
+
+    def _has_spill(self):
+        return bool(self.spill_path) and (os.path.exists(self.spill_path) or bool(self._leftover_replays()))
+
+    def _leftover_replays(self):
+        return sorted(glob.glob(glob.escape(self.spill_path) + ".*.replay"))
+
+    def _take_spill(self):
+        """
+        Moves the spill file aside and parses it together with any replay
+        files a crash left behind -> (docs, replay files to delete once done).
+        Unparseable lines go to <spill>.bad. Blocking: run in a thread.
+        """
+        try:
+            os.replace(self.spill_path, f"{self.spill_path}.{time.time_ns()}.replay")
+        except FileNotFoundError:
+            pass
+        paths = self._leftover_replays()
+        docs, bad = [], []
+        for path in paths:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        docs.append(json_util.loads(line))
+                    except ValueError:
+                        bad.append(line if line.endswith("\n") else line + "\n")
+        if bad:
+            with open(self.spill_path + ".bad", "a", encoding="utf-8") as f:
+                f.writelines(bad)
+                f.flush()
+                os.fsync(f.fileno())
+            print(f"⚠️ Moved {len(bad)} unreadable spilled analysis lines to {self.spill_path}.bad")
+        return docs, paths
+
+    async def _replay_locked(self):
+        docs, paths = await asyncio.to_thread(self._take_spill)
+        replayed = 0
+        for i in range(0, len(docs), self.max_batch):
+            chunk = docs[i:i + self.max_batch]
+            if await self._insert(chunk):
+                replayed += len(chunk)
+            else:
+                # Still down: put the rest back and try again later
+                await asyncio.to_thread(self._spill, docs[i:])
+                break
+        for path in paths:
+            await asyncio.to_thread(os.remove, path)
+        self.replayed += replayed
+        if replayed:
+            print(f"✅ Replayed {replayed} spilled analysis documents")
+
+    async def replay_spill(self):
+        if not self._has_spill():
+            return
+        async with self._flush_lock:
+            await self._replay_locked()
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "pending": len(self._pending),
+            "written": self.written,
+            "batches": self.batches,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,183 @@
+"""
+Read side of the `analysis` collection: indexes, aggregation pipelines
+and keyset (cursor) pagination.
+
+Pagination never uses skip/limit. Records are ordered by
+(created_at desc, _id desc), and the cursor handed to the client is the
+sort key of the last record it saw, so every page is an index range scan
+no matter how deep it is.
+
+Records saved before the `geo` field existed get it from a one-off
+migration, not at startup:
+    python -m app.services.analytics backfill-geo
+"""
+import argparse
+import asyncio
+import base64
+import json
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE
+
+ANALYSIS_INDEXES = [
+    ([("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], "user_created"),
+    ([("fish_class", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], "species_created"),
+    ([("created_at", DESCENDING), ("_id", DESCENDING)], "created"),
+    ([("geo", GEOSPHERE)], "geo_2dsphere"),
+    ([("upload_id", ASCENDING)], "upload_id"),
+]
+
+BUCKETS = ("hour", "day", "week", "month", "year")
+
+
+async def ensure_indexes(database):
+    collection = database.get_collection("analysis")
+    for keys, name in ANALYSIS_INDEXES:
+        await collection.create_index(keys, name=name, sparse=name == "upload_id")
+    print("✅ Analysis indexes ready")
+
+
+async def backfill_geo(database):
+    """Migration: older records only have location {lat, lon}; give them a GeoJSON point."""
+    backfilled = await database.get_collection("analysis").update_many(
+        {"geo": {"$exists": False}, "location.lat": {"$type": "number"}, "location.lon": {"$type": "number"}},
+        [{"$set": {"geo": {"type": "Point", "coordinates": ["$location.lon", "$location.lat"]}}}]
+    )
+    print(f"✅ Added GeoJSON points to {backfilled.modified_count} analysis records")
+    return backfilled.modified_count
+
+
+# --- FILTERS ---
+def build_match(user_id: str = None, fish_class: str = None, start: datetime = None, end: datetime = None):
+    match = {}
+    if user_id:
+        match["user_id"] = user_id
+    if fish_class:
+        match["fish_class"] = fish_class
+    if start or end:
+        match["created_at"] = {}
+        if start:
+            match["created_at"]["$gte"] = start
+        if end:
+            match["created_at"]["$lt"] = end
+    return match
+
+
+TOTALS = {
+    "catches": {"$sum": 1},
+    "qty_captured": {"$sum": "$qty_captured"},
+    "weight_kg": {"$sum": "$weight_kg"},
+    "total_price": {"$sum": "$total_price"},
+}
+
+
+def totals_pipeline(match: dict, group_by: str):
+    """Totals per `group_by` field (fish_class or user_id), largest revenue first."""
+    return [
+        {"$match": match},
+        {"$group": {"_id": f"${group_by}", **TOTALS, "last_catch": {"$max": "$created_at"}}},
+        {"$sort": {"total_price": -1}},
+        {"$project": {"_id": 0, group_by: "$_id", **{k: 1 for k in TOTALS}, "last_catch": 1}},
+    ]
+
+
+def timeseries_pipeline(match: dict, bucket: str, timezone: str = "Asia/Kolkata"):
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": {"$dateTrunc": {"date": "$created_at", "unit": bucket, "timezone": timezone}},
+            **TOTALS,
+        }},
+        {"$sort": {"_id": 1}},
+        {"$project": {"_id": 0, "bucket": "$_id", **{k: 1 for k in TOTALS}}},
+    ]
+
+
+def near_pipeline(lat: float, lon: float, radius_km: float, match: dict, limit: int):
+    # $geoNear has to be the first stage and uses the 2dsphere index on geo
+    return [
+        {"$geoNear": {
+            "near": {"type": "Point", "coordinates": [lon, lat]},
+            "distanceField": "distance_km",
+            "distanceMultiplier": 0.001,
+            "maxDistance": radius_km * 1000,
+            "query": match,
+            "spherical": True,
+        }},
+        {"$limit": limit},
+    ]
+
+
+def near_totals_pipeline(lat: float, lon: float, radius_km: float, match: dict):
+    return [
+        {"$geoNear": {
+            "near": {"type": "Point", "coordinates": [lon, lat]},
+            "distanceField": "distance_km",
+            "maxDistance": radius_km * 1000,
+            "query": match,
+            "spherical": True,
+        }},
+        {"$group": {"_id": "$fish_class", **TOTALS}},
+        {"$sort": {"total_price": -1}},
+        {"$project": {"_id": 0, "fish_class": "$_id", **{k: 1 for k in TOTALS}}},
+    ]
+
+
+# --- KEYSET PAGINATION ---
+RECORD_SORT = [("created_at", DESCENDING), ("_id", DESCENDING)]
+
+
+def encode_cursor(doc: dict) -> str:
+    raw = json.dumps([doc["created_at"].isoformat(), str(doc["_id"])])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, oid = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), ObjectId(oid)
+    except Exception:
+        raise ValueError("invalid cursor")
+
+
+def after_cursor(match: dict, cursor: str):
+    """Restricts `match` to records strictly after the cursor in RECORD_SORT order."""
+    if not cursor:
+        return match
+    created_at, oid = decode_cursor(cursor)
+    return {"$and": [match, {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "_id": {"$lt": oid}},
+    ]}]}
+
+
+def serialize(doc: dict) -> dict:
+    out = {}
+    for key, value in doc.items():
+        if isinstance(value, ObjectId):
+            value = str(value)
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        out["id" if key == "_id" else key] = value
+    return out
+
+
+if __name__ == "__main__":
+    from app.db.mongo import close_mongo_connection, connect_to_mongo, db
+
+    parser = argparse.ArgumentParser(description="One-off maintenance for the analysis collection")
+    parser.add_argument("command", choices=["backfill-geo", "indexes"])
+    args = parser.parse_args()
+
+    async def run():
+        await connect_to_mongo()
+        try:
+            if args.command == "backfill-geo":
+                await backfill_geo(db.database)
+            await ensure_indexes(db.database)
+        finally:
+            await close_mongo_connection()
+
+    asyncio.run(run())
@@ -0,0 +1,208 @@
+"""
+Background Cloudinary uploads.
+
+Archiving the user's photo is not something the caller waits for, so
+routes hand the bytes to `upload_queue.submit()` and return straight
+away with an `upload_id`. A few worker tasks upload from memory (no temp
+files), retry failures with exponential backoff, and then record the
+resulting URL:
+
+  * in the `uploads` collection ({_id: upload_id, status, image_url})
+  * on any `analysis` documents already saved with that upload_id
+
+save_analysis does the reverse lookup, so the URL ends up on the
+analysis record whichever of the two finishes first.
+"""
+import asyncio
+import random
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from app import config
+from app.db.mongo import db
+from app.services.executor import run_blocking
+from fishapp.metrics import fallback, stage
+from app.services.registry import lazy_service
+
+
+# ✅ Configure Cloudinary once for every route, on the first upload
+def _configure_cloudinary():
+    import cloudinary
+    import cloudinary.uploader
+
+    cloudinary.config(
+        cloud_name=config.CLOUDINARY_CLOUD_NAME,
+        api_key=config.CLOUDINARY_API_KEY,
+        api_secret=config.CLOUDINARY_API_SECRET,
+        **({"upload_prefix": config.CLOUDINARY_UPLOAD_PREFIX} if config.CLOUDINARY_UPLOAD_PREFIX else {})
+    )
+    return cloudinary.uploader
+
+
+cloudinary_uploader = lazy_service("cloudinary", _configure_cloudinary)
+
+
+class UploadQueue:
+    def __init__(self, concurrency: int = 4, max_retries: int = 4, base_delay: float = 1.0,
+                 max_pending: int = 1000, remember: int = 5000):
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_pending = max_pending
+        self._queue = None
+        self._workers = []
+        # Recent outcomes, so save_analysis rarely needs the DB lookup
+        self._results = OrderedDict()
+        self._remember = remember
+        self.submitted = 0
+        self.uploaded = 0
+        self.failed = 0
+        self.retries = 0
+        self.dropped = 0
+
+    # --- LIFECYCLE ---
+    async def start(self):
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.concurrency)]
+
+    async def stop(self, drain_timeout: float = 10.0):
+        if not self._workers:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), drain_timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ Upload queue stopped with {self._queue.qsize()} uploads still pending")
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    # --- PRODUCER SIDE ---
+    def submit(self, data: bytes, filename: str = None, **options):
+        """Queues an upload and returns its id, or None if the queue is full or not running."""
+        if self._queue is None:
+            print("⚠️ Upload queue not started, skipping archive upload")
+            self.dropped += 1
+            return None
+
+        upload_id = uuid.uuid4().hex
+        try:
+            self._queue.put_nowait((upload_id, data, filename, options))
+        except asyncio.QueueFull:
+            print("⚠️ Upload queue full, skipping archive upload")
+            self.dropped += 1
+            fallback("upload_dropped")
+            return None
+
+        self.submitted += 1
+        self._set_result(upload_id, {"status": "pending", "image_url": None})
+        return upload_id
+
+    def result(self, upload_id: str):
+        return self._results.get(upload_id)
+
+    # --- WORKER SIDE ---
+    def _set_result(self, upload_id, value):
+        self._results[upload_id] = value
+        self._results.move_to_end(upload_id)
+        while len(self._results) > self._remember:
+            self._results.popitem(last=False)
+
+    async def _upload_with_retry(self, data, filename, options):
+        for attempt in range(self.max_retries + 1):
+            try:
+                uploader = await cloudinary_uploader.aget()
+                return await run_blocking("cloudinary", uploader.upload, data, filename=filename, **options)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                delay = self.base_delay * (2 ** attempt) * (0.5 + random.random())
+                print(f"⚠️ Cloudinary upload failed ({e}), retry {attempt + 1} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def _record(self, upload_id, status, image_url=None, error=None):
+        self._set_result(upload_id, {"status": status, "image_url": image_url})
+        if db.database is None:
+            return
+        try:
+            await db.database.get_collection("uploads").update_one(
+                {"_id": upload_id},
+                {"$set": {"status": status, "image_url": image_url, "error": error,
+                          "updated_at": datetime.now(timezone.utc)}},
+                upsert=True
+            )
+            if image_url:
+                await db.database.get_collection("analysis").update_many(
+                    {"upload_id": upload_id, "image_url": {"$exists": False}},
+                    {"$set": {"image_url": image_url}}
+                )
+        except Exception as e:
+            print(f"⚠️ Could not record upload {upload_id}: {e}")
+
+    async def _worker(self, n):
+        while True:
+            upload_id, data, filename, options = await self._queue.get()
+            started = time.perf_counter()
+            try:
+                # Includes retries and backoff; single attempts are in fishapp_upstream_seconds
+                with stage("cloudinary_upload"):
+                    result = await self._upload_with_retry(data, filename, options)
+                self.uploaded += 1
+                await self._record(upload_id, "done", image_url=result.get("secure_url"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                print(f"❌ Cloudinary upload {upload_id} gave up after {time.perf_counter() - started:.1f}s: {e}")
+                await self._record(upload_id, "failed", error=str(e))
+            finally:
+                self._queue.task_done()
+
+    def stats(self):
+        return {
+            "pending": self._queue.qsize() if self._queue else 0,
+            "concurrency": self.concurrency,
+            "submitted": self.submitted,
+            "uploaded": self.uploaded,
+            "failed": self.failed,
+            "retries": self.retries,
+            "dropped": self.dropped,
+        }
+
+
+upload_queue = UploadQueue(
+    concurrency=config.UPLOAD_CONCURRENCY,
+    max_retries=config.UPLOAD_MAX_RETRIES,
+    max_pending=config.UPLOAD_MAX_PENDING
+)
+
+
+async def lookup_upload_url(upload_id: str):
+    """URL for a finished upload, from memory or the uploads collection."""
+    known = upload_queue.result(upload_id)
+    if known and known.get("image_url"):
+        return known["image_url"]
+    if db.database is None:
+        return None
+    doc = await db.database.get_collection("uploads").find_one({"_id": upload_id})
+    return doc.get("image_url") if doc else None
+
+
+async def link_upload_url(analysis_id, upload_id: str):
+    """
+    Sets image_url on an analysis record that was inserted without one.
+    An upload that finished between the caller's lookup and its insert
+    updated nothing (the record didn't exist yet), so look again.
+    """
+    image_url = await lookup_upload_url(upload_id)
+    if image_url and db.database is not None:
+        await db.database.get_collection("analysis").update_one(
+            {"_id": analysis_id, "image_url": {"$exists": False}},
+            {"$set": {"image_url": image_url}}
+        )
+    return image_url
@@ -0,0 +1,155 @@
+"""
+Run blocking upstream calls off the event loop.
+
+Each upstream (Gemini, Cloudinary, Roboflow, the Gradio heatmap Space,
+the online geocoder) gets its own small thread pool, an in-flight limit
+and a timeout, so one slow upstream can only tie up its own threads and
+never stalls requests that don't touch it.
+
+    result = await run_blocking("gemini", client.models.generate_content, model=..., contents=...)
+
+Limits come from the environment, e.g. UPSTREAM_GEMINI_WORKERS=8,
+UPSTREAM_GEMINI_MAX_INFLIGHT=32, UPSTREAM_GEMINI_TIMEOUT=30.
+"""
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fishapp.metrics import UPSTREAM_ERRORS, observe_upstream
+
+# name: (workers, max in-flight incl. queued, timeout seconds)
+DEFAULT_LIMITS = {
+    "gemini": (8, 32, 30.0),
+    "cloudinary": (4, 64, 60.0),
+    "roboflow": (8, 32, 30.0),
+    "gradio": (8, 64, 20.0),
+    "geocode": (1, 4, 10.0),  # Nominatim allows ~1 req/s
+}
+
+
+class UpstreamError(Exception):
+    status_code = 502
+
+
+class UpstreamBusy(UpstreamError):
+    status_code = 503
+
+
+class UpstreamTimeout(UpstreamError):
+    status_code = 504
+
+
+def _env_limit(name, key, default, cast):
+    return cast(os.getenv(f"UPSTREAM_{name.upper()}_{key}", default))
+
+
+class Upstream:
+    def __init__(self, name: str, workers: int, max_inflight: int, timeout: float):
+        self.name = name
+        self.workers = workers
+        self.max_inflight = max(max_inflight, workers)
+        self.timeout = timeout
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"upstream-{name}")
+        # Counted with a plain lock so the limit holds across event loops
+        self._inflight = 0
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls, name: str):
+        workers, inflight, timeout = DEFAULT_LIMITS.get(name, (4, 16, 30.0))
+        return cls(
+            name,
+            workers=_env_limit(name, "WORKERS", workers, int),
+            max_inflight=_env_limit(name, "MAX_INFLIGHT", inflight, int),
+            timeout=_env_limit(name, "TIMEOUT", timeout, float),
+        )
+
+    def _acquire(self):
+        with self._lock:
+            if self._inflight >= self.max_inflight:
+                self.rejected += 1
+                return False
+            self._inflight += 1
+            return True
+
+    def _release(self, *_):
+        with self._lock:
+            self._inflight -= 1
+
+    async def run(self, fn, *args, timeout: float = None, **kwargs):
+        if not self._acquire():
+            UPSTREAM_ERRORS.labels(self.name, "busy").inc()
+            raise UpstreamBusy(f"{self.name} is at its limit of {self.max_inflight} in-flight calls")
+
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(self.pool, functools.partial(fn, *args, **kwargs))
+        except BaseException:
+            # Never scheduled (e.g. the pool was shut down), so no callback will free the slot
+            self._release()
+            raise
+        # The slot is freed when the thread finishes, even if we stop waiting
+        future.add_done_callback(self._release)
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            observe_upstream(self.name, time.perf_counter() - start, "timeout")
+            raise UpstreamTimeout(f"{self.name} did not answer within {timeout or self.timeout:.0f}s")
+        except Exception:
+            self.failed += 1
+            observe_upstream(self.name, time.perf_counter() - start, "error")
+            raise
+        self.completed += 1
+        observe_upstream(self.name, time.perf_counter() - start)
+        return result
+
+    def stats(self):
+        with self._lock:
+            inflight = self._inflight
+        return {
+            "workers": self.workers,
+            "max_inflight": self.max_inflight,
+            "timeout_seconds": self.timeout,
+            "inflight": inflight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+        }
+
+
+_upstreams = {}
+_upstreams_lock = threading.Lock()
+
+
+def get_upstream(name: str) -> Upstream:
+    with _upstreams_lock:
+        if name not in _upstreams:
+            _upstreams[name] = Upstream.from_env(name)
+        return _upstreams[name]
+
+
+async def run_blocking(name: str, fn, *args, **kwargs):
+    """Runs fn(*args, **kwargs) on the named upstream's pool and awaits it."""
+    return await get_upstream(name).run(fn, *args, **kwargs)
+
+
+def upstream_stats():
+    with _upstreams_lock:
+        return {name: u.stats() for name, u in _upstreams.items()}
+
+
+def shutdown_executors(wait: bool = False):
+    with _upstreams_lock:
+        for upstream in _upstreams.values():
+            upstream.pool.shutdown(wait=wait, cancel_futures=True)
+        _upstreams.clear()
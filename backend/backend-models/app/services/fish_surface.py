@@ -0,0 +1,284 @@
+"""
+Precomputed fish-probability surface.
+
+The remote Space is sampled once over the Indian EEZ on a regular grid
+and the result is stored as a versioned .npy array plus a small .json
+sidecar (grid origin, step, and which array file is current). The
+sidecar is written last and is the commit point, so a reader never sees
+a new array with old metadata. The app memory-maps the array and answers
+a point with bilinear interpolation, so /heatmap/predict only calls the
+Space for points outside the surface.
+
+With FISH_SURFACE_REFRESH_HOURS > 0 an existing surface is rebuilt once
+it is older than that; only the worker holding the .lock file does the
+sweep. The first surface is built with the CLI, never by a worker.
+
+Grid nodes are at (lat0 + r * step, lon0 + c * step), row 0 = south.
+Land nodes are skipped by default and stored as NaN.
+
+Build or rebuild the surface with:
+    python -m app.services.fish_surface --out data/fish_surface.npy --step 0.25
+    python -m app.services.fish_surface --stub   # synthetic values, no network
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, run a single worker
+    fcntl = None
+
+from app.services.heatmap_grid import predict_cells
+from app.services.price_loader import resolve_data_path
+
+# Indian EEZ incl. Andaman & Nicobar and Lakshadweep (approx.)
+EEZ_BOUNDS = (3.5, 65.5, 24.5, 94.5)  # min_lat, min_lon, max_lat, max_lon
+
+
+def stub_probability(lat: float, lon: float) -> float:
+    """Smooth, deterministic stand-in for the Space, for offline runs."""
+    return round(50 + 30 * math.sin(lat / 3.0) * math.cos(lon / 4.0) + 10 * math.sin((lat + lon) / 7.0), 2)
+
+
+def _sidecar(path):
+    return os.path.splitext(path)[0] + ".json"
+
+
+def _array_path(path, version):
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{version}{ext or '.npy'}"
+
+
+class FishSurface:
+    def __init__(self, values, lat0: float, lon0: float, step: float, version: str = "", created_at: float = 0.0):
+        self.values = values
+        self.lat0 = lat0
+        self.lon0 = lon0
+        self.step = step
+        self.rows, self.cols = values.shape
+        self.version = version
+        self.created_at = created_at
+
+    @classmethod
+    def load(cls, path: str):
+        """Memory-maps the array the sidecar points at; pages are only read when touched."""
+        with open(_sidecar(path), encoding="utf-8") as f:
+            meta = json.load(f)
+        # Older surfaces kept the array at `path` itself
+        array = os.path.join(os.path.dirname(path), meta["array"]) if "array" in meta else path
+        values = np.load(array, mmap_mode="r")
+        return cls(values, meta["lat0"], meta["lon0"], meta["step"], meta.get("version", ""), meta.get("created_at", 0.0))
+
+    def save(self, path: str, keep: int = 2):
+        """
+        Writes the array under a versioned name, then swaps in the sidecar
+        that points at it. Only the newest `keep` arrays are kept; readers
+        that already mapped an older one keep its inode.
+        """
+        array = _array_path(path, self.version)
+        tmp = array + ".tmp.npy"
+        np.save(tmp, np.asarray(self.values, dtype=np.float32))
+        os.replace(tmp, array)
+        meta = {
+            "array": os.path.basename(array),
+            "lat0": self.lat0, "lon0": self.lon0, "step": self.step,
+            "rows": self.rows, "cols": self.cols,
+            "version": self.version, "created_at": self.created_at,
+        }
+        with open(_sidecar(path) + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(_sidecar(path) + ".tmp", _sidecar(path))  # commit point
+
+        stem, ext = os.path.splitext(path)
+        folder = os.path.dirname(path) or "."
+        prefix = os.path.basename(stem) + "."
+        older = sorted(
+            (os.path.join(folder, f) for f in os.listdir(folder)
+             if f.startswith(prefix) and f.endswith(ext or ".npy") and not f.endswith(".tmp.npy")),
+            key=lambda f: (os.path.getmtime(f), f)
+        )
+        for old in older[:-keep] if keep else []:
+            if old != array:
+                try:
+                    os.remove(old)
+                except OSError:
+                    pass
+
+    def interpolate(self, lat: float, lon: float):
+        """Bilinear value at the point, or None outside the grid / over land."""
+        y = (lat - self.lat0) / self.step
+        x = (lon - self.lon0) / self.step
+        if not (0 <= y <= self.rows - 1 and 0 <= x <= self.cols - 1):
+            return None
+
+        r = min(int(y), self.rows - 2) if self.rows > 1 else 0
+        c = min(int(x), self.cols - 2) if self.cols > 1 else 0
+        fy, fx = y - r, x - c
+        total = weight = 0.0
+        for dr, wy in ((0, 1 - fy), (1, fy)):
+            for dc, wx in ((0, 1 - fx), (1, fx)):
+                w = wy * wx
+                if w == 0 or r + dr >= self.rows or c + dc >= self.cols:
+                    continue
+                v = float(self.values[r + dr, c + dc])
+                # Coastal cells: drop NaN (land) corners and renormalise
+                if not math.isnan(v):
+                    total += w * v
+                    weight += w
+        if weight < 0.25:
+            return None
+        return round(total / weight, 2)
+
+    def info(self):
+        return {
+            "version": self.version,
+            "created_at": self.created_at,
+            "bounds": [self.lat0, self.lon0, self.lat0 + (self.rows - 1) * self.step, self.lon0 + (self.cols - 1) * self.step],
+            "step": self.step,
+            "shape": [self.rows, self.cols],
+        }
+
+
+async def precompute_surface(fetch, bounds=EEZ_BOUNDS, step: float = 0.25, concurrency: int = 16, is_land=None):
+    """Samples `await fetch(lat, lon)` on every grid node and returns a FishSurface."""
+    min_lat, min_lon, max_lat, max_lon = bounds
+    rows = int(round((max_lat - min_lat) / step)) + 1
+    cols = int(round((max_lon - min_lon) / step)) + 1
+    nodes = [(min_lat + r * step, min_lon + c * step) for r in range(rows) for c in range(cols)]
+
+    sea = [i for i, (lat, lon) in enumerate(nodes) if not (is_land and is_land(lat, lon))]
+    start = time.perf_counter()
+    # Its own limit: a sweep would otherwise hold the grid endpoints' shared cap for minutes
+    sampled = await predict_cells(fetch, [nodes[i] for i in sea], asyncio.Semaphore(concurrency))
+
+    values = np.full(rows * cols, np.nan, dtype=np.float32)
+    for i, v in zip(sea, sampled):
+        if v is not None:
+            values[i] = v
+
+    missing = sum(v is None for v in sampled)
+    print(f"✅ Sampled {len(sea)} sea nodes of {rows}x{cols} in {time.perf_counter() - start:.1f}s ({missing} failed)")
+    created = time.time()
+    return FishSurface(values.reshape(rows, cols), min_lat, min_lon, step, version=str(int(created)), created_at=created)
+
+
+class SurfaceStore:
+    """Holds the current surface and swaps in rebuilt ones, like PriceStore."""
+
+    def __init__(self, path: str):
+        self.path = resolve_data_path(path)
+        self.current = None
+        self._mtime = None
+        self._task = None
+        self.reload()
+
+    def reload(self):
+        try:
+            # The sidecar is replaced last, so its mtime marks a complete new surface
+            mtime = os.path.getmtime(_sidecar(self.path))
+            if mtime == self._mtime:
+                return self.current
+            self.current = FishSurface.load(self.path)
+            self._mtime = mtime
+            print(f"✅ Fish surface {self.current.version} loaded {self.current.rows}x{self.current.cols}")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"⚠️ Could not load fish surface {self.path}: {e}")
+        return self.current
+
+    @property
+    def version(self):
+        surface = self.current
+        return surface.version if surface is not None else "none"
+
+    def interpolate(self, lat: float, lon: float):
+        surface = self.current
+        return surface.interpolate(lat, lon) if surface is not None else None
+
+    def is_stale(self, max_age: float):
+        """Only an existing surface goes stale; the first one is built with the CLI."""
+        surface = self.current
+        return surface is not None and time.time() - surface.created_at > max_age
+
+    # --- BACKGROUND REFRESH ---
+    def _try_lock(self):
+        """An open lock file if this process may rebuild now, else None (another worker is on it)."""
+        f = open(self.path + ".lock", "a")
+        if fcntl is None:
+            return f
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return None
+        return f
+
+    async def refresh(self, fetch, step: float, concurrency: int, is_land=None):
+        lock = self._try_lock()
+        if lock is None:
+            return self.current
+        try:
+            # Another worker may have finished a sweep while we waited for our turn
+            self.reload()
+            surface = await precompute_surface(fetch, step=step, concurrency=concurrency, is_land=is_land)
+            await asyncio.to_thread(surface.save, self.path)
+        finally:
+            lock.close()  # releases the flock
+        return self.reload()
+
+    async def _refresh_loop(self, fetch, interval, step, concurrency, is_land):
+        while True:
+            # Another worker (or the CLI) may already have written a newer file
+            self.reload()
+            if self.is_stale(interval):
+                try:
+                    await self.refresh(fetch, step, concurrency, is_land)
+                except Exception as e:
+                    print(f"⚠️ Fish surface refresh failed, keeping the old one: {e}")
+            await asyncio.sleep(min(interval, 600))
+
+    def start_refresh(self, fetch, interval: float, step: float, concurrency: int = 16, is_land=None):
+        if interval <= 0 or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._refresh_loop(fetch, interval, step, concurrency, is_land))
+
+    async def stop_refresh(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+
+if __name__ == "__main__":
+    from app import config
+
+    parser = argparse.ArgumentParser(description="Sample the fish-probability Space over the Indian EEZ")
+    parser.add_argument("--out", default=config.FISH_SURFACE_PATH)
+    parser.add_argument("--step", type=float, default=config.FISH_SURFACE_STEP)
+    parser.add_argument("--concurrency", type=int, default=config.HEATMAP_GRID_CONCURRENCY)
+    parser.add_argument("--stub", action="store_true", help="use a synthetic surface instead of the Space")
+    parser.add_argument("--include-land", action="store_true")
+    args = parser.parse_args()
+
+    if args.stub:
+        async def fetch(lat, lon):
+            return stub_probability(lat, lon)
+    else:
+        from app.routes.heatmap import fetch_probability as fetch
+
+    is_land = None
+    if not args.include_land:
+        from app.services.geolocation import state_resolver
+        is_land = lambda lat, lon: state_resolver.resolve(lat, lon) is not None
+
+    surface = asyncio.run(precompute_surface(fetch, step=args.step, concurrency=args.concurrency, is_land=is_land))
+    surface.save(resolve_data_path(args.out))
+    print(f"✅ Surface written to {resolve_data_path(args.out)}")
@@ -0,0 +1,314 @@
+"""
+Gateway in front of Gemini species identification.
+
+    species = await gemini_gateway.identify(image_data)
+
+* Single-flight: concurrent requests for the same bytes share one call.
+* Multi-image prompts: images that arrive within `max_wait_ms` of each
+  other are packed (up to `max_batch`) into one request that numbers
+  them and asks for a JSON array back, which is split into per-image
+  answers. Any image the reply leaves out (or a reply that doesn't
+  parse) is retried on its own with the normal single-image prompt.
+* Budget: calls/second and tokens/minute buckets. A call waits for
+  budget up to `max_wait` seconds, then fails with UpstreamBusy (503).
+
+Batching is opt-in (max_batch=1, the default, sends every image as
+exactly the single-image request). A multi-image prompt relies on the
+model numbering its answers correctly; if it swaps two images, both
+callers get the other's species and nothing detects it. Only turn it on
+where the saved calls are worth that risk.
+
+Calls run as tasks the gateway keeps track of; stop() cancels them at
+shutdown.
+"""
+import asyncio
+import json
+import re
+import time
+
+from app.services.executor import UpstreamBusy, run_blocking
+from fishapp.metrics import BATCH_SIZE, STAGE_SECONDS
+from fishapp.result_cache import content_key
+
+# Rough request cost before the real usage comes back (Gemini bills ~258 tokens per small image)
+TOKENS_PER_IMAGE = 258
+TOKENS_PER_PROMPT = 60
+
+BATCH_INSTRUCTIONS = (
+    "Identify the fish species in each of the {n} numbered images above. "
+    "For each one give the Common English name and the local name (e.g., Hindi or Marathi) "
+    "if applicable, formatted 'English Name (Local Name)'. "
+    "Reply with only a JSON array of {n} objects in image order, like "
+    '[{{"image": 1, "species": "English Name (Local Name)"}}].'
+)
+
+
+class Budget:
+    """Token buckets for calls/second and tokens/minute; 0 disables either."""
+
+    def __init__(self, max_qps: float = 0, tokens_per_minute: int = 0, max_wait: float = 10.0):
+        self.max_qps = max_qps
+        self.tokens_per_minute = tokens_per_minute
+        self.max_wait = max_wait
+        self._calls = max(1.0, max_qps)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = None
+        self.waits = 0
+        self.rejected = 0
+        self.tokens_used = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed, self._updated = now - self._updated, now
+        if self.max_qps:
+            self._calls = min(max(1.0, self.max_qps), self._calls + elapsed * self.max_qps)
+        if self.tokens_per_minute:
+            self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def _wait_needed(self, tokens):
+        wait = 0.0
+        if self.max_qps and self._calls < 1:
+            wait = (1 - self._calls) / self.max_qps
+        if self.tokens_per_minute:
+            # A request bigger than the whole bucket only needs a full bucket
+            needed = min(tokens, self.tokens_per_minute)
+            if self._tokens < needed:
+                wait = max(wait, (needed - self._tokens) * 60 / self.tokens_per_minute)
+        return wait
+
+    async def acquire(self, tokens: int):
+        if not self.max_qps and not self.tokens_per_minute:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        deadline = time.monotonic() + self.max_wait
+        # One waiter at a time, so callers are served in arrival order
+        async with self._lock:
+            while True:
+                self._refill()
+                wait = self._wait_needed(tokens)
+                if wait <= 0:
+                    self._calls -= 1
+                    self._tokens -= tokens
+                    return
+                if time.monotonic() + wait > deadline:
+                    self.rejected += 1
+                    raise UpstreamBusy("Gemini budget exhausted, try again shortly")
+                self.waits += 1
+                await asyncio.sleep(wait)
+
+    def settle(self, estimated: int, actual: int):
+        """Corrects the estimate once the response reports real usage."""
+        self.tokens_used += actual
+        if self.tokens_per_minute:
+            self._tokens += estimated - actual
+
+    def stats(self):
+        return {
+            "max_qps": self.max_qps,
+            "tokens_per_minute": self.tokens_per_minute,
+            "tokens_used": self.tokens_used,
+            "waits": self.waits,
+            "rejected": self.rejected,
+        }
+
+
+def parse_batch_reply(text: str, n: int):
+    """The model's JSON array -> n answers (None where an image is missing)."""
+    answers = [None] * n
+    if not text:
+        return answers
+    # Tolerate ```json fences around the array
+    match = re.search(r"\[.*\]", text, re.S)
+    try:
+        items = json.loads(match.group(0) if match else text)
+    except (ValueError, AttributeError):
+        return answers
+    if not isinstance(items, list):
+        return answers
+
+    for position, item in enumerate(items):
+        if isinstance(item, dict):
+            index = item.get("image", position + 1)
+            species = item.get("species")
+        else:
+            index, species = position + 1, item
+        try:
+            index = int(index) - 1
+        except (TypeError, ValueError):
+            continue
+        if 0 <= index < n and isinstance(species, str) and species.strip():
+            answers[index] = species.strip()
+    return answers
+
+
+def _usage_tokens(response):
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "total_token_count", None) if usage is not None else None
+
+
+class GeminiGateway:
+    def __init__(self, client, model: str, prompt, max_batch: int = 1, max_wait_ms: float = 25,
+                 budget: Budget = None):
+        self.client = client  # registry.LazyService around a genai.Client
+        self.model = model
+        self.prompt = list(prompt)
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000
+        self.budget = budget or Budget()
+        self._inflight = {}
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+        self.requests = 0
+        self.coalesced = 0
+        self.calls = 0
+        self.batched_images = 0
+        self.retried = 0
+
+    # --- CALLER SIDE ---
+    async def identify(self, image_data: bytes, mime_type: str = "image/jpeg"):
+        """Species text for one image (None if the model gave nothing back)."""
+        self.requests += 1
+        key = content_key(image_data, mime_type)
+        if key in self._inflight:
+            self.coalesced += 1
+            return await asyncio.shield(self._inflight[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        self._enqueue((image_data, mime_type, future, time.perf_counter()))
+        return await asyncio.shield(future)
+
+    def _spawn(self, items):
+        # The loop only keeps weak references to tasks; hold them until they finish
+        task = asyncio.ensure_future(self._run(items))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _enqueue(self, item):
+        if self.max_batch == 1:
+            self._spawn([item])
+            return
+        self._pending.append(item)
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+        if batch:
+            self._spawn(batch)
+        if self._pending:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+
+    # --- CALLS ---
+    async def _generate(self, contents, images: int, config=None):
+        estimated = TOKENS_PER_PROMPT + TOKENS_PER_IMAGE * images
+        await self.budget.acquire(estimated)
+        self.calls += 1
+        client = await self.client.aget()
+        response = await run_blocking(
+            "gemini",
+            client.models.generate_content,
+            model=self.model,
+            contents=contents,
+            **({"config": config} if config is not None else {})
+        )
+        actual = _usage_tokens(response)
+        self.budget.settle(estimated, actual if actual is not None else estimated)
+        return response
+
+    async def _single(self, item):
+        from google.genai import types
+
+        image_data, mime_type, future, _ = item
+        try:
+            response = await self._generate(
+                [types.Part.from_bytes(data=image_data, mime_type=mime_type), *self.prompt], images=1
+            )
+            if not future.done():
+                future.set_result(response.text.strip() if response.text else None)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+
+    async def _run(self, items):
+        try:
+            # Built on first use; its factory imports google.genai, so `types` is cheap after this
+            await self.client.aget()
+        except Exception as e:
+            for _, _, future, _ in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        from google.genai import types
+
+        now = time.perf_counter()
+        for *_, queued in items:
+            STAGE_SECONDS.labels("gemini_batch_wait").observe(now - queued)
+        BATCH_SIZE.labels("gemini").observe(len(items))
+        if len(items) == 1:
+            await self._single(items[0])
+            return
+
+        contents = []
+        for i, (image_data, mime_type, _, _) in enumerate(items, start=1):
+            contents += [f"Image {i}:", types.Part.from_bytes(data=image_data, mime_type=mime_type)]
+        contents.append(BATCH_INSTRUCTIONS.format(n=len(items)))
+
+        try:
+            response = await self._generate(
+                contents, images=len(items),
+                config=types.GenerateContentConfig(response_mime_type="application/json")
+            )
+        except Exception as e:
+            for _, _, future, _ in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batched_images += len(items)
+        missing = []
+        for item, answer in zip(items, parse_batch_reply(response.text, len(items))):
+            if answer is None:
+                missing.append(item)
+            elif not item[2].done():
+                item[2].set_result(answer)
+        if missing:
+            # Ask again one at a time rather than guess
+            self.retried += len(missing)
+            await asyncio.gather(*(self._single(item) for item in missing))
+
+    async def stop(self):
+        """Cancels queued and running calls; their callers see CancelledError."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._pending = []
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for future in list(self._inflight.values()):
+            future.cancel()
+
+    def stats(self):
+        return {
+            "max_batch": self.max_batch,
+            "running": len(self._tasks),
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "calls": self.calls,
+            "batched_images": self.batched_images,
+            "retried": self.retried,
+            "inflight": len(self._inflight),
+            "pending": len(self._pending),
+            **{f"budget_{k}": v for k, v in self.budget.stats().items()},
+        }
@@ -0,0 +1,97 @@
+"""
+Lat/lon -> state cache keyed on quantized coordinates.
+
+Catches are logged from a fairly small set of harbours and grounds, so
+points are snapped to a grid (GEOCODE_CACHE_RESOLUTION degrees, 0.01 is
+about 1.1 km) and the resolved state is cached per cell with LRU
+eviction. "No state" answers are cached too.
+
+The cache can be saved to / loaded from a JSON file so a restart doesn't
+start cold. The file records the grid resolution and the boundary data
+version; a mismatch discards it.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+
+_NO_STATE = ""
+
+
+class GeocodeCache:
+    def __init__(self, resolution_deg: float = 0.01, max_entries: int = 50000, data_version: str = ""):
+        self.resolution = float(resolution_deg)
+        self.max_entries = max(1, int(max_entries))
+        self.data_version = data_version
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, lat: float, lon: float):
+        return (round(lat / self.resolution), round(lon / self.resolution))
+
+    def get(self, lat: float, lon: float):
+        """Returns (found, state). state may be None for a cached miss."""
+        key = self.key(lat, lon)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                value = self._entries[key]
+                return True, (value or None)
+            self.misses += 1
+            return False, None
+
+    def set(self, lat: float, lon: float, state):
+        key = self.key(lat, lon)
+        with self._lock:
+            self._entries[key] = state or _NO_STATE
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    # --- PERSISTENCE ---
+    def save(self, path: str):
+        with self._lock:
+            payload = {
+                "resolution": self.resolution,
+                "data_version": self.data_version,
+                "entries": [[k[0], k[1], v] for k, v in self._entries.items()],
+            }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str):
+        if not os.path.exists(path):
+            return 0
+        try:
+            with open(path, encoding="utf-8") as f:
+                payload = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Ignoring unreadable geocode cache {path}: {e}")
+            return 0
+        if payload.get("resolution") != self.resolution or payload.get("data_version") != self.data_version:
+            print("⚠️ Geocode cache was built with different settings, starting empty")
+            return 0
+        with self._lock:
+            for lat_q, lon_q, state in payload.get("entries", [])[-self.max_entries:]:
+                self._entries[(lat_q, lon_q)] = state
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "resolution_deg": self.resolution,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
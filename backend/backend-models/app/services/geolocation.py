@@ -1,6 +1,40 @@
-from geopy.geocoders import Nominatim
+import asyncio
 
-geolocator = Nominatim(user_agent="fish-price-app")
+from app import config
+from app.services.executor import run_blocking
+from app.services.geocode_cache import GeocodeCache
+from app.services.state_resolver import StateResolver
+from fishapp.metrics import UPSTREAM_ERRORS, cache_event, fallback
+from app.services.registry import lazy_service
+
+# Offline point-in-polygon lookup against bundled state/UT boundaries
+state_resolver = StateResolver.from_geojson(config.STATE_BOUNDARIES_PATH)
+# Rough outline of India's waters (EEZ plus a strip of coast, no foreign land):
+# only points inside it are given the nearest coastal state
+india_waters = StateResolver.from_geojson(config.INDIA_WATERS_PATH)
+
+# Results per ~1 km cell; a new boundary file invalidates saved entries
+geocode_cache = GeocodeCache(
+    resolution_deg=config.GEOCODE_CACHE_RESOLUTION,
+    max_entries=config.GEOCODE_CACHE_SIZE,
+    data_version=f"{state_resolver.version}:{india_waters.version}"
+)
+
+# Online reverse geocoding is an optional fallback (Nominatim allows ~1 req/s)
+def _make_geolocator():
+    from geopy.geocoders import Nominatim
+    return Nominatim(
+        user_agent="fish-price-app",
+        domain=config.NOMINATIM_DOMAIN,
+        scheme=config.NOMINATIM_SCHEME
+    )
+
+
+geolocator = lazy_service("geolocator", _make_geolocator)
+
+
+def get_geolocator():
+    return geolocator.get()
 
 # Coastal state boundaries (approximate)
 COASTAL_STATE_BOUNDS = {
@@ -19,17 +53,97 @@ COASTAL_STATE_BOUNDS = {
     "Daman & Diu": {"lat_min": 20.5, "lat_max": 21.0, "lon_min": 70.0, "lon_max": 71.0},
 }
 
+# States/UTs with a coastline, as named in the boundary file and price dataset.
+# Points at sea are assigned to the nearest of these.
+COASTAL_STATES = {
+    "Gujarat", "Dadra and Nagar Haveli and Daman and Diu", "Maharashtra", "Goa",
+    "Karnataka", "Kerala", "Tamil Nadu", "Puducherry", "Andhra Pradesh", "Odisha",
+    "West Bengal", "Andaman and Nicobar Islands", "Lakshadweep",
+}
 
 
-def get_state_from_latlon(lat, lon):
-    # Attempt reverse geocoding
-    location = geolocator.reverse((lat, lon), language="en", exactly_one=True)
-    if location and "state" in location.raw.get("address", {}):
-        return location.raw["address"]["state"]
 
-    # Fallback: Check if coordinates fall within coastal state boundaries
+def get_state_from_bounds(lat, lon):
+    # Check if coordinates fall within coastal state boundaries
     for state, bounds in COASTAL_STATE_BOUNDS.items():
         if bounds["lat_min"] <= lat <= bounds["lat_max"] and bounds["lon_min"] <= lon <= bounds["lon_max"]:
+            fallback("geocode_bounds")
             return state
+    return None
 
+
+def get_state_online(lat, lon):
+    try:
+        location = get_geolocator().reverse((lat, lon), language="en", exactly_one=True)
+    except Exception as e:
+        print(f"⚠️ Online reverse geocoding failed: {e}")
+        UPSTREAM_ERRORS.labels("geocode", "error").inc()
+        return None
+    if location and "state" in location.raw.get("address", {}):
+        return location.raw["address"]["state"]
     return None
+
+
+def get_state_at_sea(lat, lon):
+    # A point outside every state polygon is offshore or abroad. Only one in
+    # India's waters gets the nearest coastal state; Karachi or Kathmandu
+    # would otherwise land in Gujarat or West Bengal
+    if india_waters.resolve(lat, lon) is None:
+        return None
+    state, _ = state_resolver.nearest(lat, lon, config.MAX_OFFSHORE_KM, names=COASTAL_STATES)
+    if state:
+        fallback("geocode_nearest_coast")
+    return state
+
+
+def resolve_state_offline(lat, lon):
+    # 1. Offline polygons (microseconds, no network)
+    state = state_resolver.resolve(lat, lon)
+    if state:
+        return state
+
+    # 2. At sea: nearest coastal state within the EEZ
+    return get_state_at_sea(lat, lon)
+
+
+async def aget_state_from_latlon(lat, lon):
+    """
+    Cache, offline polygons, the nearest coast at sea, optional online
+    reverse geocoding, then the coastal rectangles. Everything but the
+    network call runs inline.
+    """
+    found, state = geocode_cache.get(lat, lon)
+    cache_event("geocode", found)
+    if found:
+        return state
+
+    # 1./2. Offline polygons, then the nearest coastal state at sea
+    state = resolve_state_offline(lat, lon)
+    # 3. Optional online reverse geocoding
+    if not state and config.GEOCODER_ONLINE_FALLBACK:
+        state = await run_blocking("geocode", get_state_online, lat, lon)
+    # 4. Last resort: approximate coastal rectangles
+    if not state:
+        state = get_state_from_bounds(lat, lon)
+
+    geocode_cache.set(lat, lon, state)
+    return state
+
+
+def get_state_from_latlon(lat, lon):
+    """aget_state_from_latlon for scripts and other code without an event loop."""
+    return asyncio.run(aget_state_from_latlon(lat, lon))
+
+
+def load_geocode_cache():
+    if config.GEOCODE_CACHE_PATH:
+        count = geocode_cache.load(config.GEOCODE_CACHE_PATH)
+        print(f"✅ Loaded {count} cached geocode cells")
+
+
+def save_geocode_cache():
+    if config.GEOCODE_CACHE_PATH:
+        try:
+            geocode_cache.save(config.GEOCODE_CACHE_PATH)
+        except OSError as e:
+            print(f"⚠️ Could not save geocode cache: {e}")
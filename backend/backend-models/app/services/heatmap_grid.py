@@ -0,0 +1,142 @@
+"""
+Heatmap grids for map viewports.
+
+A viewport is either a lat/lon bounding box plus a cell size in degrees,
+or an XYZ (slippy map) tile split into size x size cells. Every cell
+centre is predicted concurrently, capped by one process-wide semaphore
+shared by all grids and tiles (and by the gradio upstream pool
+underneath), and the result is returned as one
+compact row-major array, row 0 = north, so the app can draw it straight
+into a bitmap.
+
+Bounding boxes are snapped outwards to multiples of the resolution, so
+small pans land on the same cells and the same cache key.
+"""
+import asyncio
+import base64
+import math
+import struct
+
+from app import config
+from fishapp.result_cache import ResultCache
+
+# Cells in flight across every grid and tile request, not per request
+cell_limiter = asyncio.Semaphore(config.HEATMAP_GRID_CONCURRENCY)
+
+
+def tile_bounds(z: int, x: int, y: int):
+    """(min_lat, min_lon, max_lat, max_lon) of a Web Mercator XYZ tile."""
+    n = 2 ** z
+    if not (0 <= x < n and 0 <= y < n):
+        raise ValueError(f"tile {z}/{x}/{y} does not exist")
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return lat(y + 1), x / n * 360.0 - 180.0, lat(y), (x + 1) / n * 360.0 - 180.0
+
+
+def snap_bbox(min_lat, min_lon, max_lat, max_lon, resolution):
+    """Grows the box to whole cells on a global grid of `resolution` degrees."""
+    def down(v):
+        return math.floor(round(v / resolution, 9)) * resolution
+
+    def up(v):
+        return math.ceil(round(v / resolution, 9)) * resolution
+
+    return down(min_lat), down(min_lon), max(up(max_lat), down(min_lat) + resolution), \
+        max(up(max_lon), down(min_lon) + resolution)
+
+
+def cell_centres(min_lat, min_lon, max_lat, max_lon, rows, cols):
+    """Row-major cell centres, north row first."""
+    dlat = (max_lat - min_lat) / rows
+    dlon = (max_lon - min_lon) / cols
+    return [
+        (max_lat - (r + 0.5) * dlat, min_lon + (c + 0.5) * dlon)
+        for r in range(rows)
+        for c in range(cols)
+    ]
+
+
+async def predict_cells(fetch, points, limiter: asyncio.Semaphore):
+    """
+    Runs `await fetch(lat, lon)` for every point, as many at a time as
+    `limiter` allows. Cells whose prediction fails come back as None.
+    """
+    async def one(lat, lon):
+        async with limiter:
+            try:
+                return round(float(await fetch(lat, lon)), 2)
+            except Exception:
+                return None
+
+    return await asyncio.gather(*(one(lat, lon) for lat, lon in points))
+
+
+def encode_values(values):
+    """Little-endian float32 as base64, NaN for missing cells."""
+    packed = struct.pack(f"<{len(values)}f", *(math.nan if v is None else v for v in values))
+    return base64.b64encode(packed).decode("ascii")
+
+
+class HeatmapGrid:
+    def __init__(self, make_fetch, limiter: asyncio.Semaphore = cell_limiter, max_cells: int = 1024,
+                 cache_size: int = 512, cache_ttl: float = 3600, cache_dir: str = None, version=lambda: ""):
+        # make_fetch() -> `fetch(lat, lon)` for one grid, so per-grid setup (the upstream client) happens once
+        self.make_fetch = make_fetch
+        # version() names the data behind the cells; it is part of every cache key
+        self.version = version
+        self.limiter = limiter
+        self.max_cells = max_cells
+        self.cache = ResultCache("heatmap-tiles", max_entries=cache_size, ttl_seconds=cache_ttl, disk_dir=cache_dir)
+        # One computation per tile, even if several requests ask for it at once
+        self._inflight = {}
+
+    async def grid(self, key, bbox, rows, cols):
+        """Cached grid payload for `bbox` split into rows x cols cells."""
+        if rows * cols > self.max_cells:
+            raise ValueError(f"{rows}x{cols} cells is more than the limit of {self.max_cells}")
+
+        cached = await self.cache.aget(key)
+        if cached is not None:
+            return dict(cached, cached=True)
+
+        if key in self._inflight:
+            return dict(await asyncio.shield(self._inflight[key]), cached=False)
+
+        task = asyncio.ensure_future(self._compute(key, bbox, rows, cols))
+        self._inflight[key] = task
+        try:
+            return dict(await asyncio.shield(task), cached=False)
+        finally:
+            if task.done():
+                self._inflight.pop(key, None)
+            else:
+                task.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+    async def _compute(self, key, bbox, rows, cols):
+        values = await predict_cells(self.make_fetch(), cell_centres(*bbox, rows, cols), self.limiter)
+        missing = sum(v is None for v in values)
+        payload = {
+            "bbox": [round(v, 6) for v in bbox],
+            "rows": rows,
+            "cols": cols,
+            "values": values,
+            "missing": missing,
+        }
+        # Only complete grids are cached; a partial one is retried next time
+        if not missing:
+            await self.cache.aset(key, payload)
+        return payload
+
+    async def bbox_grid(self, min_lat, min_lon, max_lat, max_lon, resolution):
+        bbox = snap_bbox(min_lat, min_lon, max_lat, max_lon, resolution)
+        rows = round((bbox[2] - bbox[0]) / resolution)
+        cols = round((bbox[3] - bbox[1]) / resolution)
+        key = "bbox:{:.6f}:{:.6f}:{:.6f}:{:.6f}:{:.6f}:{}".format(*bbox, resolution, self.version())
+        return dict(await self.grid(key, bbox, rows, cols), resolution=resolution)
+
+    async def tile_grid(self, z, x, y, size):
+        key = f"xyz:{z}/{x}/{y}:{size}:{self.version()}"
+        return dict(await self.grid(key, tile_bounds(z, x, y), size, size), tile=[z, x, y])
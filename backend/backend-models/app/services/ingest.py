@@ -0,0 +1,225 @@
+"""
+Upload ingestion for the identify routes: every photo is read with a
+hard size cap, checked for what it really is, and shrunk before it goes
+anywhere.
+
+    photo = await ingest_upload(image)   # PreparedImage
+    photo.data, photo.mime_type          # what Gemini / Roboflow / backend-ml / Cloudinary get
+
+* Bounded: BodyLimitMiddleware refuses a request whose Content-Length is
+  over UPLOAD_MAX_BYTES (UPLOAD_MAX_REQUEST_BYTES for /detect/batch,
+  which carries several photos) before reading it, and stops a streamed
+  (chunked) body as soon as it passes the cap; read_upload() holds each
+  file part to UPLOAD_MAX_BYTES while reading it in chunks. Both answer 413.
+* Real format: the first bytes decide (JPEG, PNG, WebP, GIF, BMP, TIFF,
+  HEIC with pillow-heif installed), not the filename or the client's
+  content type. Anything else is a 415.
+* Downscaled: images larger than UPLOAD_MAX_EDGE on their long side, or
+  not JPEG, are re-encoded as JPEG at that size (EXIF rotation applied).
+  JPEGs are decoded at reduced scale (draft mode), so a 12 MP photo is
+  never fully decoded. A JPEG that already fits is passed through as is.
+"""
+from dataclasses import dataclass
+from io import BytesIO
+
+from fastapi.concurrency import run_in_threadpool
+from PIL import Image, ImageOps
+
+from app import config
+from fishapp.metrics import stage
+
+try:
+    from pillow_heif import register_heif_opener
+
+    register_heif_opener()
+    HEIF_SUPPORT = True
+except ImportError:
+    HEIF_SUPPORT = False
+
+READ_CHUNK = 256 * 1024
+
+_stats = {"uploads": 0, "rejected": 0, "resized": 0, "passed_through": 0, "bytes_in": 0, "bytes_out": 0}
+
+
+class UploadRejected(Exception):
+    status_code = 400
+
+
+class UploadTooLarge(UploadRejected):
+    status_code = 413
+
+
+class UnsupportedImage(UploadRejected):
+    status_code = 415
+
+
+@dataclass(frozen=True)
+class PreparedImage:
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    source_format: str
+    source_bytes: int
+
+    @property
+    def resized(self):
+        return len(self.data) != self.source_bytes
+
+
+def sniff_format(head: bytes):
+    """Image format from the magic bytes, or None."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[:2] == b"BM":
+        return "bmp"
+    if head[:4] in (b"II*\x00", b"MM\x00*"):
+        return "tiff"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"heic", b"heix", b"mif1", b"msf1", b"hevc", b"avif"):
+        return "heic"
+    return None
+
+
+async def read_upload(upload, max_bytes: int = None):
+    """The upload's bytes, read in chunks and refused as soon as they pass the cap."""
+    max_bytes = config.UPLOAD_MAX_BYTES if max_bytes is None else max_bytes
+    if max_bytes and upload.size is not None and upload.size > max_bytes:
+        _stats["rejected"] += 1
+        raise UploadTooLarge(f"Image is larger than {max_bytes // (1024 * 1024)} MB")
+
+    chunks, total = [], 0
+    while True:
+        chunk = await upload.read(READ_CHUNK)
+        if not chunk:
+            break
+        total += len(chunk)
+        if max_bytes and total > max_bytes:
+            _stats["rejected"] += 1
+            raise UploadTooLarge(f"Image is larger than {max_bytes // (1024 * 1024)} MB")
+        if not chunks and sniff_format(chunk[:16]) is None:
+            # No point reading the rest of something that isn't a photo
+            _stats["rejected"] += 1
+            raise UnsupportedImage("Not a supported image (JPEG, PNG, WebP, GIF, BMP, TIFF or HEIC)")
+        chunks.append(chunk)
+    if not chunks:
+        _stats["rejected"] += 1
+        raise UnsupportedImage("Empty upload")
+    return b"".join(chunks)
+
+
+def prepare_image(data: bytes, max_edge: int = None, quality: int = None):
+    """Checks the real format and returns a JPEG no larger than max_edge on its long side."""
+    max_edge = max_edge or config.UPLOAD_MAX_EDGE
+    quality = quality or config.UPLOAD_JPEG_QUALITY
+    fmt = sniff_format(data[:16])
+    if fmt is None:
+        raise UnsupportedImage("Not a supported image (JPEG, PNG, WebP, GIF, BMP, TIFF or HEIC)")
+    if fmt == "heic" and not HEIF_SUPPORT:
+        raise UnsupportedImage("HEIC photos need pillow-heif installed on the server")
+
+    try:
+        img = Image.open(BytesIO(data))
+        orientation = img.getexif().get(0x0112, 1)
+        if fmt == "jpeg" and max(img.size) <= max_edge and orientation == 1:
+            return PreparedImage(data, "image/jpeg", img.width, img.height, fmt, len(data))
+
+        # JPEG only: decode at 1/2, 1/4 or 1/8 scale, still at least max_edge
+        img.draft("RGB", (max_edge, max_edge))
+        img = ImageOps.exif_transpose(img)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        img.thumbnail((max_edge, max_edge), Image.BICUBIC)
+        out = BytesIO()
+        img.save(out, format="JPEG", quality=quality)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise UnsupportedImage(f"Could not decode image: {e}")
+    return PreparedImage(out.getvalue(), "image/jpeg", img.width, img.height, fmt, len(data))
+
+
+async def ingest_upload(upload):
+    """Bounded read + format check + downscale for one UploadFile."""
+    with stage("upload_read"):
+        data = await read_upload(upload)
+    try:
+        # Decoding and re-encoding is CPU work; keep it off the event loop
+        with stage("image_prepare"):
+            photo = await run_in_threadpool(prepare_image, data)
+    except UploadRejected:
+        _stats["rejected"] += 1
+        raise
+    _stats["uploads"] += 1
+    _stats["resized" if photo.resized else "passed_through"] += 1
+    _stats["bytes_in"] += photo.source_bytes
+    _stats["bytes_out"] += len(photo.data)
+    return photo
+
+
+def stats():
+    return dict(_stats)
+
+
+# --- BODY CAP ---
+class BodyLimitMiddleware:
+    """
+    ASGI middleware: 413 for request bodies over the cap, without reading
+    past it. path_limits overrides max_bytes for exact request paths.
+    """
+
+    def __init__(self, app, max_bytes: int, path_limits: dict = None):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_limits = path_limits or {}
+
+    async def _reject(self, send):
+        await send({"type": "http.response.start", "status": 413,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body",
+                    "body": b'{"detail":"Request body too large"}'})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        max_bytes = self.path_limits.get(scope["path"], self.max_bytes)
+        if not max_bytes:
+            return await self.app(scope, receive, send)
+
+        length = dict(scope["headers"]).get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > max_bytes:
+            _stats["rejected"] += 1
+            return await self._reject(send)
+
+        received = 0
+        started = False
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    # Answer now and tell the app the client went away, so it stops reading
+                    _stats["rejected"] += 1
+                    rejected = True
+                    if not started:
+                        await self._reject(send)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def tracked_send(message):
+            nonlocal started
+            if rejected:
+                return
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        await self.app(scope, limited_receive, tracked_send)
@@ -0,0 +1,104 @@
+"""
+The cheap local tiers of the identification cascade, both on backend-ml:
+
+    custom classifier   /custom-model/predict, confident when over its
+                        calibrated per-class threshold
+    embedding gallery   /gallery/identify, confident when similarity and
+                        margin are over the gallery's thresholds
+
+Both are asked at once and share one LOCAL_ID_TIMEOUT deadline.
+
+The classifier is closed-set: it knows a handful of freshwater species
+and always answers with one of them, and its thresholds were fitted on
+those species only, so a confident label says nothing about a marine
+fish. Its answer is therefore only used when the gallery (open-set: an
+unknown fish lands far from every stored example) puts the same species
+first with at least LOCAL_MODEL_MIN_SIMILARITY. The tier is off by
+default (LOCAL_MODEL_TIER).
+
+Anything else, including backend-ml being slow, down or not configured,
+returns None and the caller escalates to the next tier (and finally
+Gemini or Roboflow).
+"""
+import asyncio
+import time
+
+import httpx
+
+from app import config
+from fishapp.metrics import cache_event, observe_upstream
+
+_client = None
+
+
+def enabled():
+    return bool(config.LOCAL_ID_URL)
+
+
+def _get_client():
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(base_url=config.LOCAL_ID_URL.rstrip("/"), timeout=config.LOCAL_ID_TIMEOUT)
+    return _client
+
+
+async def _ask(upstream: str, path: str, image_data: bytes, filename: str = None):
+    """backend-ml's JSON answer for one image, or None if it couldn't give one."""
+    start = time.perf_counter()
+    try:
+        response = await _get_client().post(
+            path,
+            files={"file": (filename or "image.jpg", image_data, "image/jpeg")}
+        )
+        response.raise_for_status()
+        result = response.json()
+    except (httpx.TimeoutException, asyncio.CancelledError) as e:
+        observe_upstream(upstream, time.perf_counter() - start, "timeout")
+        if isinstance(e, asyncio.CancelledError):
+            raise
+        return None
+    except (httpx.HTTPError, ValueError):
+        observe_upstream(upstream, time.perf_counter() - start, "error")
+        return None
+    observe_upstream(upstream, time.perf_counter() - start)
+    return result if result.get("status") == "success" else None
+
+
+def _same_species(a, b):
+    return bool(a) and bool(b) and a.strip().lower() == b.strip().lower()
+
+
+async def local_answer(image_data: bytes, filename: str = None):
+    """{"species", "source"} from the first confident local tier, or None."""
+    if not enabled():
+        return None
+    asks = [_ask("local_id", "/gallery/identify", image_data, filename)]
+    if config.LOCAL_MODEL_TIER:
+        asks.append(_ask("local_model", "/custom-model/predict", image_data, filename))
+    try:
+        answers = await asyncio.wait_for(asyncio.gather(*asks), config.LOCAL_ID_TIMEOUT)
+    except asyncio.TimeoutError:
+        return None
+    gallery = answers[0]
+    model = answers[1] if len(answers) > 1 else None
+
+    answer = None
+    if model and model.get("confident") and gallery \
+            and _same_species(model.get("predicted_fish"), gallery.get("species")) \
+            and gallery.get("similarity", 0) >= config.LOCAL_MODEL_MIN_SIMILARITY:
+        answer = {"species": model["predicted_fish"], "source": "local_model"}
+    elif gallery and gallery.get("confident"):
+        answer = {"species": gallery["species"], "source": "gallery"}
+
+    # Counted like a cache: a hit is a remote call saved
+    if config.LOCAL_MODEL_TIER:
+        cache_event("local_model", bool(answer) and answer["source"] == "local_model")
+    cache_event("local_id", bool(answer) and answer["source"] == "gallery")
+    return answer
+
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -1,14 +1,23 @@
-import pandas as pd
+import io
 import os
 
-def load_price_csv(file_path: str):
+def resolve_data_path(file_path: str) -> str:
+    """Relative paths are resolved against the app/ folder."""
     base_dir = os.path.dirname(os.path.dirname(__file__))  # .../app
-    abs_path = os.path.join(base_dir, file_path)
+    return os.path.join(base_dir, file_path)
 
-    if not os.path.exists(abs_path):
+
+def load_price_csv(file_path: str, data: bytes = None):
+    # pandas is only imported once a table is loaded (it is a large part of cold start)
+    import pandas as pd
+
+    abs_path = resolve_data_path(file_path)
+
+    if data is None and not os.path.exists(abs_path):
         raise FileNotFoundError(f"Price CSV not found: {abs_path}")
 
-    df = pd.read_csv(abs_path)
+    # `data`: the file's bytes, already read by the caller
+    df = pd.read_csv(io.BytesIO(data) if data is not None else abs_path)
 
     # Normalize column names
     df.columns = df.columns.str.strip()
@@ -19,7 +28,7 @@ def load_price_csv(file_path: str):
     return df
 
 
-def get_avg_price(df: pd.DataFrame, species: str, state: str, price_type: str):
+def get_avg_price(df: "pd.DataFrame", species: str, state: str, price_type: str):
     """
     Filter dataframe by species, state and price_type. 
     Return average price as integer (rounded, no decimals) or None if not found.
@@ -45,3 +54,48 @@ def get_avg_price(df: pd.DataFrame, species: str, state: str, price_type: str):
     except ValueError:
         # If conversion fails
         return None
+
+
+# -------------------------
+# Precomputed lookup index
+# -------------------------
+def normalize_key(value) -> str:
+    return str(value).strip().casefold()
+
+
+def parse_price(value):
+    """Parses a "1,234"-style price into an int, or None if it isn't a number."""
+    try:
+        return int(float(str(value).replace(",", "").strip()))
+    except ValueError:
+        return None
+
+
+def build_price_index(df: "pd.DataFrame") -> dict:
+    """
+    Builds {(species, state, price_type): price} once at load time, with
+    casefolded keys and prices already parsed. Like get_avg_price, the
+    first row for a key wins.
+    """
+    index = {}
+    columns = ["Species", "State/UT", "PriceType", "Average Price (Rs./Kg)"]
+    try:
+        rows = df[columns].itertuples(index=False, name=None)
+    except KeyError as e:
+        raise KeyError(f"Column not found: {e}")
+
+    for species, state, price_type, price in rows:
+        key = (normalize_key(species), normalize_key(state), normalize_key(price_type))
+        if key not in index:
+            index[key] = parse_price(price)
+    return index
+
+
+def lookup_price(index: dict, species: str, state: str, price_type: str):
+    """O(1) replacement for get_avg_price over an index from build_price_index."""
+    return index.get((normalize_key(species), normalize_key(state), normalize_key(price_type)))
+
+
+def lookup_prices(index: dict, keys):
+    """Batch version of lookup_price: keys is an iterable of (species, state, price_type)."""
+    return [lookup_price(index, *key) for key in keys]
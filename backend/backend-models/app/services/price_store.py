@@ -0,0 +1,182 @@
+"""
+Versioned, hot-reloadable price dataset.
+
+The store holds one immutable PriceSnapshot (index + version). Reloads
+build a complete new snapshot off to the side and then swap the single
+`current` reference, so in-flight requests keep using the snapshot they
+started with and never see a half-built index.
+
+Sources:
+  * the pricing CSV (default)
+  * a Parquet (.parquet) or Arrow/Feather (.arrow, .feather) snapshot,
+    written with write_price_snapshot(); these skip CSV parsing and load
+    much faster cold. Needs pyarrow.
+
+Write a snapshot from the CSV with:
+    python -m app.services.price_store data/pricing_dataset.csv data/pricing_dataset.parquet
+"""
+import hashlib
+import io
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+
+from app.services.price_loader import (
+    build_price_index, load_price_csv, lookup_price, lookup_prices, parse_price, resolve_data_path
+)
+
+PRICE_COLUMNS = ["Species", "State/UT", "PriceType", "Average Price (Rs./Kg)"]
+BINARY_EXTENSIONS = (".parquet", ".arrow", ".feather")
+
+
+@dataclass(frozen=True)
+class PriceSnapshot:
+    index: dict
+    version: str
+    source: str
+    rows: int
+    loaded_at: float = field(default_factory=time.time)
+    load_seconds: float = 0.0
+
+    def info(self):
+        return {
+            "version": self.version,
+            "source": self.source,
+            "rows": self.rows,
+            "keys": len(self.index),
+            "loaded_at": self.loaded_at,
+            "load_seconds": round(self.load_seconds, 4),
+        }
+
+
+def data_version(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def load_price_table(file_path: str, data: bytes = None) -> "pd.DataFrame":
+    """Loads the CSV or a binary snapshot, depending on the extension (from `data` if given)."""
+    import pandas as pd
+
+    abs_path = resolve_data_path(file_path)
+    source = io.BytesIO(data) if data is not None else abs_path
+    if abs_path.endswith(".parquet"):
+        return pd.read_parquet(source)
+    if abs_path.endswith((".arrow", ".feather")):
+        return pd.read_feather(source)
+    return load_price_csv(file_path, data)
+
+
+def write_price_snapshot(df: "pd.DataFrame", out_path: str):
+    """Writes the four price columns, prices pre-parsed, as Parquet or Feather."""
+    table = df[PRICE_COLUMNS].copy()
+    table["Average Price (Rs./Kg)"] = [parse_price(p) for p in table["Average Price (Rs./Kg)"]]
+    table = table.astype({"Average Price (Rs./Kg)": "Int64"})
+    if out_path.endswith(".parquet"):
+        table.to_parquet(out_path, index=False)
+    else:
+        table.reset_index(drop=True).to_feather(out_path)
+    return out_path
+
+
+class PriceStore:
+    def __init__(self, file_path: str, snapshot_path: str = None):
+        self.file_path = file_path
+        self.snapshot_path = snapshot_path
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._stop = threading.Event()
+        self._last_stat = None
+        self.current = self._build()
+
+    # --- LOADING ---
+    def _active_path(self):
+        """Prefer the binary snapshot when it exists and isn't older than the CSV."""
+        csv_path = resolve_data_path(self.file_path)
+        if self.snapshot_path:
+            snap_path = resolve_data_path(self.snapshot_path)
+            if os.path.exists(snap_path) and (
+                not os.path.exists(csv_path) or os.path.getmtime(snap_path) >= os.path.getmtime(csv_path)
+            ):
+                return snap_path
+        return csv_path
+
+    def _stat(self, path):
+        st = os.stat(path)
+        return (path, st.st_mtime_ns, st.st_size)
+
+    def _build(self):
+        path = self._active_path()
+        start = time.perf_counter()
+        # One read: the version hash, the change-detection stat and the parsed
+        # table all describe the same bytes, even if the file is replaced meanwhile
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            data = f.read()
+        stat = (path, st.st_mtime_ns, st.st_size)
+        df = load_price_table(path, data)
+        snapshot = PriceSnapshot(
+            index=build_price_index(df),
+            version=data_version(data),
+            source=os.path.basename(path),
+            rows=len(df),
+            load_seconds=time.perf_counter() - start,
+        )
+        self._last_stat = stat
+        return snapshot
+
+    def reload(self):
+        """Rebuilds from disk and swaps the new snapshot in. Safe to call from any thread."""
+        with self._reload_lock:
+            snapshot = self._build()
+            old = self.current
+            self.current = snapshot  # single reference assignment = atomic swap
+        if snapshot.version != old.version:
+            print(f"✅ Price dataset swapped: {old.version} -> {snapshot.version} ({snapshot.rows} rows)")
+        return snapshot
+
+    def changed_on_disk(self):
+        try:
+            return self._stat(self._active_path()) != self._last_stat
+        except OSError:
+            return False
+
+    # --- WATCHER ---
+    def _watch(self, interval):
+        while not self._stop.wait(interval):
+            if not self.changed_on_disk():
+                continue
+            try:
+                self.reload()
+            except Exception as e:
+                # Keep serving the previous snapshot if the new file is broken
+                print(f"⚠️ Price dataset reload failed, keeping {self.current.version}: {e}")
+
+    def start_watcher(self, interval: float):
+        if interval <= 0 or (self._watcher and self._watcher.is_alive()):
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name="price-store-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop.set()
+        if self._watcher:
+            self._watcher.join(timeout=5)
+            self._watcher = None
+
+    # --- LOOKUPS ---
+    def lookup(self, species: str, state: str, price_type: str):
+        return lookup_price(self.current.index, species, state, price_type)
+
+    def lookup_many(self, keys):
+        return lookup_prices(self.current.index, keys)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("usage: python -m app.services.price_store <pricing.csv> <out.parquet|out.arrow>")
+    src, dst = sys.argv[1], sys.argv[2]
+    write_price_snapshot(load_price_csv(src), resolve_data_path(dst))
+    print(f"✅ Snapshot written to {resolve_data_path(dst)}")
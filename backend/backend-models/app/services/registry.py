@@ -0,0 +1,120 @@
+"""
+Heavy clients and datasets, built on first use instead of at import.
+
+    gemini_client = lazy_service("gemini", make_gemini_client)
+    client = await gemini_client.aget()   # async routes: builds on a worker thread
+    client = gemini_client.get()          # threads / sync code
+
+Route modules register their clients here and import the SDK inside the
+factory, so importing main.py no longer pulls in google.genai,
+inference_sdk, cloudinary, gradio_client, geopy or pandas, nor parses
+the price CSV. Each service is built once (thread-safe); a failed build
+is retried on the next use.
+
+prewarm() builds the services named in PREWARM_SERVICES in the
+background shortly after startup, so the worker accepts traffic at once
+and the first request usually finds its client ready anyway.
+"""
+import asyncio
+import threading
+import time
+
+from fastapi.concurrency import run_in_threadpool
+
+_services = {}
+
+
+class LazyService:
+    def __init__(self, name: str, factory):
+        self.name = name
+        self.factory = factory
+        self._value = None
+        self._ready = False
+        self._lock = threading.Lock()
+        self.init_seconds = None
+        self.failures = 0
+        self.prewarmed = False
+
+    @property
+    def ready(self):
+        return self._ready
+
+    def get(self):
+        if self._ready:
+            return self._value
+        with self._lock:
+            if not self._ready:
+                start = time.perf_counter()
+                try:
+                    value = self.factory()
+                except Exception:
+                    self.failures += 1
+                    raise
+                self.init_seconds = time.perf_counter() - start
+                self._value = value
+                self._ready = True
+                print(f"✅ {self.name} ready in {self.init_seconds:.2f}s")
+        return self._value
+
+    async def aget(self):
+        """get() without blocking the event loop on the first build."""
+        if self._ready:
+            return self._value
+        return await run_in_threadpool(self.get)
+
+    def set(self, value):
+        """Use this value instead of building one (tests, benchmarks, fakes)."""
+        with self._lock:
+            self._value = value
+            self._ready = True
+
+    def stats(self):
+        return {
+            "ready": int(self._ready),
+            "init_seconds": round(self.init_seconds, 4) if self.init_seconds is not None else None,
+            "failures": self.failures,
+            "prewarmed": int(self.prewarmed),
+        }
+
+
+def lazy_service(name: str, factory):
+    service = LazyService(name, factory)
+    _services[name] = service
+    return service
+
+
+def get_service(name: str):
+    return _services[name]
+
+
+def parse_names(value: str):
+    """PREWARM_SERVICES value -> service names ('all', 'none', or a comma list)."""
+    value = (value or "").strip().lower()
+    if value in ("", "none", "0", "false"):
+        return []
+    if value == "all":
+        return list(_services)
+    return [n.strip() for n in value.split(",") if n.strip()]
+
+
+async def prewarm(names, delay: float = 0.0):
+    """Builds the named services one after another on a worker thread."""
+    if delay:
+        await asyncio.sleep(delay)
+    for name in names:
+        service = _services.get(name)
+        if service is None:
+            print(f"⚠️ Nothing to prewarm called '{name}' (known: {', '.join(_services)})")
+            continue
+        if service.ready:
+            continue
+        try:
+            await service.aget()
+            service.prewarmed = True
+        except Exception as e:
+            # The request that needs it will try again and report the error
+            print(f"⚠️ Prewarming {name} failed: {e}")
+
+
+def stats():
+    return {name: service.stats() for name, service in _services.items()}
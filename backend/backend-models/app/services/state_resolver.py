@@ -0,0 +1,154 @@
+"""
+Offline lat/lon -> Indian state/UT lookup.
+
+Boundary polygons come from a GeoJSON FeatureCollection (name in
+properties.name, Polygon or MultiPolygon geometry). The bundled
+data/india_states.geojson is simplified to roughly 10-20 km, which is
+plenty for picking a price region; point STATE_BOUNDARIES_PATH at a
+full-resolution file for anything finer.
+
+Polygons are bucketed into a regular lat/lon grid by bounding box, so a
+lookup only runs point-in-polygon against the few polygons whose box
+touches the point's cell.
+"""
+import hashlib
+import json
+import math
+
+from app.services.price_loader import resolve_data_path
+
+KM_PER_DEG_LAT = 110.57
+KM_PER_DEG_LON = 111.32  # at the equator; scaled by cos(lat)
+
+
+def _ring_area(ring):
+    area = 0.0
+    for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+        area += x1 * y2 - x2 * y1
+    return abs(area) / 2.0
+
+
+def _point_in_ring(x, y, ring):
+    """Ray casting; ring is a list of (lon, lat)."""
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        xi, yi = ring[i]
+        xj, yj = ring[j]
+        if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+def _segment_distance_km(lon, lat, a, b):
+    """Distance from a point to segment a-b, in a local equirectangular projection."""
+    kx = KM_PER_DEG_LON * math.cos(math.radians(lat))
+    ax, ay = (a[0] - lon) * kx, (a[1] - lat) * KM_PER_DEG_LAT
+    bx, by = (b[0] - lon) * kx, (b[1] - lat) * KM_PER_DEG_LAT
+    dx, dy = bx - ax, by - ay
+    length_sq = dx * dx + dy * dy
+    t = 0.0 if length_sq == 0 else max(0.0, min(1.0, -(ax * dx + ay * dy) / length_sq))
+    return math.hypot(ax + t * dx, ay + t * dy)
+
+
+class StatePolygon:
+    def __init__(self, name, outer, holes=()):
+        self.name = name
+        self.outer = outer
+        self.holes = list(holes)
+        xs = [p[0] for p in outer]
+        ys = [p[1] for p in outer]
+        self.bbox = (min(xs), min(ys), max(xs), max(ys))
+        self.area = _ring_area(outer) - sum(_ring_area(h) for h in self.holes)
+
+    def contains(self, lon, lat):
+        min_x, min_y, max_x, max_y = self.bbox
+        if not (min_x <= lon <= max_x and min_y <= lat <= max_y):
+            return False
+        if not _point_in_ring(lon, lat, self.outer):
+            return False
+        return not any(_point_in_ring(lon, lat, h) for h in self.holes)
+
+    def distance_km(self, lon, lat):
+        ring = self.outer
+        return min(_segment_distance_km(lon, lat, a, b) for a, b in zip(ring, ring[1:] + ring[:1]))
+
+
+def load_state_polygons(file_path: str):
+    with open(resolve_data_path(file_path), encoding="utf-8") as f:
+        collection = json.load(f)
+
+    polygons = []
+    for feature in collection.get("features", []):
+        props = feature.get("properties") or {}
+        name = props.get("name") or props.get("NAME_1") or props.get("st_nm")
+        geometry = feature.get("geometry") or {}
+        if not name or geometry.get("type") not in ("Polygon", "MultiPolygon"):
+            continue
+
+        parts = [geometry["coordinates"]] if geometry["type"] == "Polygon" else geometry["coordinates"]
+        for rings in parts:
+            # GeoJSON rings repeat the first point at the end; drop it
+            rings = [[(float(x), float(y)) for x, y, *_ in ring[:-1]] for ring in rings]
+            polygons.append(StatePolygon(name, rings[0], rings[1:]))
+    return polygons
+
+
+class StateResolver:
+    def __init__(self, polygons, cell_deg: float = 0.5, version: str = ""):
+        self.polygons = polygons
+        self.version = version
+        self.cell_deg = cell_deg
+        self._grid = {}
+        for idx, poly in enumerate(polygons):
+            min_x, min_y, max_x, max_y = poly.bbox
+            for cx in range(self._cell(min_x), self._cell(max_x) + 1):
+                for cy in range(self._cell(min_y), self._cell(max_y) + 1):
+                    self._grid.setdefault((cx, cy), []).append(idx)
+
+    @classmethod
+    def from_geojson(cls, file_path: str, cell_deg: float = 0.5):
+        with open(resolve_data_path(file_path), "rb") as f:
+            version = hashlib.sha256(f.read()).hexdigest()[:12]
+        return cls(load_state_polygons(file_path), cell_deg, version)
+
+    def _cell(self, value):
+        return int(math.floor(value / self.cell_deg))
+
+    def candidates(self, lat: float, lon: float):
+        return [self.polygons[i] for i in self._grid.get((self._cell(lon), self._cell(lat)), ())]
+
+    def resolve(self, lat: float, lon: float):
+        """Returns the state/UT name containing the point, or None."""
+        matches = [p for p in self.candidates(lat, lon) if p.contains(lon, lat)]
+        if not matches:
+            return None
+        # Simplified borders can overlap; the smallest polygon wins, which
+        # also keeps enclaves like Puducherry or Daman inside their neighbours
+        return min(matches, key=lambda p: p.area).name
+
+    def nearest(self, lat: float, lon: float, max_km: float, names=None):
+        """
+        Nearest polygon within `max_km` of the point, for points at sea.
+        `names` optionally restricts the search (e.g. to coastal states).
+        Returns (name, distance_km) or (None, None).
+        """
+        reach_lat = max_km / KM_PER_DEG_LAT
+        reach_lon = max_km / (KM_PER_DEG_LON * max(math.cos(math.radians(lat)), 0.01))
+
+        seen = set()
+        for cx in range(self._cell(lon - reach_lon), self._cell(lon + reach_lon) + 1):
+            for cy in range(self._cell(lat - reach_lat), self._cell(lat + reach_lat) + 1):
+                seen.update(self._grid.get((cx, cy), ()))
+
+        best = (None, None)
+        # Sorted so ties always resolve the same way
+        for idx in sorted(seen, key=lambda i: self.polygons[i].name):
+            poly = self.polygons[idx]
+            if names is not None and poly.name not in names:
+                continue
+            distance = poly.distance_km(lon, lat)
+            if distance <= max_km and (best[1] is None or distance < best[1]):
+                best = (poly.name, distance)
+        return best
@@ -0,0 +1,142 @@
+"""
+Benchmark: cold-start cost of backend-models, per router.
+
+    python benchmarks/bench_coldstart.py [--repeat 5]
+    python benchmarks/bench_coldstart.py --fail-over-ms 1500    # exit 1 if importing main gets slower
+
+Run from backend-models/. Prints one JSON object.
+
+Every measurement is a fresh interpreter, so nothing is already in
+sys.modules:
+
+    imports    `python -X importtime -c "import <module>"` for main.py and
+               each router: the module's cumulative import time (median
+               of --repeat runs), the whole process's wall time, and the
+               heaviest third-party packages it pulled in
+    services   `import main`, then the first get() of each lazily built
+               service (app/services/registry.py): the cost a request
+               pays when that service was neither used nor prewarmed yet
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = [
+    "main",
+    "app.routes.identify",
+    "app.routes.detect",
+    "app.routes.price",
+    "app.routes.heatmap",
+    "app.routes.analytics",
+    "app.routes.analysis",
+]
+# gradio_space connects to the Hugging Face Space, so it is left out by default
+SERVICES = ["gemini", "roboflow", "cloudinary", "price_dataset", "geolocator"]
+
+SERVICE_SNIPPET = """
+import json, time
+import main
+from app.services import registry
+start = time.perf_counter()
+registry.get_service({name!r}).get()
+print(json.dumps({{"seconds": time.perf_counter() - start}}))
+"""
+
+
+def bench_env():
+    # Same defaults as the other benchmarks: no background refresh, a dummy key so clients build
+    env = dict(os.environ, PYTHONPATH=ROOT, PREWARM_SERVICES="none", FISH_SURFACE_REFRESH_HOURS="0")
+    env.setdefault("GEMINI_API_KEY", "bench")
+    return env
+
+
+def parse_importtime(stderr):
+    """[(self_us, cumulative_us, depth, module)] from -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(self_us), int(cumulative), depth, name.strip()))
+    return rows
+
+
+def import_once(module):
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=ROOT, env=bench_env(), capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    rows = parse_importtime(proc.stderr)
+    own = next(cumulative for _, cumulative, _, name in rows if name == module)
+    # Top-level packages by the cumulative time of their first (outermost) import
+    packages = {}
+    for _, cumulative, _, name in rows:
+        top = name.split(".")[0]
+        if top not in ("app", module) and name == top:
+            packages[top] = max(packages.get(top, 0), cumulative)
+    return own / 1e6, wall, packages
+
+
+def bench_import(module, repeat, top):
+    runs = [import_once(module) for _ in range(repeat)]
+    heaviest = sorted(runs[-1][2].items(), key=lambda kv: -kv[1])[:top]
+    return {
+        "import_ms": round(statistics.median(r[0] for r in runs) * 1000, 1),
+        "process_wall_ms": round(statistics.median(r[1] for r in runs) * 1000, 1),
+        "heaviest_packages_ms": {name: round(us / 1000, 1) for name, us in heaviest},
+    }
+
+
+def bench_service(name, repeat):
+    times = []
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, "-c", SERVICE_SNIPPET.format(name=name)],
+                              cwd=ROOT, env=bench_env(), capture_output=True, text=True)
+        if proc.returncode != 0:
+            return {"error": proc.stderr.strip().splitlines()[-1]}
+        times.append(json.loads(proc.stdout.strip().splitlines()[-1])["seconds"])
+    return {"first_use_ms": round(statistics.median(times) * 1000, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh processes per measurement (median)")
+    parser.add_argument("--modules", default=",".join(MODULES))
+    parser.add_argument("--services", default=",".join(SERVICES), help="'' to skip the first-use timings")
+    parser.add_argument("--top", type=int, default=8, help="Heaviest third-party packages listed per module")
+    parser.add_argument("--fail-over-ms", type=float, help="Exit 1 if importing main takes longer than this")
+    args = parser.parse_args()
+
+    imports = {}
+    for module in filter(None, args.modules.split(",")):
+        print(f"🔄 import {module}", file=sys.stderr)
+        try:
+            imports[module] = bench_import(module, args.repeat, args.top)
+        except RuntimeError as e:
+            imports[module] = {"error": str(e)}
+
+    services = {}
+    for name in filter(None, args.services.split(",")):
+        print(f"🔄 first use of {name}", file=sys.stderr)
+        services[name] = bench_service(name, args.repeat)
+
+    print(json.dumps({"python": sys.version.split()[0], "repeat": args.repeat,
+                      "imports": imports, "services": services}, indent=2))
+
+    main_ms = imports.get("main", {}).get("import_ms")
+    if args.fail_over_ms and main_ms is not None and main_ms > args.fail_over_ms:
+        print(f"❌ import main took {main_ms} ms (limit {args.fail_over_ms} ms)", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
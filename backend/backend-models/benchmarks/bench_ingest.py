@@ -0,0 +1,146 @@
+"""
+Benchmark: what upload ingestion (app/services/ingest.py) saves on the
+bytes and time spent per photo before any upstream call.
+
+    python benchmarks/bench_ingest.py [--limit 200] [--uplink-mbps 20]
+    python benchmarks/bench_ingest.py --gemini-url http://127.0.0.1:9100/gemini   # fake_upstreams.py
+
+Run from backend-models/. Prints one JSON object.
+
+Two sets of photos from backend-ml's datasets:
+
+    dataset   the sample images as they are (640x640 Roboflow exports)
+    phone     the same images upscaled to --phone-size and saved at
+              quality 92, the size a phone camera actually uploads
+
+For each set it reports bytes in/out, the ingest time per photo, the
+pixels decoded (full decode vs. JPEG draft mode), and the time to push
+the bytes upstream at --uplink-mbps. With --gemini-url it also times
+real generate_content calls with the raw and the prepared bytes.
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image  # noqa: E402
+
+from app import config  # noqa: E402
+from app.services.ingest import prepare_image  # noqa: E402
+
+DATASETS = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                        "backend-ml", "code_a_thon", "datasets")
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def load_samples(limit):
+    paths = sorted(glob.glob(os.path.join(DATASETS, "*", "*", "*.jpg")))[:limit]
+    if not paths:
+        raise SystemExit(f"❌ No sample images under {DATASETS}")
+    return [open(p, "rb").read() for p in paths]
+
+
+def phone_versions(samples, size):
+    out = []
+    for data in samples:
+        img = Image.open(BytesIO(data)).convert("RGB").resize(size, Image.BICUBIC)
+        buf = BytesIO()
+        img.save(buf, format="JPEG", quality=92)
+        out.append(buf.getvalue())
+    return out
+
+
+def decoded_pixels(data, max_edge):
+    """(pixels of a full decode, pixels after draft mode) for one photo."""
+    img = Image.open(BytesIO(data))
+    full = img.width * img.height
+    img.draft("RGB", (max_edge, max_edge))
+    return full, img.size[0] * img.size[1]
+
+
+def time_gemini(base_url, photos, model="gemini-3-flash-preview"):
+    from google import genai
+    from google.genai import types
+
+    client = genai.Client(api_key="bench", http_options=types.HttpOptions(base_url=base_url))
+    times = []
+    for data in photos:
+        start = time.perf_counter()
+        client.models.generate_content(
+            model=model,
+            contents=[types.Part.from_bytes(data=data, mime_type="image/jpeg"), "Identify this fish species."]
+        )
+        times.append(time.perf_counter() - start)
+    return {"p50_ms": round(percentile(times, 50) * 1000, 2), "p95_ms": round(percentile(times, 95) * 1000, 2)}
+
+
+def run_set(name, photos, args):
+    prepared, times = [], []
+    for data in photos:
+        start = time.perf_counter()
+        prepared.append(prepare_image(data, args.max_edge, args.quality))
+        times.append(time.perf_counter() - start)
+
+    bytes_in = sum(len(p) for p in photos)
+    bytes_out = sum(len(p.data) for p in prepared)
+    pixels = [decoded_pixels(p, args.max_edge) for p in photos]
+    uplink = args.uplink_mbps * 1e6 / 8  # bytes/sec
+
+    result = {
+        "photos": len(photos),
+        "size_in": f"{Image.open(BytesIO(photos[0])).size}",
+        "size_out": f"{(prepared[0].width, prepared[0].height)}",
+        "passed_through": sum(not p.resized for p in prepared),
+        "mean_kb_in": round(bytes_in / len(photos) / 1024, 1),
+        "mean_kb_out": round(bytes_out / len(photos) / 1024, 1),
+        "bytes_saved_pct": round(100 * (1 - bytes_out / bytes_in), 1),
+        "ingest_p50_ms": round(percentile(times, 50) * 1000, 2),
+        "ingest_p95_ms": round(percentile(times, 95) * 1000, 2),
+        "decoded_mpx_full": round(statistics.mean(p[0] for p in pixels) / 1e6, 2),
+        "decoded_mpx_draft": round(statistics.mean(p[1] for p in pixels) / 1e6, 2),
+        f"uplink_ms_in_at_{args.uplink_mbps:g}mbps": round(bytes_in / len(photos) / uplink * 1000, 1),
+        f"uplink_ms_out_at_{args.uplink_mbps:g}mbps": round(bytes_out / len(photos) / uplink * 1000, 1),
+    }
+    if args.gemini_url:
+        sample = photos[:args.gemini_calls]
+        result["gemini_raw"] = time_gemini(args.gemini_url, sample)
+        result["gemini_prepared"] = time_gemini(args.gemini_url, [p.data for p in prepared[:args.gemini_calls]])
+    print(f"✅ {name}: {result['mean_kb_in']} KB -> {result['mean_kb_out']} KB per photo", file=sys.stderr)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--limit", type=int, default=200, help="Sample images to use")
+    parser.add_argument("--phone-size", default="4032x3024", help="WxH of the phone-sized versions")
+    parser.add_argument("--max-edge", type=int, default=config.UPLOAD_MAX_EDGE)
+    parser.add_argument("--quality", type=int, default=config.UPLOAD_JPEG_QUALITY)
+    parser.add_argument("--uplink-mbps", type=float, default=20.0, help="Server uplink for the transfer estimate")
+    parser.add_argument("--gemini-url", help="Time real calls against this Gemini base URL (e.g. the fake)")
+    parser.add_argument("--gemini-calls", type=int, default=20)
+    args = parser.parse_args()
+
+    samples = load_samples(args.limit)
+    size = tuple(int(v) for v in args.phone_size.lower().split("x"))
+    print(f"🔄 {len(samples)} samples, max edge {args.max_edge}, quality {args.quality}", file=sys.stderr)
+
+    print(json.dumps({
+        "max_edge": args.max_edge,
+        "quality": args.quality,
+        "dataset": run_set("dataset", samples, args),
+        "phone": run_set("phone", phone_versions(samples, size), args),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
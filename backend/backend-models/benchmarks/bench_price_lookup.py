@@ -0,0 +1,66 @@
+"""
+Microbenchmark: pandas-mask get_avg_price vs. the precomputed price index.
+
+    python benchmarks/bench_price_lookup.py [--lookups 2000]
+
+Run from backend-models/. Prints one JSON object.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.price_loader import (  # noqa: E402
+    load_price_csv, get_avg_price, build_price_index, lookup_price, lookup_prices
+)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    df = load_price_csv("data/pricing_dataset.csv")
+    build_s, index = timed(lambda: build_price_index(df))
+
+    # Mix of existing keys (different casing) and misses
+    rng = random.Random(0)
+    rows = df[["Species", "State/UT", "PriceType"]].values.tolist()
+    keys = []
+    for _ in range(args.lookups):
+        species, state, price_type = rng.choice(rows)
+        if rng.random() < 0.2:
+            state = "Nowhere"
+        keys.append((species.upper(), state.lower(), price_type))
+
+    mask_s, mask_prices = timed(lambda: [get_avg_price(df, *k) for k in keys])
+    index_s, index_prices = timed(lambda: [lookup_price(index, *k) for k in keys])
+    batch_s, batch_prices = timed(lambda: lookup_prices(index, keys))
+
+    mismatches = sum(a != b for a, b in zip(mask_prices, index_prices))
+    print(json.dumps({
+        "rows": len(df),
+        "index_keys": len(index),
+        "lookups": len(keys),
+        "index_build_ms": round(build_s * 1000, 2),
+        "pandas_mask_us_per_lookup": round(mask_s / len(keys) * 1e6, 2),
+        "index_us_per_lookup": round(index_s / len(keys) * 1e6, 3),
+        "index_batch_us_per_lookup": round(batch_s / len(keys) * 1e6, 3),
+        "speedup": round(mask_s / index_s, 1) if index_s else None,
+        "mismatches": mismatches,
+    }, indent=2))
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
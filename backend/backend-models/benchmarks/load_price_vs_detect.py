@@ -0,0 +1,137 @@
+"""
+Load test: does /price stay fast while slow /detect calls are in flight?
+
+    python benchmarks/load_price_vs_detect.py [--detect 32] [--price 400] [--upstream-latency 2.0]
+    python benchmarks/load_price_vs_detect.py --inline   # upstream calls block the event loop, like before
+
+Run from backend-models/. The app is driven in-process through httpx's
+ASGI transport. Gemini and Cloudinary are replaced by fakes that sleep
+for --upstream-latency, and the Mongo insert is skipped, so nothing
+leaves the machine. Prints one JSON object.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+import httpx  # noqa: E402
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def summarize(latencies):
+    ms = [v * 1000 for v in latencies]
+    return {
+        "count": len(ms),
+        "p50_ms": round(percentile(ms, 50), 2) if ms else None,
+        "p95_ms": round(percentile(ms, 95), 2) if ms else None,
+        "p99_ms": round(percentile(ms, 99), 2) if ms else None,
+        "max_ms": round(max(ms), 2) if ms else None,
+        "mean_ms": round(statistics.mean(ms), 2) if ms else None,
+    }
+
+
+def install_fakes(upstream_latency, inline):
+    import cloudinary.uploader
+    from app.routes import identify, price
+    from app.services import executor
+
+    def generate_content(model, contents, **kwargs):
+        time.sleep(upstream_latency)
+        return types.SimpleNamespace(text="Rohu (Rohu)")
+
+    def upload(*args, **kwargs):
+        time.sleep(upstream_latency / 10)
+        return {"secure_url": "https://example.invalid/image.jpg"}
+
+    identify.gemini_client.set(types.SimpleNamespace(models=types.SimpleNamespace(generate_content=generate_content)))
+    cloudinary.uploader.upload = upload
+
+    async def save_analysis(analysis_data):
+        return {"success": True, "inserted_id": "benchmark"}
+
+    price.save_analysis = save_analysis
+
+    if inline:
+        # The pre-executor behaviour: call the blocking function on the loop
+        async def run_inline(self, fn, *args, timeout=None, **kwargs):
+            return fn(*args, **kwargs)
+        executor.Upstream.run = run_inline
+
+
+async def run(args):
+    install_fakes(args.upstream_latency, args.inline)
+    from main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        detect_latencies, price_latencies = [], []
+
+        async def one_detect(i):
+            start = time.perf_counter()
+            # Unique bytes per request so the result cache doesn't answer
+            r = await client.post("/detect", files={"image": (f"{i}.jpg", f"fake-image-{i}-{time.time()}".encode())})
+            detect_latencies.append(time.perf_counter() - start)
+            return r.status_code
+
+        async def one_price(i, start):
+            r = await client.post("/price", params={
+                "user_id": "bench", "species": "Catla", "qty_captured": 1, "weight_kg": 2.5,
+                "lat": 19.07 + (i % 50) * 0.01, "lon": 72.88, "price_type": "Retail",
+            })
+            price_latencies.append(time.perf_counter() - start)
+            return r.status_code
+
+        async def price_stream(started):
+            # Open loop: request i is due at a fixed time and its latency is
+            # measured from then, so time spent stuck behind a blocked event
+            # loop counts, as it would for a real client
+            gap = args.upstream_latency * 2 / max(1, args.price)
+            tasks = []
+            for i in range(args.price):
+                due = started + i * gap
+                await asyncio.sleep(max(0.0, due - time.perf_counter()))
+                tasks.append(asyncio.create_task(one_price(i, due)))
+            return await asyncio.gather(*tasks)
+
+        started = time.perf_counter()
+        detect_task = asyncio.gather(*(one_detect(i) for i in range(args.detect)))
+        price_statuses = await price_stream(started)
+        detect_statuses = await detect_task
+        wall = time.perf_counter() - started
+
+    from app.services.executor import upstream_stats
+    return {
+        "mode": "inline" if args.inline else "executor",
+        "upstream_latency_s": args.upstream_latency,
+        "wall_seconds": round(wall, 3),
+        "price": {**summarize(price_latencies), "non_200": sum(s != 200 for s in price_statuses)},
+        "detect": {**summarize(detect_latencies), "non_200": sum(s != 200 for s in detect_statuses)},
+        "upstreams": upstream_stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--detect", type=int, default=32, help="Concurrent /detect requests")
+    parser.add_argument("--price", type=int, default=200, help="/price requests issued during the run")
+    parser.add_argument("--upstream-latency", type=float, default=2.0, help="Seconds each fake Gemini call takes")
+    parser.add_argument("--inline", action="store_true", help="Run upstream calls on the event loop (old behaviour)")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
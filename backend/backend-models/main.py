@@ -1,24 +1,153 @@
-from fastapi import FastAPI
-from app.db.mongo import connect_to_mongo, close_mongo_connection
-from app.routes import detect, price, heatmap,identify
+import asyncio
+from fastapi import FastAPI, Response
+from app import config
+from app.db.mongo import db, connect_to_mongo, close_mongo_connection
+from app.routes import detect, price, heatmap,identify, analytics
+from app.services.analytics import ensure_indexes
+from app.routes.analysis import analysis_writer
+from app.services.geolocation import geocode_cache, load_geocode_cache, save_geocode_cache, state_resolver
+from app.services.executor import shutdown_executors, upstream_stats
+from app.services.cloudinary_service import upload_queue
+from app.services import ingest, local_identify, registry
+from fishapp.metrics import http_metrics_middleware, register_stats, render_metrics
 
 app = FastAPI(title="My FastAPI App")
+app.middleware("http")(http_metrics_middleware)
+# Oversized uploads are refused before their body is read; a batch haul carries several photos
+app.add_middleware(
+    ingest.BodyLimitMiddleware,
+    max_bytes=config.UPLOAD_MAX_BYTES,
+    path_limits={"/detect/batch": config.UPLOAD_MAX_REQUEST_BYTES}
+)
 
-# Connect to MongoDB on application startup
+# Existing stats() counters, exported as gauges on /metrics
+register_stats("identify_cache", identify.result_cache.stats)
+register_stats("gemini_gateway", identify.gemini_gateway.stats)
+register_stats("heatmap_tile_cache", heatmap.heatmap_grid.cache.stats)
+register_stats("geocode_cache", geocode_cache.stats)
+register_stats("upload_queue", upload_queue.stats)
+register_stats("ingest", ingest.stats)
+register_stats("analysis_writer", analysis_writer.stats)
+register_stats("upstream", upstream_stats, label="upstream")
+register_stats("service", registry.stats, label="service")
+
+async def create_indexes():
+    try:
+        await ensure_indexes(db.database)
+    except Exception as e:
+        print(f"⚠️ Could not create analysis indexes: {e}")
+
+# Connect to MongoDB on application startup (the client connects lazily;
+# indexes are created in the background so an unreachable Mongo doesn't hold up serving)
 @app.on_event("startup")
 async def startup_db_client():
     await connect_to_mongo()
+    app.state.create_indexes = asyncio.create_task(create_indexes())
+
+# Geocode results saved by the last run (GEOCODE_CACHE_PATH)
+@app.on_event("startup")
+async def start_geocode_cache():
+    load_geocode_cache()
+
+@app.on_event("shutdown")
+async def stop_geocode_cache():
+    save_geocode_cache()
+
+# Build the heavy clients/datasets in the background instead of at import
+@app.on_event("startup")
+async def start_prewarm():
+    names = registry.parse_names(config.PREWARM_SERVICES)
+    if names:
+        app.state.prewarm = asyncio.create_task(registry.prewarm(names, delay=config.PREWARM_DELAY))
+
+@app.on_event("shutdown")
+async def stop_prewarm():
+    prewarm = getattr(app.state, "prewarm", None)
+    if prewarm:
+        prewarm.cancel()
+
+# Background Cloudinary uploads; needs the running event loop
+@app.on_event("startup")
+async def start_upload_queue():
+    await upload_queue.start()
+
+# Drain pending uploads first, while Mongo and the thread pools are still up
+@app.on_event("shutdown")
+async def stop_upload_queue():
+    await upload_queue.stop()
+
+# Batched analysis inserts; flushed after the upload queue so finished image URLs are attached
+@app.on_event("startup")
+async def start_analysis_writer():
+    if config.ANALYSIS_WRITE_BEHIND:
+        await analysis_writer.start()
+
+@app.on_event("shutdown")
+async def stop_analysis_writer():
+    await analysis_writer.stop()
+
+# Rebuild the fish-probability surface from the Space on a schedule
+@app.on_event("startup")
+async def start_surface_refresh():
+    heatmap.fish_surface.start_refresh(
+        heatmap.fetch_probability,
+        interval=config.FISH_SURFACE_REFRESH_HOURS * 3600,
+        step=config.FISH_SURFACE_STEP,
+        concurrency=config.HEATMAP_GRID_CONCURRENCY,
+        is_land=lambda lat, lon: state_resolver.resolve(lat, lon) is not None
+    )
+
+@app.on_event("shutdown")
+async def stop_surface_refresh():
+    await heatmap.fish_surface.stop_refresh()
 
 # Close MongoDB connection on application shutdown
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    app.state.create_indexes.cancel()
     await close_mongo_connection()
 
+@app.on_event("shutdown")
+async def stop_gemini_gateway():
+    await identify.gemini_gateway.stop()
+
+# The price dataset watches its file once it has been loaded (see price.py)
+@app.on_event("shutdown")
+async def stop_price_watcher():
+    if price.price_dataset.ready:
+        price.price_dataset.get().stop_watcher()
+
+@app.on_event("shutdown")
+async def close_local_identify():
+    await local_identify.close()
+
+# Last: every hook above may still hand work to the upstream thread pools
+@app.on_event("shutdown")
+async def stop_executors():
+    shutdown_executors()
+
 # Include route modules
 app.include_router(identify.router, prefix="/detect", tags=["Detect"])
 app.include_router(price.router, prefix="/price", tags=["Price"])
 app.include_router(heatmap.router, prefix="/heatmap", tags=["Heatmap"])
+app.include_router(analytics.router, prefix="/analytics", tags=["Analytics"])
 
 @app.get("/")
 def root():
     return {"message": "FastAPI server is running 🚀"}
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus scrape endpoint."""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/upstreams")
+def upstreams():
+    """In-flight/timeout/rejection counters per upstream thread pool."""
+    return upstream_stats()
+
+@app.get("/services")
+def services():
+    """Which lazily built clients/datasets are ready, and how long each took to build."""
+    return registry.stats()
@@ -0,0 +1,274 @@
+"""
+Analytics pipelines and keyset pagination over a few seeded records.
+
+Runs against a local mongod (MONGO_TEST_URI, default
+mongodb://127.0.0.1:27017) in a throwaway database. Indexes and paging
+also run on mongomock when it is installed; $dateTrunc, $geoNear and the
+pipeline-update backfill need the real server and are skipped without it.
+
+    python -m pytest tests/test_analytics.py
+"""
+import asyncio
+import functools
+import os
+import subprocess
+import sys
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+BACKEND_MODELS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_MODELS)
+
+from app.db.mongo import db  # noqa: E402
+from app.routes import analytics as routes  # noqa: E402
+from app.services.analytics import (  # noqa: E402
+    backfill_geo, decode_cursor, encode_cursor, ensure_indexes
+)
+
+MONGO_TEST_URI = os.getenv("MONGO_TEST_URI", "mongodb://127.0.0.1:27017")
+
+KOCHI = (9.93, 76.26)
+MUMBAI = (19.07, 72.87)
+
+
+@functools.lru_cache(maxsize=None)
+def mongod_available():
+    try:
+        with MongoClient(MONGO_TEST_URI, serverSelectionTimeoutMS=500) as client:
+            client.admin.command("ping")
+        return True
+    except PyMongoError:
+        return False
+
+
+# --- MONGOMOCK, BEHIND THE MOTOR CALLS THE CODE MAKES ---
+class MockCursor:
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def sort(self, keys):
+        self.cursor = self.cursor.sort(keys)
+        return self
+
+    def limit(self, n):
+        self.cursor = self.cursor.limit(n)
+        return self
+
+    async def to_list(self, length=None):
+        return list(self.cursor)[:length]
+
+
+class MockCollection:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def insert_many(self, docs, **kwargs):
+        return self.collection.insert_many(docs, **kwargs)
+
+    async def create_index(self, keys, **kwargs):
+        return self.collection.create_index(keys, **kwargs)
+
+    async def index_information(self):
+        return self.collection.index_information()
+
+    def find(self, query=None):
+        return MockCursor(self.collection.find(query))
+
+
+class MockDatabase:
+    def __init__(self):
+        import mongomock
+        self.database = mongomock.MongoClient().analytics_test
+
+    def get_collection(self, name):
+        return MockCollection(self.database.get_collection(name))
+
+
+# --- FIXTURES ---
+@pytest.fixture(params=["mongod", "mongomock"])
+def backend(request):
+    if request.param == "mongod" and not mongod_available():
+        pytest.skip(f"no mongod at {MONGO_TEST_URI}")
+    if request.param == "mongomock":
+        pytest.importorskip("mongomock")
+    return request.param
+
+
+@pytest.fixture
+def mongod():
+    if not mongod_available():
+        pytest.skip(f"no mongod at {MONGO_TEST_URI}")
+    return "mongod"
+
+
+def run(backend, scenario):
+    """Runs scenario(database) on a fresh database, with the routes pointed at it."""
+    async def go():
+        if backend == "mongomock":
+            database, client = MockDatabase(), None
+        else:
+            from motor.motor_asyncio import AsyncIOMotorClient
+            client = AsyncIOMotorClient(MONGO_TEST_URI)
+            database = client[f"analytics_test_{uuid.uuid4().hex[:8]}"]
+        previous, db.database = db.database, database
+        try:
+            return await scenario(database)
+        finally:
+            db.database = previous
+            if client is not None:
+                await client.drop_database(database.name)
+                client.close()
+    return asyncio.run(go())
+
+
+def record(user_id, fish_class, created_at, at=KOCHI, price=100.0, geo=True):
+    doc = {
+        "_id": ObjectId(),
+        "user_id": user_id,
+        "fish_class": fish_class,
+        "created_at": created_at,
+        "qty_captured": 1,
+        "weight_kg": 2.0,
+        "total_price": price,
+        "location": {"lat": at[0], "lon": at[1]},
+    }
+    if geo:
+        doc["geo"] = {"type": "Point", "coordinates": [at[1], at[0]]}
+    return doc
+
+
+async def seed(database, docs):
+    await ensure_indexes(database)
+    await database.get_collection("analysis").insert_many(docs)
+
+
+def page(cursor=None, limit=2):
+    return routes.records(user_id=None, fish_class=None, start=None, end=None, limit=limit, cursor=cursor)
+
+
+# --- CURSORS ---
+def test_cursor_round_trip_and_garbage():
+    doc = {"created_at": datetime(2024, 3, 1, 6, 30, 15, 250000), "_id": ObjectId()}
+    assert decode_cursor(encode_cursor(doc)) == (doc["created_at"], doc["_id"])
+    for bad in ("not-a-cursor", encode_cursor(doc)[:-3]):
+        with pytest.raises(ValueError):
+            decode_cursor(bad)
+
+
+def test_bad_cursor_is_a_400():
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(page("garbage"))
+    assert e.value.status_code == 400
+
+
+# --- INDEXES AND PAGING (mongod or mongomock) ---
+def test_indexes_are_created(backend):
+    async def scenario(database):
+        await ensure_indexes(database)
+        await ensure_indexes(database)  # again, as on every restart
+        return await database.get_collection("analysis").index_information()
+
+    indexes = run(backend, scenario)
+    assert {"user_created", "species_created", "created", "geo_2dsphere", "upload_id"} <= set(indexes)
+    assert indexes["geo_2dsphere"]["key"] == [("geo", "2dsphere")]
+    assert indexes["upload_id"].get("sparse")
+
+
+def test_pages_neither_repeat_nor_drop_records(backend):
+    # Three records share a timestamp, so a page boundary falls inside the tie
+    tied = datetime(2024, 3, 1, 6, 0)
+    docs = [record("u1", "Rohu", tied) for _ in range(3)]
+    docs += [record("u1", "Catla", tied + timedelta(hours=1)), record("u2", "Rohu", tied - timedelta(hours=1))]
+    expected = [str(d["_id"]) for d in sorted(docs, key=lambda d: (d["created_at"], d["_id"]), reverse=True)]
+
+    async def scenario(database):
+        await seed(database, docs)
+        seen, cursor, pages = [], None, 0
+        while True:
+            body = await page(cursor)
+            seen += [item["id"] for item in body["items"]]
+            pages += 1
+            cursor = body["next_cursor"]
+            if cursor is None:
+                return seen, pages
+
+    seen, pages = run(backend, scenario)
+    assert seen == expected
+    assert pages == 3
+
+
+# --- AGGREGATIONS (mongod only) ---
+def test_timeseries_buckets_by_local_day(mongod):
+    docs = [
+        record("u1", "Rohu", datetime(2024, 1, 1, 10, 0), price=100.0),   # 15:30 IST, 1 Jan
+        record("u1", "Rohu", datetime(2024, 1, 1, 17, 0), price=50.0),    # 22:30 IST, 1 Jan
+        record("u1", "Catla", datetime(2024, 1, 1, 20, 0), price=30.0),   # 01:30 IST, 2 Jan
+    ]
+
+    async def scenario(database):
+        await seed(database, docs)
+        return await routes.timeseries(bucket="day", user_id="u1", fish_class=None, start=None, end=None,
+                                       timezone="Asia/Kolkata")
+
+    buckets = run(mongod, scenario)
+    # IST midnight is 18:30 UTC the day before
+    assert [(b["bucket"], b["catches"], b["total_price"]) for b in buckets] == [
+        ("2023-12-31T18:30:00", 2, 150.0),
+        ("2024-01-01T18:30:00", 1, 30.0),
+    ]
+
+
+def test_near_is_nearest_first_within_the_radius(mongod):
+    when = datetime(2024, 3, 1, 6, 0)
+    close = record("u1", "Rohu", when, at=(KOCHI[0] + 0.05, KOCHI[1]))
+    closest = record("u2", "Pomfret", when, at=KOCHI, price=40.0)
+    docs = [close, closest, record("u3", "Rohu", when, at=MUMBAI)]
+
+    async def scenario(database):
+        await seed(database, docs)
+        near = await routes.near(lat=KOCHI[0], lon=KOCHI[1], radius_km=25, fish_class=None, start=None, end=None,
+                                 limit=10)
+        totals = await routes.near_totals(lat=KOCHI[0], lon=KOCHI[1], radius_km=25, start=None, end=None)
+        return near, totals
+
+    near, totals = run(mongod, scenario)
+    assert [n["id"] for n in near] == [str(closest["_id"]), str(close["_id"])]
+    assert near[0]["distance_km"] == pytest.approx(0.0, abs=0.01)
+    assert near[1]["distance_km"] == pytest.approx(5.56, abs=0.1)
+    assert {t["fish_class"]: t["total_price"] for t in totals} == {"Rohu": 100.0, "Pomfret": 40.0}
+
+
+def test_backfill_geo_cli(mongod):
+    old = record("u1", "Rohu", datetime(2024, 3, 1, 6, 0), at=MUMBAI, geo=False)
+    no_location = {**record("u1", "Rohu", datetime(2024, 3, 1, 7, 0), geo=False), "location": None}
+    name = f"analytics_test_{uuid.uuid4().hex[:8]}"
+    with MongoClient(MONGO_TEST_URI) as client:
+        try:
+            collection = client[name]["analysis"]
+            collection.insert_many([old, no_location])
+            env = {**os.environ, "MONGO_URI": MONGO_TEST_URI, "MONGO_DB_NAME": name}
+            subprocess.run([sys.executable, "-m", "app.services.analytics", "backfill-geo"],
+                           cwd=BACKEND_MODELS, env=env, check=True, timeout=60)
+
+            assert collection.find_one({"_id": old["_id"]})["geo"] == {
+                "type": "Point", "coordinates": [MUMBAI[1], MUMBAI[0]]
+            }
+            assert "geo" not in collection.find_one({"_id": no_location["_id"]})
+            assert "geo_2dsphere" in collection.index_information()
+            # Already migrated: a second run has nothing left to do
+            async def again():
+                from motor.motor_asyncio import AsyncIOMotorClient
+                motor = AsyncIOMotorClient(MONGO_TEST_URI)
+                try:
+                    return await backfill_geo(motor[name])
+                finally:
+                    motor.close()
+            assert asyncio.run(again()) == 0
+        finally:
+            client.drop_database(name)
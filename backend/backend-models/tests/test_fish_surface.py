@@ -0,0 +1,122 @@
+"""
+Fish surface against a local stand-in of the Gradio Space.
+
+Starts benchmarks/fake_upstreams.py (its /space speaks the real sse_v3
+queue protocol, so this goes through gradio_client and fetch_probability
+exactly as production does) and samples a small grid with
+precompute_surface.
+
+    python -m pytest tests/test_fish_surface.py
+"""
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+import numpy as np
+import pytest
+
+BACKEND_MODELS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_UPSTREAMS = os.path.join(os.path.dirname(BACKEND_MODELS), "benchmarks", "fake_upstreams.py")
+sys.path.insert(0, BACKEND_MODELS)
+
+from app import config  # noqa: E402
+from app.services.fish_surface import FishSurface, SurfaceStore, precompute_surface  # noqa: E402
+
+BOUNDS = (10.0, 70.0, 10.5, 70.5)  # 3x3 nodes at 0.25 degrees
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def fake_probability(lat, lon):
+    """What fake_upstreams' /space answers for a point."""
+    return round(50 + 40 * abs((lat * 7 + lon * 3) % 2 - 1), 2)
+
+
+@pytest.fixture(scope="module")
+def space_url():
+    port, mongo_port = free_port(), free_port()
+    proc = subprocess.Popen([sys.executable, FAKE_UPSTREAMS, "--port", str(port), "--mongo-port", str(mongo_port)],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 20
+        while True:
+            try:
+                if httpx.get(f"{url}/space/config", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline or proc.poll() is not None:
+                pytest.fail("fake_upstreams.py did not start")
+            time.sleep(0.2)
+        yield f"{url}/space/"
+    finally:
+        # gradio_client keeps an SSE stream open, so a graceful shutdown would wait on it
+        proc.kill()
+        proc.wait(10)
+
+
+def test_precompute_surface_against_fake_space(space_url, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "HEATMAP_SPACE_URL", space_url)
+    from app.routes.heatmap import fetch_probability
+
+    surface = asyncio.run(precompute_surface(fetch_probability, bounds=BOUNDS, step=0.25, concurrency=4))
+
+    assert surface.values.shape == (3, 3)
+    for r in range(3):
+        for c in range(3):
+            lat, lon = BOUNDS[0] + r * 0.25, BOUNDS[1] + c * 0.25
+            assert surface.values[r, c] == pytest.approx(fake_probability(lat, lon), abs=0.01)
+
+    # Round trip through the store: memory-mapped, interpolated at a node
+    path = str(tmp_path / "surface.npy")
+    surface.save(path)
+    store = SurfaceStore(path)
+    assert store.current.version == surface.version
+    assert store.interpolate(10.25, 70.25) == pytest.approx(fake_probability(10.25, 70.25), abs=0.01)
+
+
+def test_sidecar_is_the_commit_point(tmp_path):
+    path = str(tmp_path / "surface.npy")
+    for version, value in (("1", 10.0), ("2", 20.0), ("3", 30.0)):
+        FishSurface(np.full((2, 2), value, dtype=np.float32), 0.0, 0.0, 1.0, version=version).save(path)
+
+    with open(tmp_path / "surface.json") as f:
+        meta = json.load(f)
+    assert meta["array"] == "surface.3.npy"
+    assert FishSurface.load(path).interpolate(0.5, 0.5) == 30.0
+    # Only the newest two arrays are kept
+    assert sorted(p.name for p in tmp_path.glob("surface.*.npy")) == ["surface.2.npy", "surface.3.npy"]
+
+
+def test_only_one_worker_refreshes(tmp_path):
+    path = str(tmp_path / "surface.npy")
+    FishSurface(np.zeros((2, 2), dtype=np.float32), 0.0, 0.0, 1.0, version="1", created_at=1.0).save(path)
+    leader, follower = SurfaceStore(path), SurfaceStore(path)
+    assert leader.is_stale(3600) and not SurfaceStore(str(tmp_path / "missing.npy")).is_stale(3600)
+
+    calls = []
+
+    async def fetch(lat, lon):
+        calls.append((lat, lon))
+        await asyncio.sleep(0.05)
+        return 1.0
+
+    async def follow():
+        lock = leader._try_lock()  # the leader is mid-sweep
+        try:
+            return await follower.refresh(fetch, step=1.0, concurrency=1)
+        finally:
+            lock.close()
+
+    assert asyncio.run(follow()).version == "1"
+    assert calls == []  # the follower skipped the sweep and kept the current surface
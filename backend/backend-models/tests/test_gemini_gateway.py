@@ -0,0 +1,121 @@
+"""
+GeminiGateway against a stub client (models.generate_content), no network.
+
+    python -m pytest tests/test_gemini_gateway.py
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+from google.genai import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.executor import UpstreamBusy  # noqa: E402
+from app.services.gemini_gateway import Budget, GeminiGateway, parse_batch_reply  # noqa: E402
+
+
+class StubGemini:
+    """Answers each image with its own bytes as the species; a batch reply can leave images out."""
+
+    def __init__(self, delay=0.0, omit=()):
+        self.delay = delay
+        self.omit = set(omit)
+        self.calls = []
+        self.models = SimpleNamespace(generate_content=self.generate_content)
+
+    def generate_content(self, model, contents, config=None):
+        time.sleep(self.delay)
+        images = [part.inline_data.data.decode() for part in contents if isinstance(part, types.Part)]
+        self.calls.append(images)
+        if len(images) == 1:
+            text = images[0]
+        else:
+            text = "```json\n" + json.dumps([
+                {"image": i, "species": species}
+                for i, species in enumerate(images, start=1) if species not in self.omit
+            ]) + "\n```"
+        return SimpleNamespace(text=text, usage_metadata=SimpleNamespace(total_token_count=300 * len(images)))
+
+
+class StubService:
+    """Stands in for the registry's LazyService around the client."""
+
+    def __init__(self, client):
+        self.client = client
+
+    async def aget(self):
+        return self.client
+
+
+def gateway(stub, **kwargs):
+    return GeminiGateway(StubService(stub), "gemini-test", ["Identify this fish species."], **kwargs)
+
+
+# --- REPLY PARSING ---
+def test_parse_batch_reply():
+    fenced = '```json\n[{"image": 2, "species": "Rohu"}, {"image": 1, "species": " Catla "}]\n```'
+    assert parse_batch_reply(fenced, 2) == ["Catla", "Rohu"]
+    # Plain strings are taken in order
+    assert parse_batch_reply('["Rohu", "Catla"]', 2) == ["Rohu", "Catla"]
+    # Missing, out-of-range, unnumbered and empty entries leave gaps instead of guesses
+    reply = '[{"image": 3, "species": "Tuna"}, {"image": 9, "species": "Seer"}, {"image": "x", "species": "Prawn"},' \
+            ' {"image": 1, "species": ""}]'
+    assert parse_batch_reply(reply, 3) == [None, None, "Tuna"]
+    for text in ("", "Rohu (Rohu)", '{"image": 1, "species": "Rohu"}', "[not json]"):
+        assert parse_batch_reply(text, 2) == [None, None]
+
+
+# --- BUDGET ---
+def test_budget_rejects_after_max_wait():
+    async def go():
+        calls = Budget(max_qps=1, max_wait=0.1)
+        await calls.acquire(100)
+        with pytest.raises(UpstreamBusy):
+            await calls.acquire(100)  # next call is ~1s away
+
+        tokens = Budget(tokens_per_minute=600, max_wait=0.2)
+        await tokens.acquire(590)
+        await tokens.acquire(10)  # the last of the bucket; 100 more refill at 10/s
+        started = time.monotonic()
+        with pytest.raises(UpstreamBusy):
+            await tokens.acquire(100)
+        return calls.stats(), tokens.stats(), time.monotonic() - started
+
+    calls, tokens, waited = asyncio.run(go())
+    assert calls["rejected"] == 1 and tokens["rejected"] == 1
+    assert waited < 0.1  # rejected up front, not after sleeping out max_wait
+
+
+# --- GATEWAY ---
+def test_identical_photos_share_one_call():
+    stub = StubGemini(delay=0.1)
+
+    async def go():
+        gw = gateway(stub)
+        answers = await asyncio.gather(*(gw.identify(b"Rohu") for _ in range(3)), gw.identify(b"Catla"))
+        return answers, gw.stats()
+
+    answers, stats = asyncio.run(go())
+    assert answers == ["Rohu", "Rohu", "Rohu", "Catla"]
+    assert sorted(stub.calls) == [["Catla"], ["Rohu"]]
+    assert stats["coalesced"] == 2 and stats["calls"] == 2 and stats["running"] == 0
+
+
+def test_images_left_out_of_a_batch_reply_are_retried_alone():
+    stub = StubGemini(omit={"Catla"})
+
+    async def go():
+        gw = gateway(stub, max_batch=3, max_wait_ms=50)
+        answers = await asyncio.gather(gw.identify(b"Rohu"), gw.identify(b"Catla"), gw.identify(b"Pomfret"))
+        return answers, gw.stats()
+
+    answers, stats = asyncio.run(go())
+    assert answers == ["Rohu", "Catla", "Pomfret"]
+    assert stub.calls == [["Rohu", "Catla", "Pomfret"], ["Catla"]]
+    assert stats["batched_images"] == 3 and stats["retried"] == 1 and stats["calls"] == 2
+    assert stats["budget_tokens_used"] == 900 + 300
@@ -0,0 +1,186 @@
+"""
+Upload ingestion: bounded reads, format sniffing, downscaling and the
+request body cap.
+
+    python -m pytest tests/test_ingest.py
+"""
+import asyncio
+import os
+import sys
+from io import BytesIO
+
+import httpx
+import pytest
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.testclient import TestClient
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import config  # noqa: E402
+from app.services.ingest import (  # noqa: E402
+    READ_CHUNK, BodyLimitMiddleware, UnsupportedImage, UploadTooLarge, prepare_image, read_upload, sniff_format
+)
+
+
+def image_bytes(size=(64, 48), fmt="JPEG", orientation=None):
+    img = Image.new("RGB", size, (200, 30, 30))
+    img.paste((0, 0, 255), (0, 0, 16, 16))  # marks the top-left corner
+    out = BytesIO()
+    if orientation is not None:
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        img.save(out, format=fmt, exif=exif)
+    else:
+        img.save(out, format=fmt)
+    return out.getvalue()
+
+
+class CountingFile(BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.reads = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        return super().read(size)
+
+
+def upload(data, size=None):
+    f = CountingFile(data)
+    return UploadFile(f, size=len(data) if size is None else size, filename="catch.jpg"), f
+
+
+# --- FORMAT SNIFFING ---
+def test_sniff_format():
+    assert sniff_format(image_bytes()) == "jpeg"
+    assert sniff_format(image_bytes(fmt="PNG")) == "png"
+    assert sniff_format(image_bytes(fmt="WEBP")[:16]) == "webp"
+    assert sniff_format(image_bytes(fmt="GIF")) == "gif"
+    assert sniff_format(image_bytes(fmt="BMP")) == "bmp"
+    assert sniff_format(image_bytes(fmt="TIFF")) == "tiff"
+    assert sniff_format(b"\x00\x00\x00\x18ftypheic\x00\x00") == "heic"
+    for other in (b"", b"%PDF-1.7", b"<html>", b"PK\x03\x04"):
+        assert sniff_format(other) is None
+
+
+# --- BOUNDED READS ---
+def test_declared_size_over_the_cap_is_refused_unread():
+    photo, f = upload(image_bytes(), size=10 * 1024 * 1024)
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(read_upload(photo, max_bytes=1024 * 1024))
+    assert f.reads == 0
+
+
+def test_streamed_body_stops_at_the_cap():
+    data = image_bytes() + b"\x00" * (3 * READ_CHUNK)
+    photo, f = upload(data)
+    photo.size = None  # e.g. a chunked part with no declared size
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(read_upload(photo, max_bytes=READ_CHUNK + 1))
+    assert f.reads == 2
+
+
+def test_non_images_stop_after_the_first_chunk():
+    photo, f = upload(b"%PDF-1.7" + b"\x00" * (3 * READ_CHUNK))
+    with pytest.raises(UnsupportedImage):
+        asyncio.run(read_upload(photo, max_bytes=0))
+    assert f.reads == 1
+    with pytest.raises(UnsupportedImage):
+        asyncio.run(read_upload(upload(b"")[0]))
+
+
+# --- DOWNSCALING ---
+def test_small_jpeg_is_passed_through():
+    data = image_bytes()
+    photo = prepare_image(data, max_edge=128, quality=85)
+    assert photo.data is data and not photo.resized
+    assert (photo.width, photo.height, photo.source_format) == (64, 48, "jpeg")
+
+
+def test_large_or_non_jpeg_is_reencoded():
+    big = prepare_image(image_bytes(size=(1000, 500)), max_edge=128, quality=85)
+    assert big.resized and sniff_format(big.data) == "jpeg"
+    assert (big.width, big.height) == (128, 64)
+    assert Image.open(BytesIO(big.data)).size == (128, 64)
+
+    png = prepare_image(image_bytes(fmt="PNG"), max_edge=128, quality=85)
+    assert png.mime_type == "image/jpeg" and sniff_format(png.data) == "jpeg" and png.source_format == "png"
+
+    with pytest.raises(UnsupportedImage):
+        prepare_image(b"\xff\xd8\xff" + b"\x00" * 32, max_edge=128, quality=85)
+
+
+def test_exif_rotation_is_applied():
+    # Orientation 6: the camera was turned, viewers rotate 90 degrees clockwise
+    rotated = prepare_image(image_bytes(orientation=6), max_edge=128, quality=95)
+    assert rotated.resized
+    assert (rotated.width, rotated.height) == (48, 64)
+    img = Image.open(BytesIO(rotated.data))
+    assert img.getexif().get(0x0112, 1) == 1
+    # The blue top-left corner ends up top-right
+    r, g, b = img.getpixel((40, 8))
+    assert b > 150 and r < 100
+
+
+# --- REQUEST BODY CAP ---
+def photos(*sizes):
+    return [("images", (f"{i}.jpg", b"x" * size, "image/jpeg")) for i, size in enumerate(sizes)]
+
+
+@pytest.fixture
+def capped_app():
+    """Multipart routes like the real ones, under a 1000-byte cap (3000 for the batch)."""
+    app = FastAPI()
+    reached = []
+
+    @app.post("/detect")
+    @app.post("/detect/batch")
+    async def receive(images: list[UploadFile] = File(...)):
+        reached.append(len(images))
+        return {"photos": [len(await image.read()) for image in images]}
+
+    app.add_middleware(BodyLimitMiddleware, max_bytes=1000, path_limits={"/detect/batch": 3000})
+    return TestClient(app), reached
+
+
+def test_content_length_over_the_cap_never_reaches_the_route(capped_app):
+    client, reached = capped_app
+    response = client.post("/detect", files=photos(1200))
+    assert response.status_code == 413
+    assert response.json() == {"detail": "Request body too large"}
+    assert reached == []
+    assert client.post("/detect", files=photos(600)).json() == {"photos": [600]}
+
+
+def test_chunked_body_over_the_cap(capped_app):
+    client, reached = capped_app
+    request = httpx.Request("POST", "http://testserver/detect", files=photos(1200))
+    body = request.read()
+
+    def chunks():
+        # No Content-Length: the cap has to trip while the body streams in
+        for i in range(0, len(body), 400):
+            yield body[i:i + 400]
+
+    response = client.post("/detect", content=chunks(), headers={"content-type": request.headers["content-type"]})
+    assert response.status_code == 413
+    assert reached == []
+
+
+def test_batch_gets_its_own_request_cap(capped_app):
+    client, _ = capped_app
+    # Three photos the single-photo cap would refuse together
+    assert client.post("/detect/batch", files=photos(700, 700, 700)).json() == {"photos": [700, 700, 700]}
+    assert client.post("/detect/batch", files=photos(700, 700, 700, 700, 700)).status_code == 413
+    assert client.post("/detect", files=photos(700, 700)).status_code == 413
+
+
+def test_batch_photo_count(monkeypatch):
+    from app.routes.identify import detect_batch_route
+
+    monkeypatch.setattr(config, "UPLOAD_MAX_BATCH_FILES", 2)
+    haul = [upload(image_bytes())[0] for _ in range(3)]
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(detect_batch_route(haul))
+    assert e.value.status_code == 413
@@ -0,0 +1,61 @@
+"""
+Local cascade tiers against a stubbed backend-ml (httpx.MockTransport).
+
+    python -m pytest tests/test_local_identify.py
+"""
+import asyncio
+import os
+import sys
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import config  # noqa: E402
+from app.services import local_identify  # noqa: E402
+
+
+def answer_with(model, gallery, delay=0.0):
+    async def handler(request):
+        await asyncio.sleep(delay)
+        body = model if request.url.path == "/custom-model/predict" else gallery
+        return httpx.Response(200, json=body)
+    return handler
+
+
+def run(handler, monkeypatch, model_tier=True, timeout=1.0):
+    monkeypatch.setattr(config, "LOCAL_ID_URL", "http://backend-ml")
+    monkeypatch.setattr(config, "LOCAL_MODEL_TIER", model_tier)
+    monkeypatch.setattr(config, "LOCAL_ID_TIMEOUT", timeout)
+    monkeypatch.setattr(config, "LOCAL_MODEL_MIN_SIMILARITY", 0.7)
+
+    async def go():
+        local_identify._client = httpx.AsyncClient(base_url="http://backend-ml", transport=httpx.MockTransport(handler))
+        try:
+            return await local_identify.local_answer(b"jpeg")
+        finally:
+            await local_identify.close()
+    return asyncio.run(go())
+
+
+ROHU = {"status": "success", "predicted_fish": "Rohu", "confident": True}
+
+
+def test_classifier_needs_the_gallery_to_agree(monkeypatch):
+    gallery = {"status": "success", "species": "rohu", "similarity": 0.75, "confident": False}
+    assert run(answer_with(ROHU, gallery), monkeypatch) == {"species": "Rohu", "source": "local_model"}
+
+
+def test_marine_fish_is_out_of_the_classifiers_domain(monkeypatch):
+    # A confident freshwater label, but the photo is nowhere near a rohu in the gallery
+    far = {"status": "success", "species": "rohu", "similarity": 0.41, "confident": False}
+    assert run(answer_with(ROHU, far), monkeypatch) is None
+    other = {"status": "success", "species": "Pomfret", "similarity": 0.9, "confident": True}
+    assert run(answer_with(ROHU, other), monkeypatch) == {"species": "Pomfret", "source": "gallery"}
+
+
+def test_gallery_alone_and_one_shared_deadline(monkeypatch):
+    gallery = {"status": "success", "species": "Rohu", "similarity": 0.95, "confident": True}
+    assert run(answer_with(ROHU, gallery), monkeypatch, model_tier=False)["source"] == "gallery"
+    assert run(answer_with(ROHU, gallery, delay=0.5), monkeypatch, timeout=0.2) is None
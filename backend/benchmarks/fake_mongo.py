@@ -0,0 +1,187 @@
+"""
+Just enough of the MongoDB wire protocol for the app's driver (motor /
+pymongo) to connect, insert, update, find and aggregate against an
+in-memory store. It is a load-test stand-in, not a database: filters
+only match top-level equality, aggregations return nothing, and
+indexes are accepted and ignored.
+
+    server = FakeMongo(latency=Latency(2, 1))
+    await server.start("127.0.0.1", 27017)
+"""
+import asyncio
+import datetime
+import struct
+
+import bson
+from bson import Int64
+
+OP_REPLY = 1
+OP_QUERY = 2004
+OP_MSG = 2013
+
+HELLO = {
+    "ismaster": True,
+    "isWritablePrimary": True,
+    "helloOk": True,
+    "maxBsonObjectSize": 16 * 1024 * 1024,
+    "maxMessageSizeBytes": 48000000,
+    "maxWriteBatchSize": 100000,
+    "logicalSessionTimeoutMinutes": 30,
+    "minWireVersion": 0,
+    "maxWireVersion": 21,
+    "readOnly": False,
+}
+
+
+def _cstring(buf, pos):
+    end = buf.index(b"\x00", pos)
+    return buf[pos:end].decode(), end + 1
+
+
+def _matches(doc, query):
+    for key, value in (query or {}).items():
+        if key.startswith("$") or isinstance(value, dict):
+            continue
+        if doc.get(key) != value:
+            return False
+    return True
+
+
+class FakeMongo:
+    def __init__(self, latency=None):
+        self.latency = latency
+        self.collections = {}
+        self.commands = {}
+        self._server = None
+        self._connection_id = 0
+
+    async def start(self, host: str, port: int):
+        self._server = await asyncio.start_server(self._serve, host, port)
+        return self
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def stats(self):
+        return {
+            "commands": dict(self.commands),
+            "documents": {name: len(docs) for name, docs in self.collections.items()},
+        }
+
+    # --- COMMANDS ---
+    def _run(self, cmd, sequences):
+        name = next(iter(cmd))
+        self.commands[name] = self.commands.get(name, 0) + 1
+        lowered = name.lower()
+        db = cmd.get("$db", "admin")
+
+        if lowered in ("hello", "ismaster"):
+            self._connection_id += 1
+            return {**HELLO, "localTime": datetime.datetime.now(datetime.timezone.utc),
+                    "connectionId": self._connection_id, "ok": 1.0}
+        if lowered == "buildinfo":
+            return {"version": "7.0.0", "versionArray": [7, 0, 0, 0], "ok": 1.0}
+
+        if lowered == "insert":
+            docs = sequences.get("documents") or cmd.get("documents", [])
+            self.collections.setdefault(cmd[name], []).extend(docs)
+            return {"n": len(docs), "ok": 1.0}
+
+        if lowered == "update":
+            updates = sequences.get("updates") or cmd.get("updates", [])
+            upserted = []
+            for i, update in enumerate(updates):
+                if update.get("upsert") and not any(
+                    _matches(d, update["q"]) for d in self.collections.get(cmd[name], [])
+                ):
+                    doc = {**{k: v for k, v in update["q"].items() if not k.startswith("$")},
+                           **(update["u"].get("$set", {}) if isinstance(update["u"], dict) else {})}
+                    self.collections.setdefault(cmd[name], []).append(doc)
+                    upserted.append({"index": i, "_id": doc.get("_id")})
+            reply = {"n": len(upserted), "nModified": 0, "ok": 1.0}
+            if upserted:
+                reply["upserted"] = upserted
+            return reply
+
+        if lowered == "find":
+            docs = [d for d in self.collections.get(cmd[name], []) if _matches(d, cmd.get("filter"))]
+            if cmd.get("limit"):
+                docs = docs[:abs(cmd["limit"])]
+            return {"cursor": {"firstBatch": docs, "id": Int64(0), "ns": f"{db}.{cmd[name]}"}, "ok": 1.0}
+
+        if lowered == "aggregate":
+            return {"cursor": {"firstBatch": [], "id": Int64(0), "ns": f"{db}.{cmd[name]}"}, "ok": 1.0}
+
+        if lowered == "getmore":
+            return {"cursor": {"nextBatch": [], "id": Int64(0), "ns": f"{db}.{cmd.get('collection')}"}, "ok": 1.0}
+
+        # ping, endSessions, createIndexes, killCursors, ...
+        return {"ok": 1.0}
+
+    # --- WIRE PROTOCOL ---
+    def _parse_msg(self, body):
+        flags = struct.unpack_from("<I", body, 0)[0]
+        end = len(body) - (4 if flags & 1 else 0)  # optional CRC-32C trailer
+        pos = 4
+        cmd, sequences = None, {}
+        while pos < end:
+            kind = body[pos]
+            pos += 1
+            if kind == 0:
+                size = struct.unpack_from("<i", body, pos)[0]
+                cmd = bson.decode(body[pos:pos + size])
+                pos += size
+            else:
+                size = struct.unpack_from("<i", body, pos)[0]
+                section_end = pos + size
+                identifier, p = _cstring(body, pos + 4)
+                docs = []
+                while p < section_end:
+                    doc_size = struct.unpack_from("<i", body, p)[0]
+                    docs.append(bson.decode(body[p:p + doc_size]))
+                    p += doc_size
+                sequences[identifier] = docs
+                pos = section_end
+        return cmd, sequences
+
+    @staticmethod
+    def _frame(request_id, opcode, payload):
+        return struct.pack("<iiii", 16 + len(payload), request_id, request_id, opcode) + payload
+
+    async def _serve(self, reader, writer):
+        request_id = 0
+        try:
+            while True:
+                header = await reader.readexactly(16)
+                length, their_id, _, opcode = struct.unpack("<iiii", header)
+                body = await reader.readexactly(length - 16)
+                request_id += 1
+
+                if opcode == OP_MSG:
+                    cmd, sequences = self._parse_msg(body)
+                elif opcode == OP_QUERY:
+                    _, pos = _cstring(body, 4)
+                    size = struct.unpack_from("<i", body, pos + 8)[0]
+                    cmd, sequences = bson.decode(body[pos + 8:pos + 8 + size]), {}
+                else:
+                    break
+
+                if self.latency and next(iter(cmd)).lower() not in ("hello", "ismaster"):
+                    await self.latency.sleep()
+                reply = bson.encode(self._run(cmd, sequences))
+
+                if opcode == OP_MSG:
+                    payload = struct.pack("<I", 0) + b"\x00" + reply
+                else:
+                    payload = struct.pack("<iqii", 0, 0, 0, 1) + reply
+                out = self._frame(request_id, OP_MSG if opcode == OP_MSG else OP_REPLY, payload)
+                # responseTo must echo the request's id
+                out = out[:8] + struct.pack("<i", their_id) + out[12:]
+                writer.write(out)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,299 @@
+"""
+Local stand-ins for every service the backends call, so a load test
+never leaves the machine.
+
+    python benchmarks/fake_upstreams.py --port 9100 --mongo-port 9101 \
+        --latency gemini=800:200 --errors gemini=0.02
+
+One HTTP server, one path prefix per upstream:
+
+    /gemini      generativelanguage API (models/{model}:generateContent)
+    /roboflow    serverless workflows (both URL layouts)
+    /cloudinary  image upload
+    /nominatim   reverse geocoding
+    /space       the heatmap Hugging Face Space (Gradio sse_v3 queue)
+
+plus an in-memory MongoDB speaking the wire protocol (fake_mongo.py).
+The apps are pointed here with their *_URL / *_DOMAIN settings (see
+run_loadtest.py for the full list).
+
+--latency takes name=mean_ms[:jitter_ms], --errors takes name=rate
+(0..1, answered with a 503 in that upstream's own error format; the
+Space fails its queued job instead). Both accept "all" as the name.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_mongo import FakeMongo  # noqa: E402
+
+# Mongo is counted by FakeMongo itself (/_mongo)
+UPSTREAMS = ("gemini", "roboflow", "cloudinary", "nominatim", "space")
+SPECIES = ["Catla", "Rohu", "Pomfret", "Mackerel", "Sardine", "Tuna", "Seer Fish", "Prawn"]
+
+
+class Latency:
+    def __init__(self, mean_ms: float = 0.0, jitter_ms: float = 0.0):
+        self.mean_ms = mean_ms
+        self.jitter_ms = jitter_ms
+
+    async def sleep(self):
+        delay = max(0.0, random.gauss(self.mean_ms, self.jitter_ms)) if self.jitter_ms else self.mean_ms
+        if delay:
+            await asyncio.sleep(delay / 1000)
+
+
+def parse_pairs(values, cast):
+    """['gemini=800:200', 'all=5'] -> {'gemini': ..., 'all': ...}"""
+    out = {}
+    for item in values or []:
+        for part in item.split(","):
+            if part.strip():
+                name, _, value = part.partition("=")
+                out[name.strip()] = cast(value.strip())
+    return out
+
+
+def parse_latency(value):
+    mean, _, jitter = value.partition(":")
+    return Latency(float(mean), float(jitter or 0))
+
+
+def injected_error(name):
+    """A 503 in the body shape each upstream (and its client library) really sends."""
+    message = f"injected {name} failure"
+    if name == "gemini":
+        # Google API error envelope
+        return JSONResponse({"error": {"code": 503, "message": message, "status": "UNAVAILABLE"}}, status_code=503)
+    if name == "cloudinary":
+        return JSONResponse({"error": {"message": message}}, status_code=503)
+    if name == "roboflow":
+        return JSONResponse({"message": message}, status_code=503)
+    # Nominatim sits behind a plain web server: no JSON body on a 503
+    return PlainTextResponse(message, status_code=503)
+
+
+def create_app(latency: dict, errors: dict, seed: int = None):
+    rng = random.Random(seed)
+    app = FastAPI(title="Fake upstreams")
+    counts = {name: {"calls": 0, "errors": 0} for name in UPSTREAMS}
+
+    def pick(table, name, default):
+        return table.get(name, table.get("all", default))
+
+    async def behave(name):
+        """Latency for this upstream, then maybe an injected failure."""
+        counts[name]["calls"] += 1
+        await pick(latency, name, Latency()).sleep()
+        if rng.random() < pick(errors, name, 0.0):
+            counts[name]["errors"] += 1
+            return injected_error(name)
+        return None
+
+    # --- GEMINI ---
+    @app.post("/gemini/{version}/models/{model}:generateContent")
+    async def gemini(version: str, model: str, request: Request):
+        failed = await behave("gemini")
+        if failed:
+            return failed
+        body = await request.json()
+        images = sum(
+            1 for content in body.get("contents", []) for part in content.get("parts", []) if "inlineData" in part
+        )
+        if images > 1:
+            # Multi-image prompt: a JSON array, one entry per numbered image
+            names = [rng.choice(SPECIES) for _ in range(images)]
+            text = json.dumps([{"image": i, "species": f"{n} ({n})"} for i, n in enumerate(names, start=1)])
+        else:
+            name = rng.choice(SPECIES)
+            text = f"{name} ({name})"
+        prompt_tokens = 60 + 258 * max(1, images)
+        return {
+            "candidates": [{
+                "content": {"parts": [{"text": text}], "role": "model"},
+                "finishReason": "STOP",
+                "index": 0,
+            }],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "candidatesTokenCount": 6 * max(1, images),
+                "totalTokenCount": prompt_tokens + 6 * max(1, images),
+            },
+            "modelVersion": model,
+        }
+
+    # --- ROBOFLOW ---
+    async def roboflow():
+        failed = await behave("roboflow")
+        if failed:
+            return failed
+        return [{"predictions": {"predictions": [
+            {"class": rng.choice(SPECIES), "confidence": round(rng.uniform(0.5, 0.99), 3),
+             "x": 100, "y": 100, "width": 80, "height": 40}
+        ]}}]
+
+    app.post("/roboflow/infer/workflows/{workspace}/{workflow}")(roboflow)
+    app.post("/roboflow/{workspace}/workflows/{workflow}")(roboflow)
+
+    # --- CLOUDINARY ---
+    @app.post("/cloudinary/v1_1/{cloud}/image/upload")
+    async def cloudinary_upload(cloud: str):
+        failed = await behave("cloudinary")
+        if failed:
+            return failed
+        public_id = uuid.uuid4().hex
+        return {
+            "public_id": public_id,
+            "version": 1,
+            "format": "jpg",
+            "resource_type": "image",
+            "secure_url": f"https://res.cloudinary.invalid/{cloud}/image/upload/{public_id}.jpg",
+            "url": f"http://res.cloudinary.invalid/{cloud}/image/upload/{public_id}.jpg",
+        }
+
+    # --- NOMINATIM ---
+    @app.get("/nominatim/reverse")
+    async def nominatim_reverse(lat: float, lon: float):
+        failed = await behave("nominatim")
+        if failed:
+            return failed
+        state = "Maharashtra" if lat > 15.5 else "Kerala"
+        return {
+            "lat": str(lat), "lon": str(lon),
+            "display_name": f"Somewhere, {state}, India",
+            "address": {"state": state, "country": "India", "country_code": "in"},
+        }
+
+    # --- GRADIO SPACE (sse_v3) ---
+    sessions = {}
+
+    def session_queue(session_hash):
+        return sessions.setdefault(session_hash, asyncio.Queue())
+
+    @app.get("/space/config")
+    async def space_config():
+        return {
+            "version": "5.0.0",
+            "protocol": "sse_v3",
+            "api_prefix": "/gradio_api",
+            "connect_heartbeat": False,
+            "components": [
+                {"id": 1, "type": "number", "props": {"label": "latitude"}},
+                {"id": 2, "type": "number", "props": {"label": "longitude"}},
+                {"id": 3, "type": "textbox", "props": {"label": "output"}},
+            ],
+            "dependencies": [
+                {"id": 0, "api_name": "predict", "inputs": [1, 2], "outputs": [3],
+                 "backend_fn": True, "queue": True, "show_api": True},
+            ],
+        }
+
+    @app.get("/space/gradio_api/info")
+    async def space_info():
+        number = {"type": "number"}
+        return {
+            "named_endpoints": {
+                "/predict": {
+                    "parameters": [
+                        {"label": "latitude", "parameter_name": "latitude", "parameter_has_default": False,
+                         "type": number, "python_type": {"type": "float", "description": ""},
+                         "component": "Number"},
+                        {"label": "longitude", "parameter_name": "longitude", "parameter_has_default": False,
+                         "type": number, "python_type": {"type": "float", "description": ""},
+                         "component": "Number"},
+                    ],
+                    "returns": [{"label": "output", "type": {"type": "string"},
+                                 "python_type": {"type": "str", "description": ""}, "component": "Textbox"}],
+                }
+            },
+            "unnamed_endpoints": {},
+        }
+
+    @app.post("/space/gradio_api/queue/join")
+    async def space_join(request: Request):
+        body = await request.json()
+        event_id = uuid.uuid4().hex
+        queue = session_queue(body["session_hash"])
+
+        async def complete():
+            failed = await behave("space")
+            if failed:
+                await queue.put({"msg": "process_completed", "event_id": event_id, "success": False,
+                                 "output": {"error": "injected space failure"}})
+                return
+            lat, lon = (body.get("data") or [0, 0])[:2]
+            probability = round(50 + 40 * abs(((lat or 0) * 7 + (lon or 0) * 3) % 2 - 1), 2)
+            await queue.put({"msg": "process_completed", "event_id": event_id, "success": True,
+                             "output": {"data": [json.dumps({"fish_probability": probability})],
+                                        "is_generating": False}})
+
+        asyncio.create_task(complete())
+        return {"event_id": event_id}
+
+    @app.get("/space/gradio_api/queue/data")
+    async def space_data(session_hash: str):
+        queue = session_queue(session_hash)
+
+        async def events():
+            # sse_v3 keeps the stream open for the whole session
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), 15)
+                except asyncio.TimeoutError:
+                    message = {"msg": "heartbeat"}
+                yield f"data: {json.dumps(message)}\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/space/gradio_api/heartbeat/{session_hash}")
+    async def space_heartbeat(session_hash: str):
+        return JSONResponse({})
+
+    @app.get("/_stats")
+    async def fake_stats():
+        return counts
+
+    return app, counts
+
+
+async def serve(host, port, mongo_port, latency, errors, seed=None):
+    app, counts = create_app(latency, errors, seed)
+    mongo = FakeMongo(latency=latency.get("mongo", latency.get("all")))
+    await mongo.start(host, mongo_port)
+
+    @app.get("/_mongo")
+    async def mongo_stats():
+        return mongo.stats()
+
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+    print(f"✅ Fake upstreams on http://{host}:{port}, fake Mongo on mongodb://{host}:{mongo_port}")
+    try:
+        await server.serve()
+    finally:
+        await mongo.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--mongo-port", type=int, default=9101)
+    parser.add_argument("--latency", action="append", help="name=mean_ms[:jitter_ms], e.g. gemini=800:200")
+    parser.add_argument("--errors", action="append", help="name=rate, e.g. cloudinary=0.05")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, args.mongo_port,
+                      parse_pairs(args.latency, parse_latency), parse_pairs(args.errors, float), args.seed))
+
+
+if __name__ == "__main__":
+    main()
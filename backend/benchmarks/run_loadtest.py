@@ -0,0 +1,401 @@
+"""
+Offline end-to-end load test: starts the fake upstreams and the apps as
+real uvicorn processes, drives a mixed workload and prints one JSON
+report (latency percentiles and throughput per scenario).
+
+    python benchmarks/run_loadtest.py --rps 20 --duration 30 --out before.json
+    python benchmarks/run_loadtest.py --rps 20 --duration 30 --compare before.json
+    python benchmarks/run_loadtest.py --mix identify=1,price=0,heatmap=0 --latency gemini=1500:300 --errors cloudinary=0.1
+
+Run from backend/. Nothing leaves the machine: Gemini, Roboflow,
+Cloudinary, Nominatim, the heatmap Space and MongoDB are all served by
+fake_upstreams.py, with --latency / --errors passed straight through.
+
+Arrivals are open-loop (Poisson at --rps, seeded), so a slow server
+shows up as queueing delay instead of a politely slower client.
+Scenarios:
+
+    identify  POST /detect with a synthetic JPEG (--images distinct ones, so
+              repeats exercise the result cache)
+    haul      POST /detect/batch with --haul-size of those images at once
+              (off by default; shows Gemini multi-image batching)
+    price     POST /price for a species/state pair from the pricing CSV
+    heatmap   POST /heatmap/predict at a random point in the EEZ
+    ml        POST /custom-model/predict on backend-ml (off unless --ml or
+              --ml-url; backend-ml needs its model file to answer)
+
+--compare exits non-zero if any scenario's p95 grew by more than
+--max-regression (default 20%) against an earlier report.
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.dirname(HERE)
+MODELS_DIR = os.path.join(BACKEND, "backend-models")
+ML_DIR = os.path.join(BACKEND, "backend-ml")
+
+sys.path.insert(0, os.path.join(MODELS_DIR, "benchmarks"))
+from load_price_vs_detect import summarize  # noqa: E402
+
+# A point on the coast the state polygons resolve, per state in the price CSV
+COASTAL_POINTS = {
+    "Maharashtra": (19.07, 72.88),
+    "Gujarat": (21.64, 69.61),
+    "Goa": (15.49, 73.82),
+    "Karnataka": (12.87, 74.84),
+    "Kerala": (9.97, 76.28),
+    "Tamil Nadu": (13.08, 80.29),
+    "Andhra Pradesh": (17.69, 83.22),
+    "Odisha": (19.81, 85.83),
+    "West Bengal": (22.57, 88.36),
+}
+EEZ_BOUNDS = (3.5, 65.5, 24.5, 94.5)  # same box as app/services/fish_surface.py
+DEFAULT_MIX = "identify=3,price=5,heatmap=2,ml=0"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def git_commit():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND, text=True).strip()
+        dirty = subprocess.call(["git", "diff", "--quiet", "HEAD"], cwd=BACKEND) != 0
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+# --- PROCESSES ---
+def start_process(name, cmd, cwd, env, log_dir):
+    log = open(os.path.join(log_dir, f"{name}.log"), "w")
+    print(f"🔄 Starting {name}: {' '.join(cmd)} (log: {log.name})", file=sys.stderr)
+    return subprocess.Popen(cmd, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_ready(url, proc, timeout=90):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {proc.returncode} before becoming ready")
+        try:
+            if httpx.get(url, timeout=2).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+
+def app_env(fake_url, mongo_port, tmp, args):
+    env = dict(os.environ)
+    env.update({
+        "GEMINI_API_KEY": "loadtest",
+        "GEMINI_BASE_URL": f"{fake_url}/gemini",
+        "ROBOFLOW_API_KEY": "loadtest",
+        "ROBOFLOW_WORKSPACE": "loadtest",
+        "ROBOFLOW_WORKFLOW": "detect",
+        "ROBOFLOW_API_URL": f"{fake_url}/roboflow",
+        "CLOUDINARY_CLOUD_NAME": "loadtest",
+        "CLOUDINARY_API_KEY": "loadtest",
+        "CLOUDINARY_API_SECRET": "loadtest",
+        "CLOUDINARY_UPLOAD_PREFIX": f"{fake_url}/cloudinary",
+        "NOMINATIM_DOMAIN": f"{fake_url.split('://', 1)[1]}/nominatim",
+        "NOMINATIM_SCHEME": "http",
+        "GEOCODER_ONLINE_FALLBACK": "true",
+        "HEATMAP_SPACE_URL": f"{fake_url}/space/",
+        "MONGO_URI": f"mongodb://127.0.0.1:{mongo_port}/?directConnection=true",
+        "MONGO_DB_NAME": "loadtest",
+        # No precomputed surface: heatmap requests go to the (fake) Space
+        "FISH_SURFACE_PATH": os.path.join(tmp, "fish_surface.npy"),
+        "FISH_SURFACE_REFRESH_HOURS": "0",
+        "ANALYSIS_SPILL_PATH": os.path.join(tmp, "analysis_spill.jsonl"),
+        "ANALYSIS_WRITE_BEHIND": "true" if args.write_behind else "false",
+        "PRICE_WATCH_INTERVAL": "0",
+    })
+    env.pop("PREDICTION_CACHE_DIR", None)
+    env.pop("HEATMAP_TILE_CACHE_DIR", None)
+    env.pop("GEOCODE_CACHE_PATH", None)
+    return env
+
+
+# --- WORKLOAD ---
+def synthetic_jpegs(count, seed):
+    from PIL import Image
+
+    rng = random.Random(seed)
+    images = []
+    for i in range(count):
+        img = Image.new("RGB", (320, 240), tuple(rng.randrange(256) for _ in range(3)))
+        # A few random blocks so every image has different bytes
+        for _ in range(8):
+            x, y = rng.randrange(300), rng.randrange(220)
+            img.paste(tuple(rng.randrange(256) for _ in range(3)), (x, y, x + 20, y + 20))
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=85)
+        images.append(buf.getvalue())
+    return images
+
+
+def price_cases(limit=200):
+    cases = []
+    with open(os.path.join(MODELS_DIR, "app", "data", "pricing_dataset.csv"), newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            row = {k.strip(): v for k, v in row.items() if k}
+            price_type = row.get("PriceType") or row.get("Price Type(includes Retail,FH,FLC)")
+            state = (row.get("State/UT") or "").strip()
+            if state in COASTAL_POINTS and price_type:
+                cases.append((row["Species"].strip(), state, price_type.strip()))
+    random.Random(0).shuffle(cases)
+    return cases[:limit]
+
+
+class Workload:
+    def __init__(self, args, models_url, ml_url):
+        self.args = args
+        self.models_url = models_url
+        self.ml_url = ml_url
+        self.rng = random.Random(args.seed)
+        self.images = synthetic_jpegs(args.images, args.seed)
+        self.prices = price_cases()
+        self.results = {}
+
+    def record(self, scenario, latency, status, error=None):
+        entry = self.results.setdefault(scenario, {"latencies": [], "statuses": {}, "errors": 0})
+        entry["latencies"].append(latency)
+        entry["statuses"][str(status)] = entry["statuses"].get(str(status), 0) + 1
+        if error or not (200 <= status < 300):
+            entry["errors"] += 1
+
+    async def identify(self, client):
+        data = self.rng.choice(self.images)
+        return await client.post(f"{self.models_url}/detect", files={"image": ("catch.jpg", data, "image/jpeg")})
+
+    async def haul(self, client):
+        photos = self.rng.sample(self.images, min(self.args.haul_size, len(self.images)))
+        return await client.post(f"{self.models_url}/detect/batch", files=[
+            ("images", (f"catch-{i}.jpg", data, "image/jpeg")) for i, data in enumerate(photos)
+        ])
+
+    async def price(self, client):
+        species, state, price_type = self.rng.choice(self.prices)
+        lat, lon = COASTAL_POINTS[state]
+        return await client.post(f"{self.models_url}/price", params={
+            "user_id": f"loadtest-{self.rng.randrange(50)}", "species": species,
+            "qty_captured": self.rng.randint(1, 20), "weight_kg": round(self.rng.uniform(0.5, 25), 2),
+            "lat": lat, "lon": lon, "price_type": price_type,
+        })
+
+    async def heatmap(self, client):
+        min_lat, min_lon, max_lat, max_lon = EEZ_BOUNDS
+        return await client.post(f"{self.models_url}/heatmap/predict", json={
+            "latitude": round(self.rng.uniform(min_lat, max_lat), 3),
+            "longitude": round(self.rng.uniform(min_lon, max_lon), 3),
+        })
+
+    async def ml(self, client):
+        data = self.rng.choice(self.images)
+        return await client.post(f"{self.ml_url}/custom-model/predict", files={"file": ("catch.jpg", data, "image/jpeg")})
+
+    async def one(self, client, scenario, due, measure):
+        try:
+            response = await getattr(self, scenario)(client)
+            status, error = response.status_code, None
+            # backend-ml reports failures in a 200 body
+            if scenario == "ml" and response.status_code == 200 and "error" in response.text[:200]:
+                error = "error body"
+        except httpx.HTTPError as e:
+            status, error = 0, type(e).__name__
+        if measure:
+            self.record(scenario, time.perf_counter() - due, status, error)
+
+    async def run(self):
+        mix = parse_mix(self.args.mix)
+        if "ml" in mix and not self.ml_url:
+            del mix["ml"]
+        names, weights = list(mix), list(mix.values())
+        limits = httpx.Limits(max_connections=self.args.max_connections, max_keepalive_connections=self.args.max_connections)
+        async with httpx.AsyncClient(timeout=self.args.timeout, limits=limits) as client:
+            tasks = []
+            started = time.perf_counter()
+            measure_from = started + self.args.warmup
+            end = measure_from + self.args.duration
+            due = started
+            while True:
+                # Open loop: latency is measured from when the request was due
+                due += self.rng.expovariate(self.args.rps)
+                if due >= end:
+                    break
+                await asyncio.sleep(max(0.0, due - time.perf_counter()))
+                scenario = self.rng.choices(names, weights)[0]
+                tasks.append(asyncio.create_task(self.one(client, scenario, due, due >= measure_from)))
+            await asyncio.gather(*tasks)
+            wall = time.perf_counter() - measure_from
+
+        report = {}
+        for scenario, entry in sorted(self.results.items()):
+            report[scenario] = {
+                **summarize(entry["latencies"]),
+                "throughput_rps": round(len(entry["latencies"]) / wall, 2),
+                "errors": entry["errors"],
+                "statuses": entry["statuses"],
+            }
+        every = [v for entry in self.results.values() for v in entry["latencies"]]
+        overall = {**summarize(every), "throughput_rps": round(len(every) / wall, 2),
+                   "errors": sum(entry["errors"] for entry in self.results.values())}
+        return {"wall_seconds": round(wall, 3), "overall": overall, "scenarios": report}
+
+
+def compare(report, base, max_regression):
+    """p95 per scenario against an earlier report; returns the regressions."""
+    regressions = []
+    rows = {"overall": (report["overall"], base.get("overall", {}))}
+    for name, stats in report["scenarios"].items():
+        rows[name] = (stats, base.get("scenarios", {}).get(name, {}))
+    for name, (new, old) in rows.items():
+        if not old.get("p95_ms") or new.get("p95_ms") is None:
+            continue
+        change = new["p95_ms"] / old["p95_ms"] - 1
+        entry = {"scenario": name, "base_p95_ms": old["p95_ms"], "p95_ms": new["p95_ms"], "change": round(change, 3)}
+        if change > max_regression:
+            regressions.append(entry)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rps", type=float, default=20, help="Mean arrival rate (requests/second)")
+    parser.add_argument("--duration", type=float, default=30, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=3, help="Seconds of load before measuring")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Scenario weights (default {DEFAULT_MIX})")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--images", type=int, default=50, help="Distinct synthetic images")
+    parser.add_argument("--haul-size", type=int, default=4, help="Photos per haul request")
+    parser.add_argument("--timeout", type=float, default=60, help="Client timeout per request (s)")
+    parser.add_argument("--max-connections", type=int, default=256)
+    parser.add_argument("--latency", action="append", default=None,
+                        help="Fake upstream latency, name=mean_ms[:jitter_ms] (default all=50:10, gemini=800:200)")
+    parser.add_argument("--errors", action="append", default=[], help="Fake upstream error rate, name=rate")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for backend-models")
+    parser.add_argument("--write-behind", action="store_true", help="Run with ANALYSIS_WRITE_BEHIND=true")
+    parser.add_argument("--ml", action="store_true", help="Also start backend-ml and include the ml scenario")
+    parser.add_argument("--ml-url", help="Use an already running backend-ml instead")
+    parser.add_argument("--models-url", help="Use an already running backend-models (fakes still start)")
+    parser.add_argument("--out", help="Write the report here as well as stdout")
+    parser.add_argument("--compare", help="Earlier report to check p95 against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed p95 growth for --compare")
+    args = parser.parse_args()
+    latency = args.latency or ["all=50:10", "gemini=800:200"]
+    base = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            base = json.load(f)
+
+    tmp = tempfile.mkdtemp(prefix="fishapp-loadtest-")
+    procs = []
+    try:
+        # 1️⃣ Fake upstreams
+        fake_port, mongo_port = free_port(), free_port()
+        fake_url = f"http://127.0.0.1:{fake_port}"
+        cmd = [sys.executable, os.path.join(HERE, "fake_upstreams.py"), "--port", str(fake_port),
+               "--mongo-port", str(mongo_port), "--seed", str(args.seed)]
+        for item in latency:
+            cmd += ["--latency", item]
+        for item in args.errors:
+            cmd += ["--errors", item]
+        fakes = start_process("fake_upstreams", cmd, HERE, dict(os.environ), tmp)
+        procs.append(fakes)
+        wait_ready(f"{fake_url}/_stats", fakes)
+
+        # 2️⃣ The apps
+        env = app_env(fake_url, mongo_port, tmp, args)
+        models_url = args.models_url
+        if not models_url:
+            port = free_port()
+            models_url = f"http://127.0.0.1:{port}"
+            models = start_process("backend-models", [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+                                                      "--workers", str(args.workers), "--log-level", "warning"],
+                                   MODELS_DIR, env, tmp)
+            procs.append(models)
+            wait_ready(f"{models_url}/", models)
+
+        ml_url = args.ml_url
+        if args.ml and not ml_url:
+            port = free_port()
+            ml_url = f"http://127.0.0.1:{port}"
+            ml = start_process("backend-ml", [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+                                              "--log-level", "warning"], ML_DIR, env, tmp)
+            procs.append(ml)
+            wait_ready(f"{ml_url}/", ml, timeout=180)
+
+        # 3️⃣ Load
+        print(f"🔄 Driving {args.rps} rps for {args.duration}s (+{args.warmup}s warmup), mix {args.mix}", file=sys.stderr)
+        result = asyncio.run(Workload(args, models_url, ml_url).run())
+
+        report = {
+            "commit": git_commit(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "config": {"rps": args.rps, "duration": args.duration, "warmup": args.warmup, "mix": args.mix,
+                       "seed": args.seed, "images": args.images, "haul_size": args.haul_size, "latency": latency, "errors": args.errors,
+                       "workers": args.workers, "write_behind": args.write_behind},
+            **result,
+            "upstream_calls": httpx.get(f"{fake_url}/_stats", timeout=5).json(),
+            "mongo": httpx.get(f"{fake_url}/_mongo", timeout=5).json(),
+        }
+        try:
+            report["app_upstreams"] = httpx.get(f"{models_url}/upstreams", timeout=5).json()
+        except (httpx.HTTPError, ValueError):
+            pass
+
+        exit_code = 0
+        if base is not None:
+            regressions = compare(report, base, args.max_regression)
+            report["compare"] = {"base_commit": base.get("commit"), "max_regression": args.max_regression,
+                                 "regressions": regressions}
+            if regressions:
+                print(f"❌ p95 regressed by more than {args.max_regression:.0%} in: "
+                      f"{', '.join(r['scenario'] for r in regressions)}", file=sys.stderr)
+                exit_code = 1
+
+        text = json.dumps(report, indent=2)
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+        print(text)
+        return exit_code
+    finally:
+        for proc in reversed(procs):
+            proc.terminate()
+        for proc in procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        print(f"✅ Logs in {tmp}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
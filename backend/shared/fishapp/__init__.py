@@ -0,0 +1,10 @@
+"""
+Modules used by both backends (backend-models and backend-ml).
+
+Each backend puts backend/shared on sys.path at import time
+(backend-models/app/__init__.py, backend-ml/code_a_thon/shared.py), so
+there is a single copy to change:
+
+    from fishapp.result_cache import ResultCache
+    from fishapp.metrics import stage
+"""
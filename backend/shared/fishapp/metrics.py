@@ -0,0 +1,156 @@
+"""
+Prometheus metrics and structured timing logs.
+
+    with stage("decode"):
+        ...
+
+records the block in the `fishapp_stage_seconds{stage="decode"}`
+histogram and, with TIMING_LOG=true, logs one JSON line per stage on the
+"fishapp.timing" logger. Counters cover cache hits/misses, fallbacks
+(default values served instead of a real answer) and upstream errors.
+
+Anything that already has a stats() method (result caches, queues,
+upstream pools) can be exposed as gauges with register_stats().
+
+Under several worker processes set PROMETHEUS_MULTIPROC_DIR so /metrics
+aggregates the histograms and counters across workers.
+"""
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+)
+from prometheus_client.core import GaugeMetricFamily
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STAGE_SECONDS = Histogram("fishapp_stage_seconds", "Time spent in each pipeline stage", ["stage"], buckets=LATENCY_BUCKETS)
+UPSTREAM_SECONDS = Histogram("fishapp_upstream_seconds", "Time spent in calls to external services", ["upstream"], buckets=LATENCY_BUCKETS)
+HTTP_SECONDS = Histogram("fishapp_http_request_seconds", "Request latency by route", ["method", "route", "status"], buckets=LATENCY_BUCKETS)
+BATCH_SIZE = Histogram("fishapp_batch_size", "Items per batch", ["batcher"], buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+CACHE_EVENTS = Counter("fishapp_cache_events", "Cache lookups by result (hit/miss)", ["cache", "result"])
+FALLBACKS = Counter("fishapp_fallbacks", "Default or degraded answers served instead of a real one", ["kind"])
+UPSTREAM_ERRORS = Counter("fishapp_upstream_errors", "Failed calls to external services", ["upstream", "kind"])
+ERRORS = Counter("fishapp_errors", "Requests that ended in an error", ["where"])
+
+TIMING_LOG = os.getenv("TIMING_LOG", "false").lower() in ("1", "true", "yes")
+timing_log = logging.getLogger("fishapp.timing")
+if not timing_log.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    timing_log.addHandler(_handler)
+    timing_log.setLevel(logging.INFO)
+    timing_log.propagate = False
+
+
+@contextmanager
+def stage(name: str, **fields):
+    """Times the block into fishapp_stage_seconds (and the timing log)."""
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(name).observe(elapsed)
+        if TIMING_LOG:
+            timing_log.info(json.dumps({"stage": name, "ms": round(elapsed * 1000, 2), "status": status, **fields}))
+
+
+def observe_upstream(name: str, seconds: float, error: str = None):
+    UPSTREAM_SECONDS.labels(name).observe(seconds)
+    if error:
+        UPSTREAM_ERRORS.labels(name, error).inc()
+    if TIMING_LOG:
+        timing_log.info(json.dumps({"upstream": name, "ms": round(seconds * 1000, 2), "status": error or "ok"}))
+
+
+def cache_event(cache: str, hit: bool):
+    CACHE_EVENTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def fallback(kind: str):
+    FALLBACKS.labels(kind).inc()
+
+
+# --- stats() PROVIDERS AS GAUGES ---
+class StatsCollector:
+    def __init__(self):
+        self._sources = {}
+
+    def add(self, name, fn, label=None):
+        """fn() returns {key: number}, or {label value: {key: number}} when label is set."""
+        self._sources[name] = (fn, label)
+
+    def collect(self):
+        for name, (fn, label) in list(self._sources.items()):
+            try:
+                stats = fn()
+            except Exception:
+                continue
+            rows = stats.items() if label else [(None, stats)]
+            families = {}
+            for label_value, values in rows:
+                for key, value in values.items():
+                    if isinstance(value, bool) or not isinstance(value, (int, float)):
+                        continue
+                    if key not in families:
+                        families[key] = GaugeMetricFamily(
+                            f"fishapp_{name}_{key}", f"{name} {key}", labels=[label] if label else []
+                        )
+                    families[key].add_metric([str(label_value)] if label else [], value)
+            yield from families.values()
+
+
+stats_collector = StatsCollector()
+REGISTRY.register(stats_collector)
+
+
+def register_stats(name: str, fn, label: str = None):
+    stats_collector.add(name.replace("-", "_"), fn, label)
+
+
+def render_metrics():
+    """(body, content type) for a /metrics response."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(stats_collector)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def _route_template(scope):
+    """'/heatmap/tiles/{z}/{x}/{y}' rather than the concrete path."""
+    route = scope.get("route")
+    if route is None:
+        return "unmatched"
+    template = getattr(route, "path", "unmatched")
+    # Routes included with a prefix only know their own part of the path
+    try:
+        suffix = getattr(route, "path_format", template).format(**scope.get("path_params", {}))
+    except (KeyError, IndexError, ValueError):
+        return template
+    path = scope.get("path", "")
+    return path[:len(path) - len(suffix)] + template if path.endswith(suffix) else template
+
+
+async def http_metrics_middleware(request, call_next):
+    """Per-route latency; the route template keeps label cardinality bounded."""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        HTTP_SECONDS.labels(request.method, _route_template(request.scope), str(status)).observe(
+            time.perf_counter() - start
+        )
@@ -0,0 +1,180 @@
+"""
+Content-addressed result cache.
+
+Results are keyed by sha256(image bytes) plus a model/version string, so
+the same photo submitted twice is answered from cache, and retraining or
+changing the prompt (a new version string) silently invalidates old
+entries.
+
+Two tiers:
+  * an in-process LRU with a max entry count and a TTL
+  * an optional on-disk SQLite file that survives restarts and can be
+    shared by several workers on the same machine
+
+Values must be JSON-serialisable (the route response dictionaries are).
+Callers get their own copy, so mutating a returned result never changes
+what the next hit sees.
+
+Async routes use aget()/aset(): the memory tier is answered inline and
+only the SQLite tier runs on a worker thread, off the event loop.
+"""
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def content_key(data: bytes, version: str) -> str:
+    return f"{version}:{hashlib.sha256(data).hexdigest()}"
+
+
+class ResultCache:
+    def __init__(self, name: str, max_entries: int = 1024, ttl_seconds: float = 3600, disk_dir: str = None):
+        self.name = name
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = float(ttl_seconds)
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._db_path = None
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._db_path = os.path.join(disk_dir, f"{name}.sqlite3")
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)"
+                )
+
+    # --- DISK TIER ---
+    def _connect(self):
+        return sqlite3.connect(self._db_path, timeout=5)
+
+    def _disk_get(self, key, now):
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, expires_at FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                return None
+            return json.loads(row[0]), row[1]
+
+    def _disk_set(self, key, value, expires_at):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+
+    # --- MEMORY TIER ---
+    def _remember(self, key, value, expires_at):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _memory_get(self, key, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] >= now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+        return None
+
+    def _disk_lookup(self, key, now):
+        try:
+            found = self._disk_get(key, now)
+        except sqlite3.Error as e:
+            print(f"⚠️ Result cache '{self.name}' disk read failed: {e}")
+            found = None
+        with self._lock:
+            if found is None:
+                self.misses += 1
+                return None
+            value, expires_at = found
+            self._remember(key, value, expires_at)
+            self.hits += 1
+            self.disk_hits += 1
+        return value
+
+    def _disk_store(self, key, value, expires_at):
+        try:
+            self._disk_set(key, value, expires_at)
+        except sqlite3.Error as e:
+            print(f"⚠️ Result cache '{self.name}' disk write failed: {e}")
+
+    def _miss(self):
+        with self._lock:
+            self.misses += 1
+        return None
+
+    # --- PUBLIC API ---
+    def get(self, key):
+        now = time.time()
+        value = self._memory_get(key, now)
+        if value is None:
+            if not self._db_path:
+                return self._miss()
+            value = self._disk_lookup(key, now)
+        return copy.deepcopy(value)
+
+    async def aget(self, key):
+        now = time.time()
+        value = self._memory_get(key, now)
+        if value is None:
+            if not self._db_path:
+                return self._miss()
+            value = await asyncio.to_thread(self._disk_lookup, key, now)
+        return copy.deepcopy(value)
+
+    def set(self, key, value):
+        value = copy.deepcopy(value)
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, value, expires_at)
+        if self._db_path:
+            self._disk_store(key, value, expires_at)
+
+    async def aset(self, key, value):
+        value = copy.deepcopy(value)
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, value, expires_at)
+        if self._db_path:
+            await asyncio.to_thread(self._disk_store, key, value, expires_at)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self._db_path:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM results")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "persistent": self._db_path is not None,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }